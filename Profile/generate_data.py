@@ -0,0 +1,246 @@
+"""
+Sinh dữ liệu giả lập quy mô lớn cho Forum Profile, ghi thẳng vào DATABASE_URL qua bulk loader
+Chạy: python generate_data.py --scale production --seed 42
+
+Cùng seed và tham số luôn ra cùng dữ liệu, nên chạy lại sau khi lỗi sẽ resume (xem common/bulk.py).
+Phân bố lệch như thật: user id nhỏ là người nổi tiếng (nhiều follower, đăng nhiều),
+một ít post "hot" nhận phần lớn likes/votes/comments, theo luật Zipf với số mũ --alpha.
+"""
+
+import argparse
+import random
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+# Import models từ file main; init_db() tạo bảng nếu chưa có
+from main import Base, CategoryEnum, init_db
+from common.bulk import BulkLoader
+from import_data import after_import
+
+SCALES = {
+    "small": dict(users=1000, forums=20, posts=10000, comments=30000, likes=100000, votes=50000, statuses=5000, follows=20),
+    "medium": dict(users=100000, forums=100, posts=500000, comments=2000000, likes=5000000, votes=2000000, statuses=200000, follows=30),
+    "production": dict(users=1000000, forums=500, posts=5000000, comments=20000000, likes=50000000, votes=20000000, statuses=2000000, follows=50),
+}
+
+WORDS = (
+    "game mobile bóng đá phim nhạc nghệ thuật kinh doanh khởi nghiệp đầu tư thể thao "
+    "trận đấu mùa giải cập nhật review hướng dẫn chia sẻ kinh nghiệm câu hỏi thảo luận "
+    "hay nhất mới ra mắt đánh giá cộng đồng sự kiện ảnh video tuần này hôm nay"
+).split()
+
+
+class ZipfSampler:
+    """Chọn chỉ số 0..n-1 với xác suất tỉ lệ 1/(i+1)^alpha, O(log n) mỗi lần"""
+
+    def __init__(self, n, alpha):
+        self.n = n
+        self.cum_weights = list(accumulate(1.0 / (i + 1) ** alpha for i in range(n)))
+
+    def sample(self, rng, k=1):
+        return rng.choices(range(self.n), cum_weights=self.cum_weights, k=k)
+
+
+class Generator:
+    def __init__(self, seed, end, days, alpha, users, forums, posts, comments, likes, votes, statuses, follows, reply_ratio=0.3):
+        self.seed = seed
+        self.reply_ratio = reply_ratio
+        self.alpha = alpha
+        self.counts = dict(users=users, forums=forums, posts=posts, comments=comments, likes=likes, votes=votes, statuses=statuses)
+        self.follows = follows
+        self.end = end
+        self.span = days * 86400
+        self.start = self.end - timedelta(seconds=self.span)
+        self.user_sampler = ZipfSampler(users, alpha)
+        self.post_sampler = ZipfSampler(posts, alpha)
+        self.post_times = array("d")
+        self.hot_posts = None
+
+    def rng(self, name):
+        # Mỗi bảng một RNG riêng: đổi số lượng bảng này không làm đổi dữ liệu bảng khác
+        return random.Random(f"{self.seed}:{name}")
+
+    def at(self, seconds):
+        return self.start + timedelta(seconds=seconds)
+
+    def text(self, rng, words):
+        return " ".join(rng.choices(WORDS, k=words)).capitalize()
+
+    def user_ids(self, rng, k=1):
+        return [i + 1 for i in self.user_sampler.sample(rng, k)]
+
+    def post_ids(self, rng, k=1):
+        return [self.hot_posts[i] for i in self.post_sampler.sample(rng, k)]
+
+    def records(self):
+        yield from self.users()
+        yield from self.forums()
+        yield from self.posts()
+        yield from self.comments()
+        yield from self.likes()
+        yield from self.votes()
+        yield from self.followers()
+        yield from self.status_updates()
+
+    def users(self):
+        rng = self.rng("users")
+        for user_id in range(1, self.counts["users"] + 1):
+            yield "users", {
+                "id": user_id,
+                "username": f"user_{user_id}",
+                "email": f"user{user_id}@example.com",
+                "avatar_url": f"https://i.pravatar.cc/150?img={user_id % 70 + 1}",
+                "bio": self.text(rng, 6),
+                "created_at": self.at(rng.random() * self.span / 2),
+            }
+
+    def forums(self):
+        rng = self.rng("forums")
+        categories = list(CategoryEnum)
+        for forum_id in range(1, self.counts["forums"] + 1):
+            yield "forums", {
+                "id": forum_id,
+                "name": f"{self.text(rng, 2)} {forum_id}",
+                "description": self.text(rng, 10),
+                "category": categories[forum_id % len(categories)],
+                "created_by": self.user_ids(rng)[0],
+                "created_at": self.at(rng.random() * self.span / 4),
+            }
+
+    def posts(self):
+        rng = self.rng("posts")
+        # Hạng "hot" của post không phụ thuộc id, post hot rải đều theo thời gian
+        self.hot_posts = list(range(1, self.counts["posts"] + 1))
+        rng.shuffle(self.hot_posts)
+        for post_id in range(1, self.counts["posts"] + 1):
+            offset = rng.random() * self.span
+            self.post_times.append(offset)
+            created_at = self.at(offset)
+            yield "posts", {
+                "id": post_id,
+                "title": self.text(rng, 8),
+                "content": self.text(rng, 40),
+                "image_url": f"https://picsum.photos/800/400?random={post_id}" if rng.random() < 0.3 else None,
+                "author_id": self.user_ids(rng)[0],
+                "forum_id": rng.randint(1, self.counts["forums"]),
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+
+    def after_post(self, rng, post_id):
+        """Thời điểm ngẫu nhiên sau khi post được đăng"""
+        offset = self.post_times[post_id - 1]
+        return self.at(offset + rng.random() * (self.span - offset))
+
+    def comments(self):
+        rng = self.rng("comments")
+        # Comment gốc gần nhất của mỗi post: trả lời gắn vào đó, thời điểm sau comment gốc
+        roots = array("q", [0]) * (self.counts["posts"] + 1)
+        root_times = array("d", [0.0]) * (self.counts["posts"] + 1)
+        for comment_id in range(1, self.counts["comments"] + 1):
+            post_id = self.post_ids(rng)[0]
+            parent_id = roots[post_id] if roots[post_id] and rng.random() < self.reply_ratio else None
+            if parent_id:
+                offset = root_times[post_id]
+                offset += rng.random() * (self.span - offset)
+            else:
+                offset = self.post_times[post_id - 1]
+                offset += rng.random() * (self.span - offset)
+                roots[post_id], root_times[post_id] = comment_id, offset
+            yield "comments", {
+                "id": comment_id,
+                "content": self.text(rng, 15),
+                "author_id": rng.randint(1, self.counts["users"]),
+                "post_id": post_id,
+                "parent_id": parent_id,
+                "created_at": self.at(offset),
+            }
+
+    def per_user(self, rng, total):
+        """Chia ~total tương tác cho users theo phân bố mũ, mỗi user không trùng post"""
+        weights = array("d", (rng.expovariate(1) for _ in range(self.counts["users"])))
+        scale = total / sum(weights) if total else 0
+        # Zipf khó trúng các post hiếm, không để một user cần gần hết số post
+        cap = max(self.counts["posts"] // 10, 1)
+        for user_id, weight in enumerate(weights, 1):
+            k = min(round(weight * scale), cap)
+            seen = set()
+            while len(seen) < k:
+                for post_id in self.post_ids(rng, k - len(seen)):
+                    if post_id not in seen:
+                        seen.add(post_id)
+                        yield user_id, post_id
+
+    def likes(self):
+        rng = self.rng("likes")
+        for user_id, post_id in self.per_user(rng, self.counts["likes"]):
+            yield "likes", {"user_id": user_id, "post_id": post_id, "created_at": self.after_post(rng, post_id)}
+
+    def votes(self):
+        rng = self.rng("votes")
+        for user_id, post_id in self.per_user(rng, self.counts["votes"]):
+            yield "votes", {
+                "user_id": user_id,
+                "post_id": post_id,
+                "vote_type": "upvote" if rng.random() < 0.8 else "downvote",
+                "created_at": self.after_post(rng, post_id),
+            }
+
+    def followers(self):
+        """Bậc ra phân bố mũ quanh --follows, đích chọn theo Zipf nên bậc vào theo luật lũy thừa"""
+        rng = self.rng("followers")
+        users = self.counts["users"]
+        for follower_id in range(1, users + 1):
+            k = min(int(rng.expovariate(1 / self.follows)) if self.follows else 0, max(users // 10, 1))
+            seen = set()
+            while len(seen) < k:
+                for following_id in self.user_ids(rng, k - len(seen)):
+                    if following_id != follower_id and following_id not in seen:
+                        seen.add(following_id)
+                        yield "followers", {
+                            "follower_id": follower_id,
+                            "following_id": following_id,
+                            "created_at": self.at(self.span / 2 + rng.random() * self.span / 2),
+                        }
+
+    def status_updates(self):
+        rng = self.rng("statuses")
+        for _ in range(self.counts["statuses"]):
+            yield "status_updates", {
+                "content": self.text(rng, 10),
+                "user_id": self.user_ids(rng)[0],
+                "created_at": self.at(rng.random() * self.span),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu giả lập vào DATABASE_URL")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", type=datetime.fromisoformat, help="mốc thời gian cuối (ISO), mặc định 0h hôm nay UTC")
+    parser.add_argument("--days", type=int, default=90, help="dữ liệu trải trong N ngày trước --end")
+    parser.add_argument("--alpha", type=float, default=1.1, help="số mũ Zipf, càng lớn càng lệch")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--reply-ratio", type=float, default=0.3, help="tỉ lệ comment là trả lời một comment gốc")
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int, help=f"ghi đè số {name} của --scale")
+    args = parser.parse_args()
+
+    sizes = {name: getattr(args, name) if getattr(args, name) is not None else value for name, value in SCALES[args.scale].items()}
+    end = args.end or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    generator = Generator(args.seed, end, args.days, args.alpha, **sizes, reply_ratio=args.reply_ratio)
+    params = [("seed", args.seed), ("end", end.date()), ("days", args.days), ("alpha", args.alpha), ("reply_ratio", args.reply_ratio), *sizes.items()]
+    job = "generate:" + ",".join(f"{name}={value}" for name, value in params)
+
+    loader = BulkLoader(init_db(), Base.metadata, job, args.chunk_size)
+    if loader.done:
+        print(f"↻ Tiếp tục job {job}: {loader.done}")
+    print(f"🚀 Sinh dữ liệu: {sizes}")
+    loader.load(generator.records())
+    after_import()
+    print("🎉 Sinh dữ liệu hoàn tất!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Script để import dữ liệu vào database (DATABASE_URL), mặc định từ data.py
+Chạy: python import_data.py [data.py | file.json | file.ndjson ...] [--chunk-size N] [--job tên] [--clear]
+Xem common/bulk.py cho định dạng file và cách resume
+"""
+
+import os
+
+# Import models từ file main; init_db() tạo bảng nếu chưa có
+from main import Base, SessionLocal, search_index, init_db, open_engines, recount_counters, rebuild_timelines
+from common.bulk import run_cli
+
+def after_import():
+    """Counters, timeline và index tìm kiếm không được ghi khi bulk insert, dựng lại một lần ở cuối"""
+    db = SessionLocal()
+    try:
+        recount_counters(db)
+        print("✅ Đã tính lại counters của posts và users")
+        rebuild_timelines(db)
+        print("✅ Đã dựng lại home feed")
+        search_index.rebuild(open_engines())
+        print("✅ Đã index lại tìm kiếm")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Chạy: python import_data.py           -> import data.py
+    #       python import_data.py likes.ndjson --chunk-size 50000
+    run_cli(init_db(), Base.metadata, os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.py"), after_import)
@@ -1,23 +1,96 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Response, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Enum, Table
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Index, select, insert, update, delete, literal, true, func, Table
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, Session, relationship, selectinload, aliased
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
-from datetime import datetime
+from typing import List, Optional, Literal
+from datetime import datetime, timedelta
 import os
+import sys
 import enum
 
+# Code dùng chung cho 2 app nằm ở thư mục gốc repo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.cache import build_cache
+from common.counters import PostCounters, add_delta
+from common.db import Engines, insert_ignore
+from common.etag import conditional, PostPageVersions
+from common.export import ndjson, records, ENCODERS, NDJSON_MEDIA_TYPE, PostsExportQuery
+from common.instrumentation import QueryTracker
+from common.lifecycle import StartupTimer, worker_lifespan
+from common.loaders import PostLoader, CommentLoader
+from common.migrations import Migrations
+from common.metrics import Metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE, cache_collector, startup_collector, writebehind_collector
+from common.pagination import keyset_page, set_next_cursor, parse_ids
+from common.search import SearchIndex, POST, COMMENT
+from common.toggles import Toggles, like_deltas, user_post_in, exists_row
+from common.trending import TrendingEngine
+from common.writebehind import ToggleBuffer, MISSING
+
+# Đo thời gian khởi động từ đây, xem common/lifecycle.py
+startup = StartupTimer("profile")
+
 # Configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./forum.db")
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Tuning cho engine (WAL, pragmas, pool) chọn bằng DB_PROFILE, xem common/db.py
+# Tạo bảng/migrate trong lifespan của mỗi worker; đặt 0 khi đã chạy `python main.py --migrate` trước
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+
+# Home feed: tác giả có nhiều follower hơn ngưỡng này không fan-out lúc ghi mà được gộp lúc đọc
+FEED_FANOUT_THRESHOLD = int(os.getenv("FEED_FANOUT_THRESHOLD", "10000"))
+# Số post gần nhất chép vào timeline khi follow một người mới
+FEED_BACKFILL_SIZE = int(os.getenv("FEED_BACKFILL_SIZE", "50"))
+
+# Trending: số post giữ sẵn cho mỗi forum/category, half-life của điểm, cửa sổ nạp lúc khởi động
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", "100"))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "12"))
+TRENDING_WINDOW_DAYS = int(os.getenv("TRENDING_WINDOW_DAYS", "7"))
+# Mỗi worker giữ trending riêng: dựng lại từ DB mỗi N giây để các worker xếp hạng giống nhau (0: chỉ lúc khởi động)
+TRENDING_REFRESH_SECONDS = float(os.getenv("TRENDING_REFRESH_SECONDS", "60"))
+
+# Đếm SQL theo request, cảnh báo route chạy cùng một câu SQL quá N lần (N+1), xem /debug/queries
+SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "1") == "1"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+# Cache profile: rỗng = LRU trong bộ nhớ từng worker, redis://... = Redis dùng chung
+CACHE_URL = os.getenv("CACHE_URL", "")
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "60"))
+
+# Comments: số trả lời đầu tiên trả kèm mỗi thread trong GET /api/posts/{post_id}/comments
+COMMENT_REPLY_PREVIEW = int(os.getenv("COMMENT_REPLY_PREVIEW", "3"))
+
+# ?limit= tối đa của mọi route trả danh sách
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+
+# GET /api/users: số user mỗi trang, số id tối đa cho ?ids=; số dòng mỗi lô khi xuất /api/export/...
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "50"))
+USER_LOOKUP_MAX_IDS = int(os.getenv("USER_LOOKUP_MAX_IDS", "200"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+# Write-behind cho like/vote (tắt mặc định): gộp toggle trong bộ nhớ, ghi theo lô mỗi N giây hoặc khi đủ M khoá
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "1000"))
+
+# Số thao tác tối đa trong một request /api/batch
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "200"))
 
 # Database Setup
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Engine sync chỉ dùng cho tạo bảng và các lệnh CLI; request đi qua engine async.
+# Cả hai dựng lười trong open_engines() (lifespan, CLI), import main không mở connection nào
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+engines = Engines(DATABASE_URL, SessionLocal, AsyncSessionLocal)
 Base = declarative_base()
 
+trending = TrendingEngine(TRENDING_TOP_K, TRENDING_HALF_LIFE_HOURS)
+search_index = SearchIndex(engines.dialect)
+profile_cache = build_cache(CACHE_URL, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
 # Enums
 class CategoryEnum(str, enum.Enum):
     GAME = "game"
@@ -32,7 +105,9 @@ followers_table = Table(
     Base.metadata,
     Column('follower_id', Integer, ForeignKey('users.id'), primary_key=True),
     Column('following_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('created_at', DateTime, default=datetime.utcnow)
+    Column('created_at', DateTime, default=datetime.utcnow),
+    Index('ix_followers_following_created', 'following_id', 'created_at'),
+    Index('ix_followers_follower_created', 'follower_id', 'created_at')
 )
 
 # Database Models
@@ -45,6 +120,9 @@ class User(Base):
     avatar_url = Column(String(255))
     bio = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+    # Tăng trong cùng transaction mỗi khi profile đổi (tên/bio, follower/following, số post), làm validator cho ETag
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     posts = relationship("Post", back_populates="author", cascade="all, delete-orphan")
@@ -52,6 +130,11 @@ class User(Base):
     likes = relationship("Like", back_populates="user", cascade="all, delete-orphan")
     votes = relationship("Vote", back_populates="user", cascade="all, delete-orphan")
     status_updates = relationship("StatusUpdate", back_populates="user", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Keyset pagination cho GET /api/users
+        Index("ix_users_created", "created_at", "id"),
+    )
     
     # Followers/Following relationships
     followers = relationship(
@@ -86,11 +169,26 @@ class Post(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Denormalized counters, kept in sync by the write endpoints
+    likes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comments_count = Column(Integer, nullable=False, default=0, server_default="0")
+    upvotes = Column(Integer, nullable=False, default=0, server_default="0")
+    downvotes = Column(Integer, nullable=False, default=0, server_default="0")
+    # Tăng trong cùng transaction mỗi khi counters đổi, làm validator cho ETag
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    
     author = relationship("User", back_populates="posts")
     forum = relationship("Forum", back_populates="posts")
     comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
     likes = relationship("Like", back_populates="post", cascade="all, delete-orphan")
     votes = relationship("Vote", back_populates="post", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Keyset pagination indexes: (filter, created_at, id)
+        Index("ix_posts_created", "created_at", "id"),
+        Index("ix_posts_forum_created", "forum_id", "created_at", "id"),
+        Index("ix_posts_author_created", "author_id", "created_at", "id"),
+    )
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -99,10 +197,20 @@ class Comment(Base):
     content = Column(Text, nullable=False)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
+    # Thread 2 cấp: NULL là comment gốc, trả lời luôn trỏ về comment gốc của thread
+    parent_id = Column(Integer, ForeignKey("comments.id"), nullable=True)
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     
     author = relationship("User", back_populates="comments")
     post = relationship("Post", back_populates="comments")
+    
+    __table_args__ = (
+        Index("ix_comments_post_created", "post_id", "created_at", "id"),
+        Index("ix_comments_post_thread", "post_id", "parent_id", "created_at", "id"),
+        Index("ix_comments_parent_created", "parent_id", "created_at", "id"),
+        Index("ix_comments_author_created", "author_id", "created_at", "id"),
+    )
 
 class Like(Base):
     __tablename__ = "likes"
@@ -114,6 +222,11 @@ class Like(Base):
     
     user = relationship("User", back_populates="likes")
     post = relationship("Post", back_populates="likes")
+    
+    __table_args__ = (
+        Index("ix_likes_post", "post_id"),
+        Index("ux_likes_user_post", "user_id", "post_id", unique=True),
+    )
 
 class Vote(Base):
     __tablename__ = "votes"
@@ -126,6 +239,11 @@ class Vote(Base):
     
     user = relationship("User", back_populates="votes")
     post = relationship("Post", back_populates="votes")
+    
+    __table_args__ = (
+        Index("ix_votes_post", "post_id"),
+        Index("ux_votes_user_post", "user_id", "post_id", unique=True),
+    )
 
 class StatusUpdate(Base):
     __tablename__ = "status_updates"
@@ -136,12 +254,238 @@ class StatusUpdate(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="status_updates")
+    
+    __table_args__ = (
+        Index("ix_status_updates_user_created", "user_id", "created_at", "id"),
+    )
+
+# Precomputed home feed: each row is one post in owner's timeline
+class TimelineEntry(Base):
+    __tablename__ = "timeline_entries"
+    
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, nullable=False)  # copied from posts.created_at
+    
+    __table_args__ = (
+        Index("ix_timeline_owner_created", "owner_id", "created_at", "post_id"),
+        Index("ix_timeline_owner_author", "owner_id", "author_id"),
+    )
+
+# Denormalized counters
+COUNTER_COLUMNS = {
+    "posts": ("likes_count", "comments_count", "upvotes", "downvotes"),
+    "users": ("followers_count",),
+}
+
+# Cộng/trừ counters của post trong transaction hiện tại, xem common/counters.py
+post_counters = PostCounters(Post)
+bump_post_counters = post_counters.bump
+bump_post_counters_many = post_counters.bump_many
+
+async def bump_followers_count(db: AsyncSession, user_id: int, delta: int) -> int:
+    """Cộng/trừ followers_count, trả về giá trị mới (đọc cùng câu UPDATE, không lệch khi follow đồng thời)"""
+    return await db.scalar(
+        update(User).where(User.id == user_id).values(followers_count=User.followers_count + delta)
+        .returning(User.followers_count).execution_options(synchronize_session=False)
+    )
+
+async def bump_user_versions(db: AsyncSession, *user_ids: int):
+    """Profile đổi (cùng chỗ gọi invalidate_profiles): đổi version để ETag cũ hết hiệu lực"""
+    await db.execute(update(User).where(User.id.in_(user_ids)).values(version=User.version + 1).execution_options(synchronize_session=False))
+
+def recount_counters(db: Session):
+    """Tính lại toàn bộ counters của posts và users từ các bảng con"""
+    def count_of(model, *criteria):
+        return select(func.count(model.id)).where(model.post_id == Post.id, *criteria).scalar_subquery()
+
+    db.query(Post).update({
+        Post.likes_count: count_of(Like),
+        Post.comments_count: count_of(Comment),
+        Post.upvotes: count_of(Vote, Vote.vote_type == 'upvote'),
+        Post.downvotes: count_of(Vote, Vote.vote_type == 'downvote'),
+        Post.updated_at: Post.updated_at,
+        Post.version: Post.version + 1,
+    }, synchronize_session=False)
+    db.query(User).update({
+        User.followers_count: select(func.count()).where(followers_table.c.following_id == User.id).scalar_subquery(),
+        User.version: User.version + 1,
+    }, synchronize_session=False)
+    replies = aliased(Comment)
+    db.query(Comment).update({
+        Comment.reply_count: select(func.count(replies.id)).where(replies.parent_id == Comment.id).scalar_subquery(),
+    }, synchronize_session=False)
+    db.commit()
+
+# Home feed
+async def fan_out_post(db: AsyncSession, post: Post, followers_count: int):
+    """Fan-out-on-write: chép post vào timeline của mọi follower (1 câu INSERT ... SELECT)"""
+    if followers_count > FEED_FANOUT_THRESHOLD:
+        return  # tác giả quá nhiều follower, feed sẽ gộp post của họ lúc đọc
+    await db.execute(insert(TimelineEntry).from_select(
+        ["owner_id", "post_id", "author_id", "created_at"],
+        select(followers_table.c.follower_id, literal(post.id), literal(post.author_id), literal(post.created_at))
+        .where(followers_table.c.following_id == post.author_id)
+    ))
+
+async def backfill_timeline(db: AsyncSession, owner_id: int, author: User):
+    """Follow mới: chép các post gần nhất của author vào timeline của owner"""
+    if author.followers_count > FEED_FANOUT_THRESHOLD:
+        return
+    recent = (
+        select(literal(owner_id), Post.id, Post.author_id, Post.created_at)
+        .where(Post.author_id == author.id)
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(FEED_BACKFILL_SIZE)
+    )
+    await db.execute(insert(TimelineEntry).from_select(["owner_id", "post_id", "author_id", "created_at"], recent))
+
+async def backfill_followers(db: AsyncSession, author_id: int):
+    """Tác giả vừa xuống lại ngưỡng fan-out: feed thôi gộp post của họ lúc đọc, nên chép FEED_BACKFILL_SIZE post
+    gần nhất vào timeline của mọi follower (post đã có trong timeline thì bỏ qua)"""
+    recent = (
+        select(Post.id, Post.created_at)
+        .where(Post.author_id == author_id)
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(FEED_BACKFILL_SIZE)
+        .subquery()
+    )
+    await db.execute(insert_ignore(engines.dialect, TimelineEntry.__table__).from_select(
+        ["owner_id", "post_id", "author_id", "created_at"],
+        select(followers_table.c.follower_id, recent.c.id, literal(author_id), recent.c.created_at)
+        .join(recent, true())
+        .where(followers_table.c.following_id == author_id)
+    ))
 
-# Create tables
-try:
-    Base.metadata.create_all(bind=engine)
-except Exception as e:
-    print(f"Database initialization error: {e}")
+def rebuild_timelines(db: Session):
+    """Dựng lại toàn bộ timeline sau bulk import, cần counters đã đúng.
+    Như backfill_timeline: mỗi người được follow chỉ chép FEED_BACKFILL_SIZE post gần nhất"""
+    recent = select(
+        Post.id, Post.author_id, Post.created_at,
+        func.row_number().over(partition_by=Post.author_id, order_by=(Post.created_at.desc(), Post.id.desc())).label("rank")
+    ).subquery()
+    db.execute(delete(TimelineEntry))
+    db.execute(insert(TimelineEntry).from_select(
+        ["owner_id", "post_id", "author_id", "created_at"],
+        select(followers_table.c.follower_id, recent.c.id, recent.c.author_id, recent.c.created_at)
+        .join(recent, recent.c.author_id == followers_table.c.following_id)
+        .join(User, User.id == recent.c.author_id)
+        .where(recent.c.rank <= FEED_BACKFILL_SIZE, User.followers_count <= FEED_FANOUT_THRESHOLD)
+    ))
+    db.commit()
+
+# Trending
+def trending_signals():
+    return select(
+        Post.id, Post.forum_id, Forum.category, Post.created_at, Post.likes_count, Post.comments_count, Post.upvotes - Post.downvotes
+    ).join(Forum)
+
+def apply_trending(row):
+    trending.update(row[0], row[1], row[2], row[3], likes=row[4], comments=row[5], votes=row[6])
+
+async def track_trending(db: AsyncSession, *post_ids: int):
+    """Cập nhật điểm trending của các post sau khi counters đã commit"""
+    if not post_ids:
+        return
+    for row in await db.execute(trending_signals().where(Post.id.in_(post_ids))):
+        apply_trending(row)
+
+def warm_trending():
+    """Dựng trending từ điểm của các post gần đây trong DB: lúc khởi động và mỗi TRENDING_REFRESH_SECONDS"""
+    cutoff = datetime.utcnow() - timedelta(days=TRENDING_WINDOW_DAYS)
+    with engines.engine.connect() as conn:
+        trending.rebuild(conn.execute(trending_signals().where(Post.created_at >= cutoff)))
+
+# Toggle like/vote: unique (user_id, post_id) nên không cần SELECT trước khi ghi, xem common/toggles.py
+toggles = Toggles(User, Post, Like, engines.dialect)
+insert_toggle = toggles.insert
+toggle_conflict = toggles.conflict
+
+# Like/vote writes: changes = {(user_id, post_id): (trước, sau)}, like là True/False, vote là vote_type/None
+def vote_deltas(before, after):
+    deltas = {}
+    if before != after:
+        if before:
+            deltas[before + 's'] = -1
+        if after:
+            deltas[after + 's'] = 1
+    return deltas
+
+# write_*_changes cộng chênh lệch counters vào deltas {post_id: {column: delta}} (hoặc dict mới) theo các dòng
+# thực sự bị xoá/chèn/sửa (RETURNING), không theo trạng thái "trước" đã đọc: khoá mà request/worker khác
+# đã ghi trước không bị đếm hai lần
+write_like_changes = toggles.write_likes
+
+async def write_vote_changes(db: AsyncSession, changes: dict, deltas: Optional[dict] = None) -> dict:
+    removed = [key for key, (_, after) in changes.items() if after is None]
+    added = [{"user_id": user_id, "post_id": post_id, "vote_type": after, "created_at": datetime.utcnow()} for (user_id, post_id), (before, after) in changes.items() if before is None]
+    changed = {}
+    for key, (before, after) in changes.items():
+        if before and after:
+            changed.setdefault(after, []).append(key)
+    deltas = {} if deltas is None else deltas
+    if removed:
+        for post_id, vote_type in await db.execute(delete(Vote).where(user_post_in(Vote, removed)).returning(Vote.post_id, Vote.vote_type).execution_options(synchronize_session=False)):
+            add_delta(deltas, post_id, vote_type + 's', -1)
+    if added:
+        votes = Vote.__table__
+        for post_id, vote_type in await db.execute(insert_ignore(engines.dialect, votes).returning(votes.c.post_id, votes.c.vote_type), added):
+            add_delta(deltas, post_id, vote_type + 's', 1)
+    for vote_type, keys in changed.items():
+        # Chỉ có 2 loại vote: dòng được đổi sang vote_type trước đó là loại còn lại
+        previous = "downvote" if vote_type == "upvote" else "upvote"
+        flipped = update(Vote).where(user_post_in(Vote, keys), Vote.vote_type == previous).values(vote_type=vote_type)
+        for post_id in await db.scalars(flipped.returning(Vote.post_id).execution_options(synchronize_session=False)):
+            add_delta(deltas, post_id, vote_type + 's', 1)
+            add_delta(deltas, post_id, previous + 's', -1)
+    return deltas
+
+async def flush_changes(write, changes: dict):
+    """Flush của write-behind buffer: ghi + counters (theo dòng thực sự ghi được) trong một transaction riêng"""
+    async with AsyncSessionLocal() as db:
+        deltas = await write(db, changes)
+        await bump_post_counters_many(db, deltas)
+        await db.commit()
+        await track_trending(db, *deltas)
+
+like_buffer = vote_buffer = None
+if WRITE_BEHIND:
+    like_buffer = ToggleBuffer(lambda changes: flush_changes(write_like_changes, changes), like_deltas, WRITE_BEHIND_INTERVAL, WRITE_BEHIND_MAX_PENDING)
+    vote_buffer = ToggleBuffer(lambda changes: flush_changes(write_vote_changes, changes), vote_deltas, WRITE_BEHIND_INTERVAL, WRITE_BEHIND_MAX_PENDING)
+
+def buffered_states(buffer, keys) -> dict:
+    """Trạng thái mới nhất của các khoá đang chờ trong buffer"""
+    states = {}
+    if buffer:
+        for key in keys:
+            state = buffer.state(key)
+            if state is not MISSING:
+                states[key] = state
+    return states
+
+def pending_counters(post_id: int) -> dict:
+    """Chênh lệch counters của post còn nằm trong write-behind buffer"""
+    counters = {}
+    for buffer in (like_buffer, vote_buffer):
+        if buffer:
+            for column, delta in buffer.counters(post_id).items():
+                counters[column] = counters.get(column, 0) + delta
+    return counters
+
+# Lifecycle
+migrations = Migrations(Base.metadata, COUNTER_COLUMNS, (Like, Vote), recount_counters, search_index)
+
+def open_engines():
+    """Dựng engine sync/async ở lần gọi đầu (lifespan của từng worker, CLI, script), các lần sau trả lại engine sync"""
+    return engines.open(query_tracker if SQL_INSTRUMENTATION else None, metrics)
+
+def init_db():
+    """Tạo bảng và nâng cấp DB cũ: `python main.py --migrate`, hoặc lúc khởi động nếu AUTO_MIGRATE=1, xem common/migrations.py"""
+    return migrations.run(open_engines())
+
+# Khởi động từng worker: engine, migrate, nạp trending (rồi dựng lại định kỳ); khi tắt: flush write-behind rồi đóng pool
+lifespan = worker_lifespan(startup, open_engines, init_db if AUTO_MIGRATE else None, warm_trending, TRENDING_REFRESH_SECONDS, (like_buffer, vote_buffer), engines)
 
 # Pydantic Schemas
 class UserCreate(BaseModel):
@@ -221,17 +565,24 @@ class CommentCreate(BaseModel):
     content: str
     post_id: int
     user_id: int
+    parent_id: Optional[int] = None  # trả lời comment nào, None là comment gốc
 
 class CommentResponse(BaseModel):
     id: int
     content: str
     author: UserResponse
     post_id: int
+    parent_id: Optional[int] = None
+    reply_count: int = 0
     created_at: datetime
     
     class Config:
         from_attributes = True
 
+class CommentThreadResponse(CommentResponse):
+    replies: List[CommentResponse] = []
+    replies_cursor: Optional[str] = None  # cursor cho GET /api/comments/{id}/replies khi còn trả lời chưa trả kèm
+
 class LikeCreate(BaseModel):
     post_id: int
     user_id: int
@@ -258,8 +609,34 @@ class FollowCreate(BaseModel):
     follower_id: int
     following_id: int
 
+class BatchOperation(BaseModel):
+    type: Literal["like", "vote", "comment"]
+    post_id: int
+    user_id: int
+    vote_type: Optional[str] = None  # vote: 'upvote' or 'downvote'
+    content: Optional[str] = None  # comment
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+
+class BatchResult(BaseModel):
+    index: int
+    type: str
+    status: int  # như HTTP status của endpoint lẻ tương ứng
+    message: str
+    liked: Optional[bool] = None
+    comment_id: Optional[int] = None
+
+class SearchResult(BaseModel):
+    type: str  # 'post' or 'comment'
+    id: int
+    post_id: int
+    title: Optional[str]
+    content: str
+    score: float
+
 # FastAPI App
-app = FastAPI(title="Forum API - Profile Extended", version="2.0.0")
+app = FastAPI(title="Forum API - Profile Extended", version="2.0.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -268,33 +645,108 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Query-Count"],
 )
 
+query_tracker = QueryTracker(N_PLUS_ONE_THRESHOLD)
+if SQL_INSTRUMENTATION:
+    query_tracker.middleware(app)
+
+# Prometheus /metrics: latency theo route, pool, cache
+metrics = Metrics("profile")
+metrics.middleware(app)
+metrics.add_collector(startup_collector(startup))
+metrics.add_collector(cache_collector("profiles", profile_cache))
+if WRITE_BEHIND:
+    metrics.add_collector(writebehind_collector("likes", like_buffer))
+    metrics.add_collector(writebehind_collector("votes", vote_buffer))
+
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# Profile cache
+def profile_key(user_id: int) -> str:
+    return f"profile:{user_id}"
+
+async def invalidate_profiles(*user_ids: int):
+    """Gọi sau commit khi tên/bio, số follower/following hoặc số post của user đổi"""
+    await profile_cache.delete(*(profile_key(user_id) for user_id in user_ids))
+
+# Export: cột xuất của /api/export/posts và export_data.py, xem common/export.py
+posts_export_query = PostsExportQuery(Post, User, Forum, COUNTER_COLUMNS["posts"])
+
+# Post page loader: authors của cả trang chung 1 query IN, xem common/loaders.py
+def build_post_response(p, author: UserResponse) -> PostResponse:
+    pending = pending_counters(p.id)
+    return PostResponse(
+        id=p.id,
+        title=p.title,
+        content=p.content,
+        image_url=p.image_url,
+        author=author,
+        forum_id=p.forum_id,
+        created_at=p.created_at,
+        likes_count=p.likes_count + pending.get("likes_count", 0),
+        comments_count=p.comments_count,
+        votes_count=p.upvotes - p.downvotes + pending.get("upvotes", 0) - pending.get("downvotes", 0)
+    )
+
+post_responses = PostLoader(User, UserResponse, build_post_response)
+
+# Conditional GET (ETag)
+post_page_versions = PostPageVersions(Post, User, pending_counters)
+
+async def forum_watermark(db: AsyncSession, query):
+    """Forums không sửa/xoá qua API, (số forum, id lớn nhất) đủ để biết danh sách có đổi"""
+    return tuple((await db.execute(query.with_only_columns(func.count(Forum.id), func.max(Forum.id)))).one())
+
+# Comment loader: xem common/loaders.py
+comment_loader = CommentLoader(Comment, User, UserResponse, CommentResponse, CommentThreadResponse)
+comment_responses = comment_loader.responses
+comment_threads = comment_loader.threads
+
+# Write-behind toggles (WRITE_BEHIND=1)
+# Khoá đang chờ ghi không tốn câu SQL nào; lần đầu gặp khoá kiểm tra user, post và trạng thái hiện tại bằng 1 câu
+async def buffer_vote(vote: VoteCreate, db: AsyncSession):
+    key = (vote.user_id, vote.post_id)
+    current = vote_buffer.state(key)
+    if current is MISSING:
+        user_found, post_found, current = (await db.execute(select(
+            exists_row(User, User.id == vote.user_id),
+            exists_row(Post, Post.id == vote.post_id),
+            select(Vote.vote_type).where(Vote.user_id == vote.user_id, Vote.post_id == vote.post_id).scalar_subquery(),
+        ))).one()
+        if not user_found or not post_found:
+            raise HTTPException(status_code=404, detail="User or Post not found")
+    if vote.vote_type not in ['upvote', 'downvote']:
+        raise HTTPException(status_code=400, detail="Invalid vote type")
+    if current == vote.vote_type:
+        vote_buffer.record(key, current, None)
+        return {"message": "Vote removed"}
+    vote_buffer.record(key, current, vote.vote_type)
+    if current:
+        return {"message": f"Vote changed to {vote.vote_type}"}
+    return {"message": f"{vote.vote_type} successful"}
 
 # ============ USER & PROFILE ENDPOINTS ============
 
 @app.get("/")
-def root():
+async def root():
     return {
         "message": "Forum API with Profile Features",
         "docs": "/docs"
     }
 
 @app.post("/api/users", response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Tạo user mới"""
-    existing = db.query(User).filter(User.email == user.email).first()
+    existing = await db.scalar(select(User).where(User.email == user.email))
     if existing:
         raise HTTPException(status_code=400, detail="Email already exists")
     
-    existing_username = db.query(User).filter(User.username == user.username).first()
+    existing_username = await db.scalar(select(User).where(User.username == user.username))
     if existing_username:
         raise HTTPException(status_code=400, detail="Username already taken")
     
@@ -304,39 +756,75 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
         bio=user.bio
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return new_user
 
 @app.get("/api/users", response_model=List[UserResponse])
-def get_users(db: Session = Depends(get_db)):
-    """Lấy danh sách users"""
-    users = db.query(User).all()
+async def get_users(response: Response, ids: Optional[str] = None, limit: int = Query(USERS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Lấy danh sách users (mới nhất trước, phân trang bằng cursor).
+    ?ids=1,2,3: lấy nhiều user một lần theo thứ tự id truyền vào, id không tồn tại bị bỏ qua"""
+    if ids is not None:
+        user_ids = parse_ids(ids, USER_LOOKUP_MAX_IDS)
+        users = {u.id: u for u in await db.scalars(select(User).where(User.id.in_(user_ids)))} if user_ids else {}
+        return [users[user_id] for user_id in user_ids if user_id in users]
+
+    users = (await db.scalars(keyset_page(select(User), User.created_at, User.id, cursor, limit))).all()
+    set_next_cursor(response, users, limit)
     return users
 
+@app.get("/api/export/users")
+async def export_users():
+    """Xuất toàn bộ users dạng NDJSON (mỗi dòng một user), đọc theo lô EXPORT_CHUNK_SIZE dòng"""
+    query = select(User).order_by(User.id)
+    return StreamingResponse(ndjson(AsyncSessionLocal, query, UserResponse, EXPORT_CHUNK_SIZE), media_type=NDJSON_MEDIA_TYPE)
+
+@app.get("/api/export/posts")
+async def export_posts(format: Literal["ndjson", "csv"] = "ndjson", forum_id: Optional[int] = None, author_id: Optional[int] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Xuất posts kèm tên tác giả, tên forum và counters dạng NDJSON hoặc CSV, lọc theo forum, tác giả và khoảng [since, until)
+    Đọc theo lô EXPORT_CHUNK_SIZE dòng, không dựng object ORM/Pydantic cho từng post"""
+    query = posts_export_query(forum_id, author_id, since, until)
+    return StreamingResponse(
+        records(AsyncSessionLocal, query, format, EXPORT_CHUNK_SIZE),
+        media_type=ENCODERS[format].media_type,
+        headers={"Content-Disposition": f'attachment; filename="posts.{format}"'}
+    )
+
 @app.get("/api/users/{user_id}", response_model=UserProfileResponse)
-def get_user_profile(user_id: int, db: Session = Depends(get_db)):
-    """Lấy profile đầy đủ của user"""
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_user_profile(response: Response, user_id: int, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """Lấy profile đầy đủ của user; If-None-Match khớp version thì trả 304 trước khi đếm following/posts"""
+    cached = await profile_cache.get(profile_key(user_id))
+    if cached is not None:
+        return conditional(response, if_none_match, "profile", user_id, cached.get("version")) or cached
+    
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    not_modified = conditional(response, if_none_match, "profile", user_id, user.version)
+    if not_modified:
+        return not_modified
+    
+    following_count = await db.scalar(select(func.count()).where(followers_table.c.follower_id == user_id))
+    posts_count = await db.scalar(select(func.count(Post.id)).where(Post.author_id == user_id))
     
-    return UserProfileResponse(
+    profile = UserProfileResponse(
         id=user.id,
         username=user.username,
         email=user.email,
         avatar_url=user.avatar_url,
         bio=user.bio,
         created_at=user.created_at,
-        followers_count=len(user.followers),
-        following_count=len(user.following),
-        posts_count=len(user.posts)
+        followers_count=user.followers_count,
+        following_count=following_count,
+        posts_count=posts_count
     )
+    # Cache kèm version: cache hit vẫn trả được ETag mà không cần query
+    await profile_cache.set(profile_key(user_id), {**profile.model_dump(mode="json"), "version": user.version})
+    return profile
 
 @app.put("/api/users/{user_id}", response_model=UserResponse)
-def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get_db)):
+async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession = Depends(get_db)):
     """Cập nhật thông tin user"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -349,62 +837,52 @@ def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get
     if user_update.avatar_url is not None:
         user.avatar_url = user_update.avatar_url
     
-    db.commit()
-    db.refresh(user)
+    await bump_user_versions(db, user.id)
+    await db.commit()
+    await invalidate_profiles(user.id)
     return user
 
 @app.get("/api/users/{user_id}/posts", response_model=List[PostResponse])
-def get_user_posts(user_id: int, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+async def get_user_posts(response: Response, user_id: int, skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
     """Lấy tất cả posts của user"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    posts = db.query(Post).filter(Post.author_id == user_id).order_by(Post.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return [PostResponse(
-        id=p.id,
-        title=p.title,
-        content=p.content,
-        image_url=p.image_url,
-        author=p.author,
-        forum_id=p.forum_id,
-        created_at=p.created_at,
-        likes_count=len(p.likes),
-        comments_count=len(p.comments),
-        votes_count=len([v for v in p.votes if v.vote_type == 'upvote']) - len([v for v in p.votes if v.vote_type == 'downvote'])
-    ) for p in posts]
+    query = select(Post).where(Post.author_id == user_id)
+    posts = (await db.scalars(keyset_page(query, Post.created_at, Post.id, cursor, limit, skip))).all()
+    set_next_cursor(response, posts, limit)
+    return await post_responses(db, posts)
 
 @app.get("/api/users/{user_id}/activity", response_model=List[PostResponse])
-def get_user_activity(user_id: int, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+async def get_user_activity(response: Response, user_id: int, skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
     """Lấy hoạt động gần đây của user (posts + comments)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Lấy posts mà user đã comment
-    commented_posts = db.query(Post).join(Comment).filter(Comment.author_id == user_id).order_by(Comment.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return [PostResponse(
-        id=p.id,
-        title=p.title,
-        content=p.content,
-        image_url=p.image_url,
-        author=p.author,
-        forum_id=p.forum_id,
-        created_at=p.created_at,
-        likes_count=len(p.likes),
-        comments_count=len(p.comments),
-        votes_count=len([v for v in p.votes if v.vote_type == 'upvote']) - len([v for v in p.votes if v.vote_type == 'downvote'])
-    ) for p in commented_posts]
+    # Lấy posts mà user đã comment, mỗi post một lần
+    # Cursor đi theo comment mới nhất của user trên post, không theo post
+    latest = select(
+        Comment.post_id, func.max(Comment.created_at).label("created_at"), func.max(Comment.id).label("id")
+    ).where(Comment.author_id == user_id).group_by(Comment.post_id).subquery()
+    query = select(Post, latest.c.created_at, latest.c.id).join(latest, latest.c.post_id == Post.id)
+    rows = (await db.execute(keyset_page(query, latest.c.created_at, latest.c.id, cursor, limit, skip))).all()
+    set_next_cursor(response, rows, limit, key=lambda row: (row[1], row[2]))
+    return await post_responses(db, [row[0] for row in rows])
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss của cache profile (tính theo worker)"""
+    return {"profiles": profile_cache.stats()}
 
 # ============ FOLLOW/UNFOLLOW ENDPOINTS ============
 
 @app.post("/api/follow")
-def follow_user(follow: FollowCreate, db: Session = Depends(get_db)):
+async def follow_user(follow: FollowCreate, db: AsyncSession = Depends(get_db)):
     """Follow một user"""
-    follower = db.query(User).filter(User.id == follow.follower_id).first()
-    following = db.query(User).filter(User.id == follow.following_id).first()
+    follower = await db.get(User, follow.follower_id)
+    following = await db.get(User, follow.following_id)
     
     if not follower or not following:
         raise HTTPException(status_code=404, detail="User not found")
@@ -412,122 +890,166 @@ def follow_user(follow: FollowCreate, db: Session = Depends(get_db)):
     if follow.follower_id == follow.following_id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     
-    # Check if already following
-    if following in follower.following:
+    # Khoá chính (follower_id, following_id): insert trùng thì không thêm dòng nào
+    stmt = insert_ignore(engines.dialect, followers_table).values(follower_id=follower.id, following_id=following.id)
+    result = await db.execute(stmt)
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Already following this user")
     
-    follower.following.append(following)
-    db.commit()
+    await bump_followers_count(db, following.id, 1)
+    await backfill_timeline(db, follower.id, following)
+    await bump_user_versions(db, follower.id, following.id)
+    await db.commit()
+    await invalidate_profiles(follower.id, following.id)
     
     return {"message": "Followed successfully"}
 
 @app.post("/api/unfollow")
-def unfollow_user(follow: FollowCreate, db: Session = Depends(get_db)):
+async def unfollow_user(follow: FollowCreate, db: AsyncSession = Depends(get_db)):
     """Unfollow một user"""
-    follower = db.query(User).filter(User.id == follow.follower_id).first()
-    following = db.query(User).filter(User.id == follow.following_id).first()
+    follower = await db.get(User, follow.follower_id)
+    following = await db.get(User, follow.following_id)
     
     if not follower or not following:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if following not in follower.following:
+    result = await db.execute(delete(followers_table).where(
+        followers_table.c.follower_id == follower.id,
+        followers_table.c.following_id == following.id
+    ))
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Not following this user")
     
-    follower.following.remove(following)
-    db.commit()
+    followers_count = await bump_followers_count(db, following.id, -1)
+    await db.execute(delete(TimelineEntry).where(
+        TimelineEntry.owner_id == follower.id,
+        TimelineEntry.author_id == following.id
+    ))
+    if followers_count == FEED_FANOUT_THRESHOLD:
+        await backfill_followers(db, following.id)
+    await bump_user_versions(db, follower.id, following.id)
+    await db.commit()
+    await invalidate_profiles(follower.id, following.id)
     
     return {"message": "Unfollowed successfully"}
 
 @app.get("/api/users/{user_id}/followers", response_model=List[UserResponse])
-def get_followers(user_id: int, db: Session = Depends(get_db)):
-    """Lấy danh sách followers"""
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_followers(response: Response, user_id: int, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Lấy danh sách followers, mới follow trước"""
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return user.followers
+    # Seek theo index (following_id, created_at)
+    query = select(User, followers_table.c.created_at).join(followers_table, followers_table.c.follower_id == User.id).where(followers_table.c.following_id == user_id)
+    rows = (await db.execute(keyset_page(query, followers_table.c.created_at, followers_table.c.follower_id, cursor, limit))).all()
+    set_next_cursor(response, rows, limit, key=lambda row: (row[1], row[0].id))
+    return [row[0] for row in rows]
 
 @app.get("/api/users/{user_id}/following", response_model=List[UserResponse])
-def get_following(user_id: int, db: Session = Depends(get_db)):
-    """Lấy danh sách following"""
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_following(response: Response, user_id: int, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Lấy danh sách following, mới follow trước"""
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return user.following
+    # Seek theo index (follower_id, created_at)
+    query = select(User, followers_table.c.created_at).join(followers_table, followers_table.c.following_id == User.id).where(followers_table.c.follower_id == user_id)
+    rows = (await db.execute(keyset_page(query, followers_table.c.created_at, followers_table.c.following_id, cursor, limit))).all()
+    set_next_cursor(response, rows, limit, key=lambda row: (row[1], row[0].id))
+    return [row[0] for row in rows]
+
+# ============ FEED ENDPOINTS ============
+
+@app.get("/api/users/{user_id}/feed", response_model=List[PostResponse])
+async def get_feed(response: Response, user_id: int, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Home feed: posts của những người user đang follow"""
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Timeline đã fan-out sẵn: 1 range read trên index (owner_id, created_at, post_id)
+    timeline = select(Post).join(TimelineEntry, TimelineEntry.post_id == Post.id).where(TimelineEntry.owner_id == user_id)
+    posts = (await db.scalars(keyset_page(timeline, TimelineEntry.created_at, TimelineEntry.post_id, cursor, limit))).all()
+    
+    # Tác giả vượt ngưỡng fan-out: đọc thẳng posts của họ rồi gộp
+    celebrity_ids = (await db.scalars(select(User.id).join(
+        followers_table, followers_table.c.following_id == User.id
+    ).where(followers_table.c.follower_id == user_id, User.followers_count > FEED_FANOUT_THRESHOLD))).all()
+    if celebrity_ids:
+        query = select(Post).where(Post.author_id.in_(celebrity_ids))
+        celebrity_posts = (await db.scalars(keyset_page(query, Post.created_at, Post.id, cursor, limit))).all()
+        merged = {p.id: p for p in [*posts, *celebrity_posts]}
+        posts = sorted(merged.values(), key=lambda p: (p.created_at, p.id), reverse=True)[:limit]
+    
+    set_next_cursor(response, posts, limit)
+    return await post_responses(db, posts)
 
 # ============ STATUS UPDATE ENDPOINTS ============
 
 @app.post("/api/status", response_model=StatusUpdateResponse)
-def create_status_update(status: StatusUpdateCreate, db: Session = Depends(get_db)):
+async def create_status_update(status: StatusUpdateCreate, db: AsyncSession = Depends(get_db)):
     """Tạo status update mới"""
-    user = db.query(User).filter(User.id == status.user_id).first()
+    user = await db.get(User, status.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     new_status = StatusUpdate(
         content=status.content,
-        user_id=status.user_id
+        user=user
     )
     db.add(new_status)
-    db.commit()
-    db.refresh(new_status)
+    await db.commit()
     return new_status
 
 @app.get("/api/users/{user_id}/status", response_model=List[StatusUpdateResponse])
-def get_user_status_updates(user_id: int, limit: int = 10, db: Session = Depends(get_db)):
+async def get_user_status_updates(response: Response, user_id: int, limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
     """Lấy status updates của user"""
-    statuses = db.query(StatusUpdate).filter(StatusUpdate.user_id == user_id).order_by(StatusUpdate.created_at.desc()).limit(limit).all()
+    query = select(StatusUpdate).options(selectinload(StatusUpdate.user)).where(StatusUpdate.user_id == user_id)
+    statuses = (await db.scalars(keyset_page(query, StatusUpdate.created_at, StatusUpdate.id, cursor, limit))).all()
+    set_next_cursor(response, statuses, limit)
     return statuses
 
 # ============ VOTE ENDPOINTS ============
 
 @app.post("/api/votes")
-def create_vote(vote: VoteCreate, db: Session = Depends(get_db)):
+async def create_vote(vote: VoteCreate, db: AsyncSession = Depends(get_db)):
     """Vote (upvote/downvote) một post"""
-    user = db.query(User).filter(User.id == vote.user_id).first()
-    post = db.query(Post).filter(Post.id == vote.post_id).first()
-    
-    if not user or not post:
-        raise HTTPException(status_code=404, detail="User or Post not found")
+    if vote_buffer:
+        return await buffer_vote(vote, db)
     
     if vote.vote_type not in ['upvote', 'downvote']:
         raise HTTPException(status_code=400, detail="Invalid vote type")
     
-    # Check if already voted
-    existing_vote = db.query(Vote).filter(Vote.user_id == vote.user_id, Vote.post_id == vote.post_id).first()
+    # Xoá vote hiện có (RETURNING loại cũ): cùng loại thì là bỏ vote, khác loại hoặc chưa có thì INSERT loại mới
+    removed = (await db.execute(
+        delete(Vote).where(Vote.user_id == vote.user_id, Vote.post_id == vote.post_id).returning(Vote.vote_type).execution_options(synchronize_session=False)
+    )).scalar()
+    if removed == vote.vote_type:
+        await bump_post_counters(db, vote.post_id, **{vote.vote_type + 's': -1})
+        await db.commit()
+        await track_trending(db, vote.post_id)
+        return {"message": "Vote removed"}
     
-    if existing_vote:
-        if existing_vote.vote_type == vote.vote_type:
-            # Remove vote if same type
-            db.delete(existing_vote)
-            db.commit()
-            return {"message": "Vote removed"}
-        else:
-            # Change vote type
-            existing_vote.vote_type = vote.vote_type
-            db.commit()
-            return {"message": f"Vote changed to {vote.vote_type}"}
-    
-    new_vote = Vote(
-        user_id=vote.user_id,
-        post_id=vote.post_id,
-        vote_type=vote.vote_type
-    )
-    db.add(new_vote)
-    db.commit()
+    if not (await db.execute(insert_toggle(Vote, vote.user_id, vote.post_id, vote_type=vote.vote_type))).rowcount:
+        await toggle_conflict(db, vote.user_id, vote.post_id)
+    await bump_post_counters(db, vote.post_id, **vote_deltas(removed, vote.vote_type))
+    await db.commit()
+    await track_trending(db, vote.post_id)
+    if removed:
+        return {"message": f"Vote changed to {vote.vote_type}"}
     return {"message": f"{vote.vote_type} successful"}
 
 @app.get("/api/posts/{post_id}/votes")
-def get_post_votes(post_id: int, db: Session = Depends(get_db)):
+async def get_post_votes(post_id: int, db: AsyncSession = Depends(get_db)):
     """Lấy số votes của post"""
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    upvotes = len([v for v in post.votes if v.vote_type == 'upvote'])
-    downvotes = len([v for v in post.votes if v.vote_type == 'downvote'])
-    
+    pending = pending_counters(post_id)
+    upvotes = post.upvotes + pending.get("upvotes", 0)
+    downvotes = post.downvotes + pending.get("downvotes", 0)
     return {
         "upvotes": upvotes,
         "downvotes": downvotes,
@@ -537,9 +1059,9 @@ def get_post_votes(post_id: int, db: Session = Depends(get_db)):
 # ============ EXISTING ENDPOINTS (from previous code) ============
 
 @app.post("/api/forums", response_model=ForumResponse)
-def create_forum(forum: ForumCreate, user_id: int = 1, db: Session = Depends(get_db)):
+async def create_forum(forum: ForumCreate, user_id: int = 1, db: AsyncSession = Depends(get_db)):
     """Tạo forum mới"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -550,26 +1072,28 @@ def create_forum(forum: ForumCreate, user_id: int = 1, db: Session = Depends(get
         created_by=user_id
     )
     db.add(new_forum)
-    db.commit()
-    db.refresh(new_forum)
+    await db.commit()
     return new_forum
 
 @app.get("/api/forums", response_model=List[ForumResponse])
-def get_forums(category: Optional[CategoryEnum] = None, db: Session = Depends(get_db)):
-    """Lấy danh sách forums"""
-    query = db.query(Forum)
+async def get_forums(response: Response, category: Optional[CategoryEnum] = None, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """Lấy danh sách forums; If-None-Match khớp thì trả 304"""
+    query = select(Forum)
     if category:
-        query = query.filter(Forum.category == category)
-    return query.all()
+        query = query.where(Forum.category == category)
+    not_modified = conditional(response, if_none_match, "forums", category, await forum_watermark(db, query))
+    if not_modified:
+        return not_modified
+    return (await db.scalars(query)).all()
 
 @app.post("/api/posts", response_model=PostResponse)
-def create_post(post: PostCreate, db: Session = Depends(get_db)):
+async def create_post(post: PostCreate, db: AsyncSession = Depends(get_db)):
     """Tạo post mới"""
-    user = db.query(User).filter(User.id == post.user_id).first()
+    user = await db.get(User, post.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    forum = db.query(Forum).filter(Forum.id == post.forum_id).first()
+    forum = await db.get(Forum, post.forum_id)
     if not forum:
         raise HTTPException(status_code=404, detail="Forum not found")
     
@@ -581,96 +1105,263 @@ def create_post(post: PostCreate, db: Session = Depends(get_db)):
         forum_id=post.forum_id
     )
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.flush()
+    await search_index.add(db, POST, new_post.id, new_post.id, new_post.title, new_post.content)
+    await fan_out_post(db, new_post, user.followers_count)
+    await bump_user_versions(db, user.id)
+    await db.commit()
+    await invalidate_profiles(user.id)
+    await track_trending(db, new_post.id)
     
-    return PostResponse(
-        id=new_post.id,
-        title=new_post.title,
-        content=new_post.content,
-        image_url=new_post.image_url,
-        author=new_post.author,
-        forum_id=new_post.forum_id,
-        created_at=new_post.created_at,
-        likes_count=len(new_post.likes),
-        comments_count=len(new_post.comments),
-        votes_count=0
-    )
+    return (await post_responses(db, [new_post]))[0]
 
 @app.get("/api/posts", response_model=List[PostResponse])
-def get_posts(forum_id: Optional[int] = None, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    """Lấy danh sách posts"""
-    query = db.query(Post)
+async def get_posts(response: Response, forum_id: Optional[int] = None, skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """Lấy danh sách posts; If-None-Match khớp thì trả 304"""
+    query = select(Post)
     if forum_id:
-        query = query.filter(Post.forum_id == forum_id)
-    posts = query.order_by(Post.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return [PostResponse(
-        id=p.id,
-        title=p.title,
-        content=p.content,
-        image_url=p.image_url,
-        author=p.author,
-        forum_id=p.forum_id,
-        created_at=p.created_at,
-        likes_count=len(p.likes),
-        comments_count=len(p.comments),
-        votes_count=len([v for v in p.votes if v.vote_type == 'upvote']) - len([v for v in p.votes if v.vote_type == 'downvote'])
-    ) for p in posts]
+        query = query.where(Post.forum_id == forum_id)
+    page = keyset_page(query, Post.created_at, Post.id, cursor, limit, skip)
+    not_modified = conditional(response, if_none_match, "posts", await post_page_versions(db, page))
+    if not_modified:
+        return not_modified
+    posts = (await db.scalars(page)).all()
+    set_next_cursor(response, posts, limit)
+    return await post_responses(db, posts)
 
 @app.post("/api/likes")
-def toggle_like(like: LikeCreate, db: Session = Depends(get_db)):
+async def toggle_like(like: LikeCreate, db: AsyncSession = Depends(get_db)):
     """Like/Unlike post"""
-    user = db.query(User).filter(User.id == like.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    if like_buffer:
+        return await toggles.buffer_like(like_buffer, db, like.user_id, like.post_id)
     
-    post = db.query(Post).filter(Post.id == like.post_id).first()
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    
-    existing_like = db.query(Like).filter(
-        Like.user_id == like.user_id, 
-        Like.post_id == like.post_id
-    ).first()
-    
-    if existing_like:
-        db.delete(existing_like)
-        db.commit()
+    # Đang like thì DELETE xoá được dòng; không thì INSERT. Tối đa 2 câu, không có khoảng hở giữa đọc và ghi
+    unliked = (await db.execute(
+        delete(Like).where(Like.user_id == like.user_id, Like.post_id == like.post_id).returning(Like.id).execution_options(synchronize_session=False)
+    )).first()
+    if unliked:
+        await bump_post_counters(db, like.post_id, likes_count=-1)
+        await db.commit()
+        await track_trending(db, like.post_id)
         return {"message": "Unlike successful", "liked": False}
     
-    new_like = Like(user_id=like.user_id, post_id=like.post_id)
-    db.add(new_like)
-    db.commit()
+    if not (await db.execute(insert_toggle(Like, like.user_id, like.post_id))).rowcount:
+        await toggle_conflict(db, like.user_id, like.post_id)
+    await bump_post_counters(db, like.post_id, likes_count=1)
+    await db.commit()
+    await track_trending(db, like.post_id)
     return {"message": "Like successful", "liked": True}
 
 @app.post("/api/comments", response_model=CommentResponse)
-def create_comment(comment: CommentCreate, db: Session = Depends(get_db)):
+async def create_comment(comment: CommentCreate, db: AsyncSession = Depends(get_db)):
     """Tạo comment"""
-    user = db.query(User).filter(User.id == comment.user_id).first()
+    user = await db.get(User, comment.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    post = db.query(Post).filter(Post.id == comment.post_id).first()
+    post = await db.get(Post, comment.post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
+    parent_id = None
+    if comment.parent_id is not None:
+        parent = await db.get(Comment, comment.parent_id)
+        if not parent or parent.post_id != comment.post_id:
+            raise HTTPException(status_code=404, detail="Parent comment not found")
+        # Trả lời một trả lời vẫn nằm trong thread của comment gốc
+        parent_id = parent.parent_id or parent.id
+
     new_comment = Comment(
         content=comment.content,
-        author_id=comment.user_id,
-        post_id=comment.post_id
+        author=user,
+        post_id=comment.post_id,
+        parent_id=parent_id
     )
     db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    await db.flush()
+    await search_index.add(db, COMMENT, new_comment.id, comment.post_id, None, new_comment.content)
+    if parent_id:
+        await db.execute(update(Comment).where(Comment.id == parent_id).values(reply_count=Comment.reply_count + 1).execution_options(synchronize_session=False))
+    await bump_post_counters(db, comment.post_id, comments_count=1)
+    await db.commit()
+    await track_trending(db, comment.post_id)
     return new_comment
 
-@app.get("/api/posts/{post_id}/comments", response_model=List[CommentResponse])
-def get_comments(post_id: int, db: Session = Depends(get_db)):
-    """Lấy comments của post"""
-    comments = db.query(Comment).filter(Comment.post_id == post_id).order_by(Comment.created_at.desc()).all()
-    return comments
+@app.get("/api/posts/{post_id}/comments", response_model=List[CommentThreadResponse])
+async def get_comments(response: Response, post_id: int, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, replies: int = Query(COMMENT_REPLY_PREVIEW, ge=0, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    """Lấy comments gốc của post (mới nhất trước), mỗi thread kèm `replies` trả lời đầu tiên"""
+    query = select(Comment).where(Comment.post_id == post_id, Comment.parent_id.is_(None))
+    comments = (await db.scalars(keyset_page(query, Comment.created_at, Comment.id, cursor, limit))).all()
+    set_next_cursor(response, comments, limit)
+    return await comment_threads(db, comments, replies)
+
+@app.get("/api/comments/{comment_id}/replies", response_model=List[CommentResponse])
+async def get_replies(response: Response, comment_id: int, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Trả lời trong thread của một comment (cũ nhất trước), đọc tiếp từ replies_cursor của get_comments"""
+    query = select(Comment).where(Comment.parent_id == comment_id)
+    replies = (await db.scalars(keyset_page(query, Comment.created_at, Comment.id, cursor, limit, ascending=True))).all()
+    set_next_cursor(response, replies, limit)
+    return await comment_responses(db, replies)
+
+@app.get("/api/trending/posts", response_model=List[PostResponse])
+async def get_trending_posts(limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), forum_id: Optional[int] = None, category: Optional[CategoryEnum] = None, db: AsyncSession = Depends(get_db)):
+    """Lấy các bài post trending (tương tác có suy giảm theo thời gian), theo forum hoặc category"""
+    post_ids = trending.top(limit, forum_id=forum_id, category=category)
+    if not post_ids:
+        return []
+    
+    posts = {p.id: p for p in await db.scalars(select(Post).where(Post.id.in_(post_ids)))}
+    return await post_responses(db, [posts[post_id] for post_id in post_ids if post_id in posts])
+
+# ============ BATCH ENDPOINTS ============
+
+@app.post("/api/batch", response_model=List[BatchResult])
+async def apply_batch(batch: BatchRequest, db: AsyncSession = Depends(get_db)):
+    """Like/vote/comment hàng loạt trong một transaction, kết quả theo đúng thứ tự thao tác.
+    Thao tác lỗi (user/post không tồn tại, vote_type sai) bị bỏ qua, không huỷ các thao tác còn lại"""
+    operations = batch.operations
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"Too many operations (max {BATCH_MAX_OPERATIONS})")
+    if not operations:
+        return []
+
+    # Kiểm tra users và posts, mỗi bảng một câu IN
+    user_ids = set((await db.scalars(select(User.id).where(User.id.in_({op.user_id for op in operations})))).all())
+    post_ids = set((await db.scalars(select(Post.id).where(Post.id.in_({op.post_id for op in operations})))).all())
+
+    results = [None] * len(operations)
+    valid = []
+    for index, op in enumerate(operations):
+        if op.user_id not in user_ids or op.post_id not in post_ids:
+            results[index] = BatchResult(index=index, type=op.type, status=404, message="User or Post not found")
+        elif op.type == "vote" and op.vote_type not in ['upvote', 'downvote']:
+            results[index] = BatchResult(index=index, type=op.type, status=400, message="Invalid vote type")
+        elif op.type == "comment" and not op.content:
+            results[index] = BatchResult(index=index, type=op.type, status=400, message="Comment content is required")
+        else:
+            valid.append((index, op))
+
+    # Trạng thái like/vote hiện tại của các cặp (user, post) được nhắc tới: khoá đang chờ trong
+    # write-behind buffer lấy từ buffer, còn lại đọc DB một câu mỗi loại
+    like_keys = {(op.user_id, op.post_id) for _, op in valid if op.type == "like"}
+    vote_keys = {(op.user_id, op.post_id) for _, op in valid if op.type == "vote"}
+    likes = buffered_states(like_buffer, like_keys)
+    votes = buffered_states(vote_buffer, vote_keys)
+    unknown_likes = like_keys - likes.keys()
+    unknown_votes = vote_keys - votes.keys()
+    if unknown_likes:
+        likes.update(dict.fromkeys(unknown_likes, False))
+        rows = await db.execute(select(Like.user_id, Like.post_id).where(user_post_in(Like, unknown_likes)))
+        likes.update({(user_id, post_id): True for user_id, post_id in rows})
+    if unknown_votes:
+        votes.update(dict.fromkeys(unknown_votes))
+        rows = await db.execute(select(Vote.user_id, Vote.post_id, Vote.vote_type).where(user_post_in(Vote, unknown_votes)))
+        votes.update({(user_id, post_id): vote_type for user_id, post_id, vote_type in rows})
+
+    # Áp dụng tuần tự trên trạng thái trong bộ nhớ: like 2 lần trong cùng batch là like rồi unlike
+    likes_before, votes_before = dict(likes), dict(votes)
+    new_comments = []
+    for index, op in valid:
+        key = (op.user_id, op.post_id)
+        if op.type == "like":
+            likes[key] = not likes[key]
+            message = "Like successful" if likes[key] else "Unlike successful"
+            results[index] = BatchResult(index=index, type=op.type, status=200, message=message, liked=likes[key])
+        elif op.type == "vote":
+            current = votes[key]
+            if current == op.vote_type:
+                votes[key] = None
+                message = "Vote removed"
+            else:
+                votes[key] = op.vote_type
+                message = f"Vote changed to {op.vote_type}" if current else f"{op.vote_type} successful"
+            results[index] = BatchResult(index=index, type=op.type, status=200, message=message)
+        else:
+            new_comments.append((index, op))
+
+    # Ghi: chỉ phần chênh lệch giữa trạng thái đầu và cuối, mỗi loại thay đổi một câu SQL
+    like_changes = {key: (likes_before[key], liked) for key, liked in likes.items() if liked != likes_before[key]}
+    vote_changes = {key: (votes_before[key], vote_type) for key, vote_type in votes.items() if vote_type != votes_before[key]}
+    deltas = {}
+    if like_buffer:
+        for key, (before, after) in like_changes.items():
+            like_buffer.record(key, before, after)
+    else:
+        await write_like_changes(db, like_changes, deltas)
+    if vote_buffer:
+        for key, (before, after) in vote_changes.items():
+            vote_buffer.record(key, before, after)
+    else:
+        await write_vote_changes(db, vote_changes, deltas)
+
+    if new_comments:
+        # Một câu INSERT nhiều VALUES. Thứ tự RETURNING của INSERT nhiều dòng không được đảm bảo (SQLite, Postgres),
+        # nên khớp id về từng thao tác theo (post_id, author_id, content); các dòng trùng cả 3 thì id nào cũng đúng.
+        # (sort_by_parameter_order trên SQLite lùi về INSERT từng dòng)
+        rows = [{"content": op.content, "author_id": op.user_id, "post_id": op.post_id, "created_at": datetime.utcnow()} for _, op in new_comments]
+        inserted = {}
+        for comment_id, post_id, author_id, content in await db.execute(
+            insert(Comment).values(rows).returning(Comment.id, Comment.post_id, Comment.author_id, Comment.content)
+        ):
+            inserted.setdefault((post_id, author_id, content), []).append(comment_id)
+        comment_ids = [inserted[(row["post_id"], row["author_id"], row["content"])].pop() for row in rows]
+        await search_index.add_many(db, [(COMMENT, comment_id, row["post_id"], None, row["content"]) for comment_id, row in zip(comment_ids, rows)])
+        for (index, op), comment_id in zip(new_comments, comment_ids):
+            add_delta(deltas, op.post_id, "comments_count", 1)
+            results[index] = BatchResult(index=index, type=op.type, status=200, message="Comment created", comment_id=comment_id)
+
+    deltas = {post_id: counters for post_id, counters in deltas.items() if any(counters.values())}
+    if deltas:
+        await bump_post_counters_many(db, deltas)
+    await db.commit()
+    if deltas:
+        await track_trending(db, *deltas)
+    return results
+
+# ============ SEARCH ENDPOINTS ============
+
+@app.get("/api/search", response_model=List[SearchResult])
+async def search(q: str, kind: Optional[Literal["post", "comment"]] = None, forum_id: Optional[int] = None, category: Optional[CategoryEnum] = None, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_db)):
+    """Tìm posts/comments theo tiêu đề và nội dung, không phân biệt dấu ("bong da" khớp "Bóng đá")"""
+    # forums.category lưu tên enum (GAME, SPORT...)
+    return await search_index.results(db, Post, Comment, SearchResult, q, kind, forum_id, category.name if category else None, limit, offset)
+
+# ============ DEBUG ENDPOINTS ============
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics dạng Prometheus text"""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/queries")
+async def get_query_report():
+    """Số SQL, thời gian DB theo route và các route bị N+1"""
+    return query_tracker.report()
+
+@app.delete("/debug/queries")
+async def reset_query_report():
+    query_tracker.reset()
+    return {"message": "Query stats reset"}
+
+startup.imported()
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "--migrate":
+        # Chạy: python main.py --migrate (một lần khi deploy, rồi chạy worker với AUTO_MIGRATE=0)
+        with startup.phase("migrate"):
+            init_db()
+        startup.report()
+        print("✅ Đã tạo bảng và nâng cấp database")
+    elif len(sys.argv) > 1 and sys.argv[1] == "--recount":
+        # Chạy: python main.py --recount
+        open_engines()
+        db = SessionLocal()
+        try:
+            recount_counters(db)
+            print("✅ Đã tính lại counters của posts và users")
+        finally:
+            db.close()
+    else:
+        # Một process cho dev; production nhiều worker: python serve.py
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
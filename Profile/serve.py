@@ -0,0 +1,18 @@
+"""
+Chạy production: N worker dùng chung một socket, migrate một lần trước khi mở worker
+Chạy: python serve.py [--workers N] [--port 8000] [--db-connections 40] [--uds path | --fd N]
+Xem common/serve.py
+"""
+
+import os
+import sys
+
+# Code dùng chung cho 2 app nằm ở thư mục gốc repo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.serve import run_cli
+
+if __name__ == "__main__":
+    # Chạy: DB_PROFILE=production python serve.py --workers 4 --db-connections 40
+    #       kill -HUP <pid>   -> migrate rồi thay lần lượt từng worker
+    # Cache profile nằm trong bộ nhớ từng worker nếu không có CACHE_URL (Redis dùng chung)
+    run_cli(os.path.dirname(os.path.abspath(__file__)), cache_env="CACHE_URL")
@@ -0,0 +1,13 @@
+"""
+Script xuất posts từ database (DATABASE_URL) ra NDJSON hoặc CSV, đọc theo lô nên bộ nhớ không tăng theo số post
+Chạy: python export_data.py [--format ndjson|csv] [--forum-id N] [--author-id N] [--since ISO] [--until ISO] [-o file]
+Cùng cột và bộ lọc với GET /api/export/posts, xem common/export.py
+"""
+
+from main import open_engines, posts_export_query
+from common.export import run_cli
+
+if __name__ == "__main__":
+    # Chạy: python export_data.py --format csv -o posts.csv
+    #       python export_data.py --forum-id 3 --since 2024-01-01 | gzip > posts.ndjson.gz
+    run_cli(open_engines(), posts_export_query)
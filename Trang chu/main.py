@@ -1,25 +1,81 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Response, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Enum
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Index, select, update, delete, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, Session, relationship, aliased
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
-from datetime import datetime
+from typing import List, Optional, Literal
+from datetime import datetime, timedelta
 import enum
 import os
+import sys
+
+# Code dùng chung cho 2 app nằm ở thư mục gốc repo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.counters import PostCounters
+from common.db import Engines
+from common.etag import conditional, PostPageVersions
+from common.export import ndjson, records, ENCODERS, NDJSON_MEDIA_TYPE, PostsExportQuery
+from common.instrumentation import QueryTracker
+from common.lifecycle import StartupTimer, worker_lifespan
+from common.loaders import PostLoader, CommentLoader
+from common.migrations import Migrations
+from common.metrics import Metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE, startup_collector, writebehind_collector
+from common.pagination import keyset_page, set_next_cursor, parse_ids
+from common.search import SearchIndex, POST, COMMENT
+from common.toggles import Toggles, like_deltas
+from common.trending import TrendingEngine
+from common.writebehind import ToggleBuffer
+
+# Đo thời gian khởi động từ đây, xem common/lifecycle.py
+startup = StartupTimer("trang_chu")
 
 # Configuration: use env var or fall back to local sqlite for dev
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./forum.db")
+# Tuning cho engine (WAL, pragmas, pool) chọn bằng DB_PROFILE, xem common/db.py
+# Tạo bảng/migrate trong lifespan của mỗi worker; đặt 0 khi đã chạy `python main.py --migrate` trước
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
 
-# For sqlite we must pass check_same_thread
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Trending: số post giữ sẵn cho mỗi forum/category, half-life của điểm, cửa sổ nạp lúc khởi động
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", "100"))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "12"))
+TRENDING_WINDOW_DAYS = int(os.getenv("TRENDING_WINDOW_DAYS", "7"))
+# Mỗi worker giữ trending riêng: dựng lại từ DB mỗi N giây để các worker xếp hạng giống nhau (0: chỉ lúc khởi động)
+TRENDING_REFRESH_SECONDS = float(os.getenv("TRENDING_REFRESH_SECONDS", "60"))
+
+# Đếm SQL theo request, cảnh báo route chạy cùng một câu SQL quá N lần (N+1), xem /debug/queries
+SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "1") == "1"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+# Comments: số trả lời đầu tiên trả kèm mỗi thread trong GET /api/posts/{post_id}/comments
+COMMENT_REPLY_PREVIEW = int(os.getenv("COMMENT_REPLY_PREVIEW", "3"))
+
+# ?limit= tối đa của mọi route trả danh sách
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+
+# GET /api/users: số user mỗi trang, số id tối đa cho ?ids=; số dòng mỗi lô khi xuất /api/export/...
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "50"))
+USER_LOOKUP_MAX_IDS = int(os.getenv("USER_LOOKUP_MAX_IDS", "200"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+# Write-behind cho like (tắt mặc định): gộp toggle trong bộ nhớ, ghi theo lô mỗi N giây hoặc khi đủ M khoá
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "1000"))
 
 # Database Setup
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Engine sync chỉ dùng cho tạo bảng và các lệnh CLI; request đi qua engine async.
+# Cả hai dựng lười trong open_engines() (lifespan, CLI), import main không mở connection nào
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+engines = Engines(DATABASE_URL, SessionLocal, AsyncSessionLocal)
 Base = declarative_base()
 
+trending = TrendingEngine(TRENDING_TOP_K, TRENDING_HALF_LIFE_HOURS)
+search_index = SearchIndex(engines.dialect)
+
 # Enums
 class CategoryEnum(str, enum.Enum):
     GAME = "game"
@@ -37,11 +93,18 @@ class User(Base):
     email = Column(String(100), unique=True, nullable=False, index=True)
     avatar_url = Column(String(255))
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Tăng trong cùng transaction mỗi khi thông tin user đổi, làm validator cho ETag
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     
     posts = relationship("Post", back_populates="author", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan")
     likes = relationship("Like", back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Keyset pagination cho GET /api/users
+        Index("ix_users_created", "created_at", "id"),
+    )
+
 class Forum(Base):
     __tablename__ = "forums"
     
@@ -66,10 +129,22 @@ class Post(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Denormalized counters, kept in sync by the write endpoints
+    likes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comments_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Tăng trong cùng transaction mỗi khi counters đổi, làm validator cho ETag
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    
     author = relationship("User", back_populates="posts")
     forum = relationship("Forum", back_populates="posts")
     comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
     likes = relationship("Like", back_populates="post", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Keyset pagination indexes: (filter, created_at, id)
+        Index("ix_posts_created", "created_at", "id"),
+        Index("ix_posts_forum_created", "forum_id", "created_at", "id"),
+    )
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -78,10 +153,19 @@ class Comment(Base):
     content = Column(Text, nullable=False)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
+    # Thread 2 cấp: NULL là comment gốc, trả lời luôn trỏ về comment gốc của thread
+    parent_id = Column(Integer, ForeignKey("comments.id"), nullable=True)
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     
     author = relationship("User", back_populates="comments")
     post = relationship("Post", back_populates="comments")
+    
+    __table_args__ = (
+        Index("ix_comments_post_created", "post_id", "created_at", "id"),
+        Index("ix_comments_post_thread", "post_id", "parent_id", "created_at", "id"),
+        Index("ix_comments_parent_created", "parent_id", "created_at", "id"),
+    )
 
 class Like(Base):
     __tablename__ = "likes"
@@ -93,12 +177,94 @@ class Like(Base):
     
     user = relationship("User", back_populates="likes")
     post = relationship("Post", back_populates="likes")
+    
+    __table_args__ = (
+        Index("ix_likes_post", "post_id"),
+        Index("ux_likes_user_post", "user_id", "post_id", unique=True),
+    )
+
+# Post counters
+COUNTER_COLUMNS = {"posts": ("likes_count", "comments_count")}
+
+# Cộng/trừ counters của post trong transaction hiện tại, xem common/counters.py
+post_counters = PostCounters(Post)
+bump_post_counters = post_counters.bump
+bump_post_counters_many = post_counters.bump_many
+
+def recount_post_counters(db: Session):
+    """Tính lại toàn bộ counters của posts từ các bảng con"""
+    def count_of(model, *criteria):
+        return select(func.count(model.id)).where(model.post_id == Post.id, *criteria).scalar_subquery()
+
+    db.query(Post).update({
+        Post.likes_count: count_of(Like),
+        Post.comments_count: count_of(Comment),
+        Post.updated_at: Post.updated_at,
+        Post.version: Post.version + 1,
+    }, synchronize_session=False)
+    replies = aliased(Comment)
+    db.query(Comment).update({
+        Comment.reply_count: select(func.count(replies.id)).where(replies.parent_id == Comment.id).scalar_subquery(),
+    }, synchronize_session=False)
+    db.commit()
 
-# Create tables (don't crash server if DB not available at startup)
-try:
-    Base.metadata.create_all(bind=engine)
-except Exception as e:
-    print("Warning: could not create DB tables on startup:", e)
+# Trending
+def trending_signals():
+    return select(
+        Post.id, Post.forum_id, Forum.category, Post.created_at, Post.likes_count, Post.comments_count
+    ).join(Forum)
+
+def apply_trending(row):
+    trending.update(row[0], row[1], row[2], row[3], likes=row[4], comments=row[5])
+
+async def track_trending(db: AsyncSession, *post_ids: int):
+    """Cập nhật điểm trending của các post sau khi counters đã commit"""
+    if not post_ids:
+        return
+    for row in await db.execute(trending_signals().where(Post.id.in_(post_ids))):
+        apply_trending(row)
+
+def warm_trending():
+    """Dựng trending từ điểm của các post gần đây trong DB: lúc khởi động và mỗi TRENDING_REFRESH_SECONDS"""
+    cutoff = datetime.utcnow() - timedelta(days=TRENDING_WINDOW_DAYS)
+    with engines.engine.connect() as conn:
+        trending.rebuild(conn.execute(trending_signals().where(Post.created_at >= cutoff)))
+
+# Toggle like/vote: unique (user_id, post_id) nên không cần SELECT trước khi ghi, xem common/toggles.py
+toggles = Toggles(User, Post, Like, engines.dialect)
+insert_toggle = toggles.insert
+toggle_conflict = toggles.conflict
+
+# Like writes: changes = {(user_id, post_id): (trước, sau)}, True/False là đang like hay không
+async def flush_like_changes(changes: dict):
+    """Flush của write-behind buffer: ghi + counters (theo dòng thực sự ghi được) trong một transaction riêng"""
+    async with AsyncSessionLocal() as db:
+        deltas = await toggles.write_likes(db, changes)
+        await bump_post_counters_many(db, deltas)
+        await db.commit()
+        await track_trending(db, *deltas)
+
+like_buffer = None
+if WRITE_BEHIND:
+    like_buffer = ToggleBuffer(flush_like_changes, like_deltas, WRITE_BEHIND_INTERVAL, WRITE_BEHIND_MAX_PENDING)
+
+def pending_counters(post_id: int) -> dict:
+    """Chênh lệch counters của post còn nằm trong write-behind buffer"""
+    return like_buffer.counters(post_id) if like_buffer else {}
+
+# Lifecycle
+migrations = Migrations(Base.metadata, COUNTER_COLUMNS, (Like,), recount_post_counters, search_index)
+
+def open_engines():
+    """Dựng engine sync/async ở lần gọi đầu (lifespan của từng worker, CLI, script), các lần sau trả lại engine sync"""
+    return engines.open(query_tracker if SQL_INSTRUMENTATION else None, metrics)
+
+def init_db():
+    """Tạo bảng và nâng cấp DB cũ: `python main.py --migrate`, hoặc lúc khởi động nếu AUTO_MIGRATE=1, xem common/migrations.py"""
+    return migrations.run(open_engines())
+
+# Khởi động từng worker: engine, migrate, nạp trending (rồi dựng lại định kỳ); khi tắt: flush write-behind rồi đóng pool
+lifespan = worker_lifespan(startup, open_engines, init_db if AUTO_MIGRATE else None, warm_trending, TRENDING_REFRESH_SECONDS, (like_buffer,), engines)
 
 # Pydantic Schemas
 class UserCreate(BaseModel):
@@ -113,7 +279,7 @@ class UserResponse(BaseModel):
     created_at: datetime
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class ForumCreate(BaseModel):
     name: str
@@ -128,7 +294,7 @@ class ForumResponse(BaseModel):
     created_at: datetime
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class PostCreate(BaseModel):
     title: Optional[str]
@@ -137,6 +303,11 @@ class PostCreate(BaseModel):
     image_url: Optional[str]
     user_id: int  # Giờ phải truyền user_id trực tiếp
 
+class PostUpdate(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None
+    image_url: Optional[str] = None
+
 class PostResponse(BaseModel):
     id: int
     title: Optional[str]
@@ -149,29 +320,44 @@ class PostResponse(BaseModel):
     comments_count: int
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class CommentCreate(BaseModel):
     content: str
     post_id: int
     user_id: int  # Phải truyền user_id
+    parent_id: Optional[int] = None  # trả lời comment nào, None là comment gốc
 
 class CommentResponse(BaseModel):
     id: int
     content: str
     author: UserResponse
     post_id: int
+    parent_id: Optional[int] = None
+    reply_count: int = 0
     created_at: datetime
     
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class CommentThreadResponse(CommentResponse):
+    replies: List[CommentResponse] = []
+    replies_cursor: Optional[str] = None  # cursor cho GET /api/comments/{id}/replies khi còn trả lời chưa trả kèm
 
 class LikeCreate(BaseModel):
     post_id: int
     user_id: int  # Phải truyền user_id
 
+class SearchResult(BaseModel):
+    type: str  # 'post' or 'comment'
+    id: int
+    post_id: int
+    title: Optional[str]
+    content: str
+    score: float
+
 # FastAPI App
-app = FastAPI(title="Forum API - No Auth Version", version="1.0.0")
+app = FastAPI(title="Forum API - No Auth Version", version="1.0.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -180,32 +366,71 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Query-Count"],
 )
 
+query_tracker = QueryTracker(N_PLUS_ONE_THRESHOLD)
+if SQL_INSTRUMENTATION:
+    query_tracker.middleware(app)
+
+# Prometheus /metrics: latency theo route, pool, cache
+metrics = Metrics("trang_chu")
+metrics.middleware(app)
+metrics.add_collector(startup_collector(startup))
+if WRITE_BEHIND:
+    metrics.add_collector(writebehind_collector("likes", like_buffer))
+
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# Export: cột xuất của /api/export/posts và export_data.py, xem common/export.py
+posts_export_query = PostsExportQuery(Post, User, Forum, COUNTER_COLUMNS["posts"])
+
+# Post page loader: authors của cả trang chung 1 query IN, xem common/loaders.py
+def build_post_response(p, author: UserResponse) -> PostResponse:
+    return PostResponse(
+        id=p.id,
+        title=p.title,
+        content=p.content,
+        image_url=p.image_url,
+        author=author,
+        forum_id=p.forum_id,
+        created_at=p.created_at,
+        likes_count=p.likes_count + pending_counters(p.id).get("likes_count", 0),
+        comments_count=p.comments_count
+    )
+
+post_responses = PostLoader(User, UserResponse, build_post_response)
+
+# Conditional GET (ETag)
+post_page_versions = PostPageVersions(Post, User, pending_counters)
+
+async def forum_watermark(db: AsyncSession, query):
+    """Forums không sửa/xoá qua API, (số forum, id lớn nhất) đủ để biết danh sách có đổi"""
+    return tuple((await db.execute(query.with_only_columns(func.count(Forum.id), func.max(Forum.id)))).one())
+
+# Comment loader: xem common/loaders.py
+comment_loader = CommentLoader(Comment, User, UserResponse, CommentResponse, CommentThreadResponse)
+comment_responses = comment_loader.responses
+comment_threads = comment_loader.threads
 
 # Helper function to create default user if needed
-def get_or_create_default_user(db: Session):
-    user = db.query(User).filter(User.id == 1).first()
+async def get_or_create_default_user(db: AsyncSession):
+    user = await db.get(User, 1)
     if not user:
         user = User(
             username="default_user",
             email="default@example.com"
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
     return user
 
 # Endpoints
 @app.get("/")
-def root():
+async def root():
     return {
         "message": "Forum API - No Authentication Version", 
         "warning": "⚠️ This is for TESTING ONLY. Do not use in production!",
@@ -213,13 +438,13 @@ def root():
     }
 
 @app.post("/api/users", response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Tạo user mới - KHÔNG CẦN PASSWORD"""
-    existing = db.query(User).filter(User.email == user.email).first()
+    existing = await db.scalar(select(User).where(User.email == user.email))
     if existing:
         raise HTTPException(status_code=400, detail="Email already exists")
     
-    existing_username = db.query(User).filter(User.username == user.username).first()
+    existing_username = await db.scalar(select(User).where(User.username == user.username))
     if existing_username:
         raise HTTPException(status_code=400, detail="Username already taken")
     
@@ -228,28 +453,51 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
         email=user.email
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return new_user
 
 @app.get("/api/users", response_model=List[UserResponse])
-def get_users(db: Session = Depends(get_db)):
-    """Lấy danh sách tất cả users"""
-    users = db.query(User).all()
+async def get_users(response: Response, ids: Optional[str] = None, limit: int = Query(USERS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Lấy danh sách users (mới nhất trước, phân trang bằng cursor).
+    ?ids=1,2,3: lấy nhiều user một lần theo thứ tự id truyền vào, id không tồn tại bị bỏ qua"""
+    if ids is not None:
+        user_ids = parse_ids(ids, USER_LOOKUP_MAX_IDS)
+        users = {u.id: u for u in await db.scalars(select(User).where(User.id.in_(user_ids)))} if user_ids else {}
+        return [users[user_id] for user_id in user_ids if user_id in users]
+
+    users = (await db.scalars(keyset_page(select(User), User.created_at, User.id, cursor, limit))).all()
+    set_next_cursor(response, users, limit)
     return users
 
+@app.get("/api/export/users")
+async def export_users():
+    """Xuất toàn bộ users dạng NDJSON (mỗi dòng một user), đọc theo lô EXPORT_CHUNK_SIZE dòng"""
+    query = select(User).order_by(User.id)
+    return StreamingResponse(ndjson(AsyncSessionLocal, query, UserResponse, EXPORT_CHUNK_SIZE), media_type=NDJSON_MEDIA_TYPE)
+
+@app.get("/api/export/posts")
+async def export_posts(format: Literal["ndjson", "csv"] = "ndjson", forum_id: Optional[int] = None, author_id: Optional[int] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Xuất posts kèm tên tác giả, tên forum và counters dạng NDJSON hoặc CSV, lọc theo forum, tác giả và khoảng [since, until)
+    Đọc theo lô EXPORT_CHUNK_SIZE dòng, không dựng object ORM/Pydantic cho từng post"""
+    query = posts_export_query(forum_id, author_id, since, until)
+    return StreamingResponse(
+        records(AsyncSessionLocal, query, format, EXPORT_CHUNK_SIZE),
+        media_type=ENCODERS[format].media_type,
+        headers={"Content-Disposition": f'attachment; filename="posts.{format}"'}
+    )
+
 @app.get("/api/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    """Lấy thông tin 1 user"""
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_user(response: Response, user_id: int, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """Lấy thông tin 1 user; If-None-Match khớp thì trả 304"""
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return conditional(response, if_none_match, "user", user_id, user.version) or user
 
 @app.post("/api/forums", response_model=ForumResponse)
-def create_forum(forum: ForumCreate, user_id: int = 1, db: Session = Depends(get_db)):
+async def create_forum(forum: ForumCreate, user_id: int = 1, db: AsyncSession = Depends(get_db)):
     """Tạo forum mới"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -260,34 +508,36 @@ def create_forum(forum: ForumCreate, user_id: int = 1, db: Session = Depends(get
         created_by=user_id
     )
     db.add(new_forum)
-    db.commit()
-    db.refresh(new_forum)
+    await db.commit()
     return new_forum
 
 @app.get("/api/forums", response_model=List[ForumResponse])
-def get_forums(category: Optional[CategoryEnum] = None, db: Session = Depends(get_db)):
-    """Lấy danh sách forums, có thể filter theo category"""
-    query = db.query(Forum)
+async def get_forums(response: Response, category: Optional[CategoryEnum] = None, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """Lấy danh sách forums, có thể filter theo category; If-None-Match khớp thì trả 304"""
+    query = select(Forum)
     if category:
-        query = query.filter(Forum.category == category)
-    return query.all()
+        query = query.where(Forum.category == category)
+    not_modified = conditional(response, if_none_match, "forums", category, await forum_watermark(db, query))
+    if not_modified:
+        return not_modified
+    return (await db.scalars(query)).all()
 
 @app.get("/api/forums/{forum_id}", response_model=ForumResponse)
-def get_forum(forum_id: int, db: Session = Depends(get_db)):
-    """Lấy chi tiết 1 forum"""
-    forum = db.query(Forum).filter(Forum.id == forum_id).first()
+async def get_forum(response: Response, forum_id: int, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """Lấy chi tiết 1 forum; forum không sửa qua API nên ETag chỉ theo id"""
+    forum = await db.get(Forum, forum_id)
     if not forum:
         raise HTTPException(status_code=404, detail="Forum not found")
-    return forum
+    return conditional(response, if_none_match, "forum", forum_id) or forum
 
 @app.post("/api/posts", response_model=PostResponse)
-def create_post(post: PostCreate, db: Session = Depends(get_db)):
+async def create_post(post: PostCreate, db: AsyncSession = Depends(get_db)):
     """Tạo bài post mới - CẦN TRUYỀN user_id"""
-    user = db.query(User).filter(User.id == post.user_id).first()
+    user = await db.get(User, post.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    forum = db.query(Forum).filter(Forum.id == post.forum_id).first()
+    forum = await db.get(Forum, post.forum_id)
     if not forum:
         raise HTTPException(status_code=404, detail="Forum not found")
     
@@ -299,118 +549,142 @@ def create_post(post: PostCreate, db: Session = Depends(get_db)):
         forum_id=post.forum_id
     )
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
-    
-    response = PostResponse(
-        id=new_post.id,
-        title=new_post.title,
-        content=new_post.content,
-        image_url=new_post.image_url,
-        author=new_post.author,
-        forum_id=new_post.forum_id,
-        created_at=new_post.created_at,
-        likes_count=len(new_post.likes),
-        comments_count=len(new_post.comments)
-    )
-    return response
+    await db.flush()
+    await search_index.add(db, POST, new_post.id, new_post.id, new_post.title, new_post.content)
+    await db.commit()
+    await track_trending(db, new_post.id)
+    
+    return (await post_responses(db, [new_post]))[0]
 
 @app.get("/api/posts", response_model=List[PostResponse])
-def get_posts(forum_id: Optional[int] = None, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    """Lấy danh sách posts với pagination"""
-    query = db.query(Post)
+async def get_posts(response: Response, forum_id: Optional[int] = None, skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """Lấy danh sách posts với pagination; If-None-Match khớp thì trả 304"""
+    query = select(Post)
     if forum_id:
-        query = query.filter(Post.forum_id == forum_id)
-    posts = query.order_by(Post.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return [PostResponse(
-        id=p.id,
-        title=p.title,
-        content=p.content,
-        image_url=p.image_url,
-        author=p.author,
-        forum_id=p.forum_id,
-        created_at=p.created_at,
-        likes_count=len(p.likes),
-        comments_count=len(p.comments)
-    ) for p in posts]
+        query = query.where(Post.forum_id == forum_id)
+    page = keyset_page(query, Post.created_at, Post.id, cursor, limit, skip)
+    not_modified = conditional(response, if_none_match, "posts", await post_page_versions(db, page))
+    if not_modified:
+        return not_modified
+    posts = (await db.scalars(page)).all()
+    set_next_cursor(response, posts, limit)
+    return await post_responses(db, posts)
 
 @app.get("/api/posts/{post_id}", response_model=PostResponse)
-def get_post(post_id: int, db: Session = Depends(get_db)):
-    """Lấy chi tiết 1 post"""
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if not post:
+async def get_post(response: Response, post_id: int, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """Lấy chi tiết 1 post; If-None-Match khớp thì trả 304"""
+    versions = await post_page_versions(db, select(Post).where(Post.id == post_id))
+    if not versions:
         raise HTTPException(status_code=404, detail="Post not found")
+    not_modified = conditional(response, if_none_match, "post", versions)
+    if not_modified:
+        return not_modified
     
-    return PostResponse(
-        id=post.id,
-        title=post.title,
-        content=post.content,
-        image_url=post.image_url,
-        author=post.author,
-        forum_id=post.forum_id,
-        created_at=post.created_at,
-        likes_count=len(post.likes),
-        comments_count=len(post.comments)
-    )
+    post = await db.get(Post, post_id)
+    return (await post_responses(db, [post]))[0]
 
 @app.post("/api/likes")
-def toggle_like(like: LikeCreate, db: Session = Depends(get_db)):
+async def toggle_like(like: LikeCreate, db: AsyncSession = Depends(get_db)):
     """Like/Unlike một post - CẦN TRUYỀN user_id"""
-    user = db.query(User).filter(User.id == like.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    post = db.query(Post).filter(Post.id == like.post_id).first()
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    
-    existing_like = db.query(Like).filter(
-        Like.user_id == like.user_id, 
-        Like.post_id == like.post_id
-    ).first()
-    
-    if existing_like:
-        db.delete(existing_like)
-        db.commit()
+    if like_buffer:
+        return await toggles.buffer_like(like_buffer, db, like.user_id, like.post_id)
+    
+    # Đang like thì DELETE xoá được dòng; không thì INSERT. Tối đa 2 câu, không có khoảng hở giữa đọc và ghi
+    unliked = (await db.execute(
+        delete(Like).where(Like.user_id == like.user_id, Like.post_id == like.post_id).returning(Like.id).execution_options(synchronize_session=False)
+    )).first()
+    if unliked:
+        await bump_post_counters(db, like.post_id, likes_count=-1)
+        await db.commit()
+        await track_trending(db, like.post_id)
         return {"message": "Unlike successful", "liked": False}
     
-    new_like = Like(user_id=like.user_id, post_id=like.post_id)
-    db.add(new_like)
-    db.commit()
+    if not (await db.execute(insert_toggle(Like, like.user_id, like.post_id))).rowcount:
+        await toggle_conflict(db, like.user_id, like.post_id)
+    await bump_post_counters(db, like.post_id, likes_count=1)
+    await db.commit()
+    await track_trending(db, like.post_id)
     return {"message": "Like successful", "liked": True}
 
 @app.post("/api/comments", response_model=CommentResponse)
-def create_comment(comment: CommentCreate, db: Session = Depends(get_db)):
+async def create_comment(comment: CommentCreate, db: AsyncSession = Depends(get_db)):
     """Tạo comment - CẦN TRUYỀN user_id"""
-    user = db.query(User).filter(User.id == comment.user_id).first()
+    user = await db.get(User, comment.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    post = db.query(Post).filter(Post.id == comment.post_id).first()
+    post = await db.get(Post, comment.post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
+    parent_id = None
+    if comment.parent_id is not None:
+        parent = await db.get(Comment, comment.parent_id)
+        if not parent or parent.post_id != comment.post_id:
+            raise HTTPException(status_code=404, detail="Parent comment not found")
+        # Trả lời một trả lời vẫn nằm trong thread của comment gốc
+        parent_id = parent.parent_id or parent.id
+
     new_comment = Comment(
         content=comment.content,
-        author_id=comment.user_id,
-        post_id=comment.post_id
+        author=user,
+        post_id=comment.post_id,
+        parent_id=parent_id
     )
     db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    await db.flush()
+    await search_index.add(db, COMMENT, new_comment.id, comment.post_id, None, new_comment.content)
+    if parent_id:
+        await db.execute(update(Comment).where(Comment.id == parent_id).values(reply_count=Comment.reply_count + 1).execution_options(synchronize_session=False))
+    await bump_post_counters(db, comment.post_id, comments_count=1)
+    await db.commit()
+    await track_trending(db, comment.post_id)
     return new_comment
 
-@app.get("/api/posts/{post_id}/comments", response_model=List[CommentResponse])
-def get_comments(post_id: int, db: Session = Depends(get_db)):
-    """Lấy tất cả comments của 1 post"""
-    comments = db.query(Comment).filter(Comment.post_id == post_id).order_by(Comment.created_at.desc()).all()
-    return comments
+@app.get("/api/posts/{post_id}/comments", response_model=List[CommentThreadResponse])
+async def get_comments(response: Response, post_id: int, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, replies: int = Query(COMMENT_REPLY_PREVIEW, ge=0, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    """Lấy comments gốc của post (mới nhất trước), mỗi thread kèm `replies` trả lời đầu tiên"""
+    query = select(Comment).where(Comment.post_id == post_id, Comment.parent_id.is_(None))
+    comments = (await db.scalars(keyset_page(query, Comment.created_at, Comment.id, cursor, limit))).all()
+    set_next_cursor(response, comments, limit)
+    return await comment_threads(db, comments, replies)
+
+@app.get("/api/comments/{comment_id}/replies", response_model=List[CommentResponse])
+async def get_replies(response: Response, comment_id: int, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Trả lời trong thread của một comment (cũ nhất trước), đọc tiếp từ replies_cursor của get_comments"""
+    query = select(Comment).where(Comment.parent_id == comment_id)
+    replies = (await db.scalars(keyset_page(query, Comment.created_at, Comment.id, cursor, limit, ascending=True))).all()
+    set_next_cursor(response, replies, limit)
+    return await comment_responses(db, replies)
+
+@app.put("/api/posts/{post_id}", response_model=PostResponse)
+async def update_post(post_id: int, user_id: int, post_update: PostUpdate, db: AsyncSession = Depends(get_db)):
+    """Sửa post - CẦN TRUYỀN user_id để kiểm tra quyền; index tìm kiếm đổi cùng transaction"""
+    post = await db.get(Post, post_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+
+    if post.author_id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to edit this post")
+
+    if post_update.title is not None:
+        post.title = post_update.title
+    if post_update.content:
+        post.content = post_update.content
+    if post_update.image_url is not None:
+        post.image_url = post_update.image_url
+
+    # Đổi version để ETag của các trang chứa post hết hiệu lực
+    post.version = Post.version + 1
+    await search_index.update(db, POST, post.id, post.id, post.title, post.content)
+    await db.commit()
+    await db.refresh(post)
+    return (await post_responses(db, [post]))[0]
 
 @app.delete("/api/posts/{post_id}")
-def delete_post(post_id: int, user_id: int, db: Session = Depends(get_db)):
+async def delete_post(post_id: int, user_id: int, db: AsyncSession = Depends(get_db)):
     """Xóa post - CẦN TRUYỀN user_id để kiểm tra quyền"""
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
@@ -418,40 +692,93 @@ def delete_post(post_id: int, user_id: int, db: Session = Depends(get_db)):
     if post.author_id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
     
-    db.delete(post)
-    db.commit()
+    comment_ids = (await db.scalars(select(Comment.id).where(Comment.post_id == post_id))).all()
+    await search_index.remove(db, POST, [post_id])
+    await search_index.remove(db, COMMENT, comment_ids)
+    # Trả lời trỏ tới comment gốc: xoá trước để không vướng khoá ngoại khi xoá comments theo post
+    await db.execute(delete(Comment).where(Comment.post_id == post_id, Comment.parent_id.is_not(None)).execution_options(synchronize_session=False))
+    await db.delete(post)
+    await db.commit()
+    if like_buffer:
+        like_buffer.discard_post(post_id)
+    trending.remove(post_id)
     return {"message": "Post deleted successfully"}
 
 @app.delete("/api/comments/{comment_id}")
-def delete_comment(comment_id: int, user_id: int, db: Session = Depends(get_db)):
+async def delete_comment(comment_id: int, user_id: int, db: AsyncSession = Depends(get_db)):
     """Xóa comment"""
-    comment = db.query(Comment).filter(Comment.id == comment_id).first()
+    comment = await db.get(Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
     if comment.author_id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db.delete(comment)
-    db.commit()
+    post_id = comment.post_id
+    # Xoá comment gốc thì xoá cả thread, xoá trả lời thì giảm reply_count của comment gốc
+    reply_ids = []
+    if comment.parent_id is None and comment.reply_count:
+        reply_ids = (await db.scalars(select(Comment.id).where(Comment.parent_id == comment_id))).all()
+        await db.execute(delete(Comment).where(Comment.parent_id == comment_id).execution_options(synchronize_session=False))
+    elif comment.parent_id is not None:
+        await db.execute(update(Comment).where(Comment.id == comment.parent_id).values(reply_count=Comment.reply_count - 1).execution_options(synchronize_session=False))
+    await db.delete(comment)
+    await search_index.remove(db, COMMENT, [comment_id, *reply_ids])
+    await bump_post_counters(db, post_id, comments_count=-1 - len(reply_ids))
+    await db.commit()
+    await track_trending(db, post_id)
     return {"message": "Comment deleted successfully"}
 
 @app.get("/api/trending/posts", response_model=List[PostResponse])
-def get_trending_posts(limit: int = 10, db: Session = Depends(get_db)):
-    """Lấy các bài post trending (mới nhất)"""
-    posts = db.query(Post).order_by(Post.created_at.desc()).limit(limit).all()
-    return [PostResponse(
-        id=p.id,
-        title=p.title,
-        content=p.content,
-        image_url=p.image_url,
-        author=p.author,
-        forum_id=p.forum_id,
-        created_at=p.created_at,
-        likes_count=len(p.likes),
-        comments_count=len(p.comments)
-    ) for p in posts]
+async def get_trending_posts(limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), forum_id: Optional[int] = None, category: Optional[CategoryEnum] = None, db: AsyncSession = Depends(get_db)):
+    """Lấy các bài post trending (tương tác có suy giảm theo thời gian), theo forum hoặc category"""
+    post_ids = trending.top(limit, forum_id=forum_id, category=category)
+    if not post_ids:
+        return []
+    
+    posts = {p.id: p for p in await db.scalars(select(Post).where(Post.id.in_(post_ids)))}
+    return await post_responses(db, [posts[post_id] for post_id in post_ids if post_id in posts])
+
+@app.get("/api/search", response_model=List[SearchResult])
+async def search(q: str, kind: Optional[Literal["post", "comment"]] = None, forum_id: Optional[int] = None, category: Optional[CategoryEnum] = None, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_db)):
+    """Tìm posts/comments theo tiêu đề và nội dung, không phân biệt dấu ("bong da" khớp "Bóng đá")"""
+    # forums.category lưu tên enum (GAME, SPORT...)
+    return await search_index.results(db, Post, Comment, SearchResult, q, kind, forum_id, category.name if category else None, limit, offset)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics dạng Prometheus text"""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/queries")
+async def get_query_report():
+    """Số SQL, thời gian DB theo route và các route bị N+1"""
+    return query_tracker.report()
+
+@app.delete("/debug/queries")
+async def reset_query_report():
+    query_tracker.reset()
+    return {"message": "Query stats reset"}
+
+startup.imported()
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "--migrate":
+        # Chạy: python main.py --migrate (một lần khi deploy, rồi chạy worker với AUTO_MIGRATE=0)
+        with startup.phase("migrate"):
+            init_db()
+        startup.report()
+        print("✅ Đã tạo bảng và nâng cấp database")
+    elif len(sys.argv) > 1 and sys.argv[1] == "--recount":
+        # Chạy: python main.py --recount
+        open_engines()
+        db = SessionLocal()
+        try:
+            recount_post_counters(db)
+            print("✅ Đã tính lại counters của posts")
+        finally:
+            db.close()
+    else:
+        # Một process cho dev; production nhiều worker: python serve.py
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,401 @@
+"""
+Benchmark mọi route của Profile và Trang chu trên dữ liệu sinh bởi Profile/generate_data.py
+
+Mỗi app chạy trong một process con (2 app đều là module `main`, đọc DATABASE_URL lúc import),
+gọi route qua ASGI in-process bằng httpx, không cần uvicorn. Mỗi route đo:
+- p50/p95/p99 latency và số câu SQL mỗi request (chạy tuần tự)
+- throughput với --concurrency request song song
+
+So với bench/budgets.json: route vượt p95_ms hoặc queries thì exit code 1.
+Kết quả ghi ra JSON (kèm commit) để so sánh giữa các lần chạy.
+
+Chạy: python bench/endpoints.py --output bench_endpoints.json
+      python bench/endpoints.py --update-budgets   # ghi lại budgets từ lần chạy này
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGETS_PATH = os.path.join(ROOT, "bench", "budgets.json")
+APPS = {"Profile": os.path.join(ROOT, "Profile"), "Trang chu": os.path.join(ROOT, "Trang chu")}
+
+# Dữ liệu đủ lớn để lộ N+1 và full scan, đủ nhỏ để sinh trong vài chục giây
+DATASET = dict(users=2000, forums=20, posts=20000, comments=60000, likes=200000, votes=100000, statuses=5000, follows=30)
+SEED = 42
+DATASET_END = datetime(2026, 1, 1)
+
+# Budget latency = p95 đo được * hệ số, để máy chậm hơn chút vẫn qua
+LATENCY_HEADROOM = 4.0
+MIN_LATENCY_BUDGET_MS = 10.0
+
+
+# ============ ROUTES ============
+
+class Route:
+    """build(rng, ctx) -> (method, url, kwargs); prepare(client, rng) chạy ngoài phần đo"""
+
+    def __init__(self, name, build, prepare=None):
+        self.name = name
+        self.build = build
+        self.prepare = prepare
+
+
+def user(rng):
+    return rng.randint(1, DATASET["users"])
+
+
+def post(rng):
+    return rng.randint(1, DATASET["posts"])
+
+
+def forum(rng):
+    return rng.randint(1, DATASET["forums"])
+
+
+def comment(rng):
+    return rng.randint(1, DATASET["comments"])
+
+
+def unique(rng):
+    return f"{os.getpid()}_{rng.getrandbits(48):x}"
+
+
+# Từ trong Profile/generate_data.WORDS, có và không dấu, có tiền tố
+SEARCH_QUERIES = ("bong da", "Bóng đá", "game mobile", "review", "kinh ngh", "thảo luận sự kiện")
+
+def batch_operations(rng, size=20):
+    """Thao tác trộn như client mobile gửi gộp: like, vote, comment"""
+    operations = []
+    for _ in range(size):
+        kind = rng.choice(["like", "vote", "comment"])
+        operation = {"type": kind, "post_id": post(rng), "user_id": user(rng)}
+        if kind == "vote":
+            operation["vote_type"] = rng.choice(["upvote", "downvote"])
+        elif kind == "comment":
+            operation["content"] = "bench"
+        operations.append(operation)
+    return {"operations": operations}
+
+
+async def create_own_post(client, rng):
+    author = user(rng)
+    response = await client.post("/api/posts", json={"title": "bench", "content": "bench", "forum_id": forum(rng), "image_url": None, "user_id": author})
+    return {"post_id": response.json()["id"], "user_id": author}
+
+
+async def create_own_comment(client, rng):
+    author = user(rng)
+    response = await client.post("/api/comments", json={"content": "bench", "post_id": post(rng), "user_id": author})
+    return {"comment_id": response.json()["id"], "user_id": author}
+
+
+def revalidate(build_url):
+    """prepare cho route đo nhánh 304: lấy ETag hiện tại của URL để gửi lại bằng If-None-Match"""
+    async def prepare(client, rng):
+        url = build_url(rng)
+        response = await client.get(url)
+        return {"url": url, "headers": {"If-None-Match": response.headers["etag"]}}
+    return prepare
+
+
+def conditional_get(rng, ctx):
+    return "GET", ctx["url"], {"headers": ctx["headers"]}
+
+
+async def create_follow(client, rng):
+    follower, following = user(rng), user(rng)
+    await client.post("/api/follow", json={"follower_id": follower, "following_id": following})
+    return {"follower_id": follower, "following_id": following}
+
+
+COMMON_ROUTES = [
+    Route("GET /", lambda rng, ctx: ("GET", "/", {})),
+    Route("POST /api/users", lambda rng, ctx: ("POST", "/api/users", {"json": {"username": f"bench_{unique(rng)}", "email": f"{unique(rng)}@bench.dev"}})),
+    Route("GET /api/users", lambda rng, ctx: ("GET", "/api/users", {})),
+    Route("GET /api/users?ids", lambda rng, ctx: ("GET", "/api/users", {"params": {"ids": ",".join(str(user(rng)) for _ in range(20))}})),
+    Route("GET /api/export/users", lambda rng, ctx: ("GET", "/api/export/users", {})),
+    Route("GET /api/export/posts?forum_id", lambda rng, ctx: ("GET", "/api/export/posts", {"params": {"forum_id": forum(rng), "format": rng.choice(["ndjson", "csv"])}})),
+    Route("GET /api/users/{user_id}", lambda rng, ctx: ("GET", f"/api/users/{user(rng)}", {})),
+    Route("GET /api/users/{user_id}?If-None-Match", conditional_get, prepare=revalidate(lambda rng: f"/api/users/{user(rng)}")),
+    Route("POST /api/forums", lambda rng, ctx: ("POST", "/api/forums", {"params": {"user_id": user(rng)}, "json": {"name": f"bench {unique(rng)}", "description": None, "category": "game"}})),
+    Route("GET /api/forums", lambda rng, ctx: ("GET", "/api/forums", {})),
+    Route("GET /api/forums?If-None-Match", conditional_get, prepare=revalidate(lambda rng: "/api/forums")),
+    Route("POST /api/posts", lambda rng, ctx: ("POST", "/api/posts", {"json": {"title": "bench", "content": "bench", "forum_id": forum(rng), "image_url": None, "user_id": user(rng)}})),
+    Route("GET /api/posts", lambda rng, ctx: ("GET", "/api/posts", {})),
+    Route("GET /api/posts?forum_id", lambda rng, ctx: ("GET", "/api/posts", {"params": {"forum_id": forum(rng)}})),
+    Route("GET /api/posts?If-None-Match", conditional_get, prepare=revalidate(lambda rng: "/api/posts")),
+    Route("POST /api/likes", lambda rng, ctx: ("POST", "/api/likes", {"json": {"post_id": post(rng), "user_id": user(rng)}})),
+    Route("POST /api/comments", lambda rng, ctx: ("POST", "/api/comments", {"json": {"content": "bench", "post_id": post(rng), "user_id": user(rng)}})),
+    Route("GET /api/posts/{post_id}/comments", lambda rng, ctx: ("GET", f"/api/posts/{post(rng)}/comments", {"params": {"limit": 20}})),
+    Route("GET /api/comments/{comment_id}/replies", lambda rng, ctx: ("GET", f"/api/comments/{comment(rng)}/replies", {"params": {"limit": 20}})),
+    Route("GET /api/trending/posts", lambda rng, ctx: ("GET", "/api/trending/posts", {})),
+    Route("GET /api/search", lambda rng, ctx: ("GET", "/api/search", {"params": {"q": rng.choice(SEARCH_QUERIES)}})),
+    Route("GET /metrics", lambda rng, ctx: ("GET", "/metrics", {})),
+    Route("GET /debug/queries", lambda rng, ctx: ("GET", "/debug/queries", {})),
+    Route("DELETE /debug/queries", lambda rng, ctx: ("DELETE", "/debug/queries", {})),
+]
+
+ROUTES = {
+    "Profile": COMMON_ROUTES + [
+        Route("PUT /api/users/{user_id}", lambda rng, ctx: ("PUT", f"/api/users/{user(rng)}", {"json": {"bio": f"bench {unique(rng)}"}})),
+        Route("GET /api/users/{user_id}/posts", lambda rng, ctx: ("GET", f"/api/users/{user(rng)}/posts", {})),
+        Route("GET /api/users/{user_id}/activity", lambda rng, ctx: ("GET", f"/api/users/{user(rng)}/activity", {})),
+        Route("POST /api/follow", lambda rng, ctx: ("POST", "/api/follow", {"json": {"follower_id": user(rng), "following_id": user(rng)}})),
+        Route("POST /api/unfollow", lambda rng, ctx: ("POST", "/api/unfollow", {"json": ctx}), prepare=create_follow),
+        Route("GET /api/users/{user_id}/followers", lambda rng, ctx: ("GET", f"/api/users/{user(rng)}/followers", {})),
+        Route("GET /api/users/{user_id}/following", lambda rng, ctx: ("GET", f"/api/users/{user(rng)}/following", {})),
+        Route("GET /api/users/{user_id}/feed", lambda rng, ctx: ("GET", f"/api/users/{user(rng)}/feed", {})),
+        Route("POST /api/status", lambda rng, ctx: ("POST", "/api/status", {"json": {"content": "bench", "user_id": user(rng)}})),
+        Route("GET /api/users/{user_id}/status", lambda rng, ctx: ("GET", f"/api/users/{user(rng)}/status", {})),
+        Route("POST /api/votes", lambda rng, ctx: ("POST", "/api/votes", {"json": {"post_id": post(rng), "user_id": user(rng), "vote_type": rng.choice(["upvote", "downvote"])}})),
+        Route("GET /api/posts/{post_id}/votes", lambda rng, ctx: ("GET", f"/api/posts/{post(rng)}/votes", {})),
+        Route("POST /api/batch", lambda rng, ctx: ("POST", "/api/batch", {"json": batch_operations(rng)})),
+        Route("GET /api/cache/stats", lambda rng, ctx: ("GET", "/api/cache/stats", {})),
+    ],
+    "Trang chu": COMMON_ROUTES + [
+        Route("GET /api/forums/{forum_id}", lambda rng, ctx: ("GET", f"/api/forums/{forum(rng)}", {})),
+        Route("GET /api/posts/{post_id}", lambda rng, ctx: ("GET", f"/api/posts/{post(rng)}", {})),
+        Route("PUT /api/posts/{post_id}", lambda rng, ctx: ("PUT", f"/api/posts/{ctx['post_id']}", {"params": {"user_id": ctx["user_id"]}, "json": {"content": f"bench {unique(rng)}"}}), prepare=create_own_post),
+        Route("DELETE /api/posts/{post_id}", lambda rng, ctx: ("DELETE", f"/api/posts/{ctx['post_id']}", {"params": {"user_id": ctx["user_id"]}}), prepare=create_own_post),
+        Route("DELETE /api/comments/{comment_id}", lambda rng, ctx: ("DELETE", f"/api/comments/{ctx['comment_id']}", {"params": {"user_id": ctx["user_id"]}}), prepare=create_own_comment),
+    ],
+}
+
+
+# ============ WORKER (1 app / process) ============
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def load_app(name, workdir):
+    """Sinh dataset lần đầu (lưu bản gốc trong workdir), mỗi lần chạy bench trên một bản copy"""
+    app_dir = APPS[name]
+    pristine = os.path.join(workdir, f"{name.replace(' ', '_')}.pristine.db")
+    db_path = os.path.join(workdir, f"{name.replace(' ', '_')}.db")
+    fresh = not os.path.exists(pristine)
+    if not fresh:
+        shutil.copyfile(pristine, db_path)
+    elif os.path.exists(db_path):
+        os.remove(db_path)
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    import main
+
+    if fresh:
+        # generate_data của Profile dùng `main`/`import_data` của app đang chạy
+        spec = importlib.util.spec_from_file_location("generate_data", os.path.join(APPS["Profile"], "generate_data.py"))
+        generate_data = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(generate_data)
+        from common.bulk import BulkLoader
+        from import_data import after_import
+
+        columns = {table.name: set(table.c.keys()) for table in main.Base.metadata.sorted_tables}
+        generator = generate_data.Generator(SEED, DATASET_END, 90, 1.1, **DATASET)
+        records = (
+            (table, {key: value for key, value in record.items() if key in columns[table]})
+            for table, record in generator.records() if table in columns
+        )
+        print(f"[{name}] sinh dataset {DATASET} ...", file=sys.stderr)
+        BulkLoader(main.init_db(), main.Base.metadata, "bench", chunk_size=50000, log=lambda message: None).load(records)
+        after_import()
+        main.engines.engine.dispose()
+        shutil.copyfile(db_path, pristine)
+    return main
+
+
+async def bench_route(client, route, rng, iterations, warmup, concurrency, statements):
+    async def call(ctx):
+        method, url, kwargs = route.build(rng, ctx)
+        return await client.request(method, url, **kwargs)
+
+    async def prepared():
+        return await route.prepare(client, rng) if route.prepare else None
+
+    for _ in range(warmup):
+        await call(await prepared())
+
+    latencies, queries, statuses = [], [], {}
+    for _ in range(iterations):
+        ctx = await prepared()
+        before = statements[0]
+        started = time.perf_counter()
+        response = await call(ctx)
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(statements[0] - before)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    # Throughput: --concurrency request chạy song song trên cùng event loop
+    contexts = [await prepared() for _ in range(iterations)]
+    started = time.perf_counter()
+    for start in range(0, iterations, concurrency):
+        await asyncio.gather(*(call(ctx) for ctx in contexts[start:start + concurrency]))
+    throughput = iterations / (time.perf_counter() - started)
+
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "rps": round(throughput, 1),
+        "queries": max(queries),
+        "queries_avg": round(sum(queries) / len(queries), 2),
+        "status": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def run_worker(name, workdir, iterations, warmup, concurrency, only):
+    import httpx
+    from sqlalchemy import event
+
+    main = load_app(name, workdir)
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    routes = [route for route in ROUTES[name] if not only or any(pattern in route.name for pattern in only)]
+    covered = {route.name.split("?")[0] for route in ROUTES[name]}
+    uncovered = sorted(
+        f"{method} {route.path}" for route in main.app.routes
+        for method in getattr(route, "methods", ()) - {"HEAD", "OPTIONS"}
+        if f"{method} {route.path}" not in covered and not route.path.startswith(("/docs", "/redoc", "/openapi"))
+    )
+
+    results = {}
+    rng = random.Random(SEED)
+    transport = httpx.ASGITransport(app=main.app)
+    # ASGITransport không chạy lifespan: mở engine, migrate, nạp trending như một worker thật
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        event.listen(main.engines.async_engine.sync_engine, "before_cursor_execute", count_statement)
+        for route in routes:
+            results[route.name] = await bench_route(client, route, rng, iterations, warmup, concurrency, statements)
+            result = results[route.name]
+            print(f"[{name}] {route.name:<42} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                  f"{result['rps']:>8.0f} req/s  {result['queries']:>3} SQL", file=sys.stderr)
+    return {"routes": results, "uncovered": uncovered}
+
+
+# ============ PARENT ============
+
+def check_budgets(apps, budgets):
+    violations = []
+    for name, result in apps.items():
+        for route, metrics in result["routes"].items():
+            budget = budgets.get(name, {}).get(route)
+            if budget is None:
+                violations.append(f"{name} {route}: không có budget")
+                continue
+            if metrics["p95_ms"] > budget["p95_ms"]:
+                violations.append(f"{name} {route}: p95 {metrics['p95_ms']}ms > {budget['p95_ms']}ms")
+            if metrics["queries"] > budget["queries"]:
+                violations.append(f"{name} {route}: {metrics['queries']} SQL > {budget['queries']}")
+            errors = sum(count for code, count in metrics["status"].items() if code.startswith("5"))
+            if errors:
+                violations.append(f"{name} {route}: {errors} response 5xx")
+    return violations
+
+
+def updated_budgets(apps, budgets):
+    for name, result in apps.items():
+        for route, metrics in result["routes"].items():
+            budgets.setdefault(name, {})[route] = {
+                "p95_ms": round(max(metrics["p95_ms"] * LATENCY_HEADROOM, MIN_LATENCY_BUDGET_MS), 1),
+                "queries": metrics["queries"],
+            }
+    return {name: dict(sorted(routes.items())) for name, routes in sorted(budgets.items())}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", nargs="+", choices=APPS, default=list(APPS))
+    parser.add_argument("--routes", nargs="+", help="chỉ chạy route có tên chứa chuỗi này")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "forum-bench"), help="nơi giữ dataset đã sinh")
+    parser.add_argument("--output", default="bench_endpoints.json")
+    parser.add_argument("--update-budgets", action="store_true", help="ghi budgets.json từ lần chạy này thay vì kiểm tra")
+    parser.add_argument("--worker", choices=APPS, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = asyncio.run(run_worker(args.worker, args.workdir, args.iterations, args.warmup, args.concurrency, args.routes))
+        with open(args.worker_output, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    apps = {}
+    for name in args.apps:
+        worker_output = os.path.join(args.workdir, "worker.json")
+        command = [
+            sys.executable, os.path.abspath(__file__), "--worker", name, "--worker-output", worker_output,
+            "--workdir", args.workdir, "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+            "--concurrency", str(args.concurrency),
+        ] + (["--routes", *args.routes] if args.routes else [])
+        subprocess.run(command, check=True)
+        with open(worker_output, encoding="utf-8") as f:
+            apps[name] = json.load(f)
+        for route in apps[name]["uncovered"]:
+            print(f"⚠️ [{name}] route chưa có trong benchmark: {route}")
+
+    budgets = {}
+    if os.path.exists(BUDGETS_PATH):
+        with open(BUDGETS_PATH, encoding="utf-8") as f:
+            budgets = json.load(f)
+
+    if args.update_budgets:
+        with open(BUDGETS_PATH, "w", encoding="utf-8") as f:
+            json.dump(updated_budgets(apps, budgets), f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"✅ Đã cập nhật {BUDGETS_PATH}")
+        violations = []
+    else:
+        violations = check_budgets(apps, budgets)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "dataset": DATASET,
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "apps": apps,
+        "violations": violations,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📄 Kết quả: {args.output}")
+
+    for violation in violations:
+        print(f"❌ {violation}")
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Microbenchmark chi phí serialize một trang posts (mặc định 100 post) của GET /api/posts, không tính DB
+
+- fastapi: đường hiện tại, route trả list PostResponse, FastAPI validate lại theo response_model rồi dump_json
+  (pydantic-core ghi thẳng ra bytes, không qua dict Python)
+- validate lại: riêng bước validate lại ở trên; item đã là instance PostResponse nên chỉ là kiểm tra kiểu
+- fastapi + json.dumps: qua dict Python + json.dumps, đường cũ khi route khai response_class tuỳ chỉnh
+- fastapi + orjson: như trên nhưng json.dumps thay bằng orjson (ORJSONResponse), cần cài orjson
+- TypeAdapter: TypeAdapter(List[PostResponse]) dựng sẵn, bỏ hẳn bước validate lại
+
+Chạy: python bench/serialization.py --posts 100 --rounds 2000 [--app "Trang chu"]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = {"Profile": os.path.join(ROOT, "Profile"), "Trang chu": os.path.join(ROOT, "Trang chu")}
+
+
+def load_main(name, workdir):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'forum.db')}"
+    os.environ.setdefault("SQL_INSTRUMENTATION", "0")
+    sys.path.insert(0, APPS[name])
+    import main
+    return main
+
+
+def page(main, size):
+    """Trang posts như post_responses dựng: mỗi PostResponse validate một lần lúc tạo"""
+    start = datetime(2026, 1, 1)
+    profile = {"bio": "bio"} if "bio" in main.UserResponse.model_fields else {}
+    authors = [main.UserResponse(id=i, username=f"user_{i}", email=f"user{i}@example.com", avatar_url=None, created_at=start, **profile)
+               for i in range(1, 21)]
+    extra = {"votes_count": 3} if "votes_count" in main.PostResponse.model_fields else {}
+    return [main.PostResponse(
+        id=i,
+        title=f"Bài viết số {i}",
+        content="Nội dung bài viết " * 20,
+        image_url=None,
+        author=authors[i % len(authors)],
+        forum_id=i % 7 + 1,
+        created_at=start + timedelta(minutes=i),
+        likes_count=i * 3,
+        comments_count=i,
+        **extra,
+    ) for i in range(size)]
+
+
+def measure(fn, rounds, repeat=5):
+    """µs mỗi lần gọi, lấy lượt nhanh nhất trong repeat lượt cho đỡ nhiễu"""
+    fn()  # warmup
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return best / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chi phí serialize một trang posts")
+    parser.add_argument("--app", choices=APPS, default="Profile")
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    from typing import List
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_main = load_main(args.app, workdir)
+        field = next(route for route in app_main.app.routes if getattr(route, "path", None) == "/api/posts" and "GET" in route.methods).response_field
+        items = page(app_main, args.posts)
+
+        def fastapi_path(dump_json=True):
+            # Như fastapi.routing.serialize_response, bỏ lớp coroutine cho khỏi tính event loop
+            value, errors = field.validate(items, {}, loc=("response",))
+            assert not errors, errors
+            return field.serialize_json(value) if dump_json else field.serialize(value)
+
+        variants = {
+            "fastapi": lambda: fastapi_path(),
+            "fastapi + json.dumps": lambda: JSONResponse(fastapi_path(dump_json=False)).body,
+        }
+        try:
+            import orjson
+            variants["fastapi + orjson"] = lambda: orjson.dumps(fastapi_path(dump_json=False))
+        except ImportError:
+            print("(bỏ qua orjson: chưa cài)", file=sys.stderr)
+        adapter = TypeAdapter(List[app_main.PostResponse])
+        variants["TypeAdapter"] = lambda: adapter.dump_json(items)
+
+        # Cùng dữ liệu ở mọi đường
+        expected = json.loads(variants["fastapi"]())
+        for name, fn in variants.items():
+            assert json.loads(fn()) == expected, name
+
+        print(f"[{args.app}] {args.posts} posts, {len(variants['fastapi']())} bytes")
+        baseline = None
+        for name, fn in variants.items():
+            micros = measure(fn, args.rounds)
+            baseline = baseline or micros
+            print(f"  {name:<22} {micros:9.1f} µs/trang   x{baseline / micros:.2f}")
+        revalidate = measure(lambda: field.validate(items, {}, loc=("response",)), args.rounds)
+        print(f"  {'(validate lại)':<22} {revalidate:9.1f} µs/trang")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+So sánh đọc/ghi đồng thời trên SQLite giữa các DB_PROFILE (xem common/db.py)
+
+Mô phỏng like/comment dồn dập: writer liên tục INSERT + UPDATE counter,
+reader liên tục đọc counter và đếm likes của post.
+
+Chạy: python bench/sqlite_profiles.py --readers 8 --writers 4 --seconds 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from common.db import ENGINE_PROFILES, build_engine
+
+POSTS = 1000
+
+
+def setup(engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE posts (id INTEGER PRIMARY KEY, likes_count INTEGER NOT NULL DEFAULT 0)"))
+        conn.execute(text("CREATE TABLE likes (id INTEGER PRIMARY KEY, user_id INTEGER, post_id INTEGER)"))
+        conn.execute(text("CREATE INDEX ix_likes_post ON likes (post_id)"))
+        conn.execute(text("INSERT INTO posts (id) VALUES (:id)"), [{"id": i} for i in range(1, POSTS + 1)])
+
+
+def run_profile(profile, readers, writers, seconds):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = build_engine(f"sqlite:///{path}", profile)
+    setup(engine)
+
+    counts = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def add(key, value):
+        with lock:
+            counts[key] += value
+
+    def reader():
+        done = 0
+        while time.monotonic() < deadline:
+            post_id = random.randint(1, POSTS)
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT likes_count FROM posts WHERE id = :id"), {"id": post_id}).scalar()
+                    conn.execute(text("SELECT COUNT(*) FROM likes WHERE post_id = :id"), {"id": post_id}).scalar()
+                done += 1
+            except OperationalError:
+                add("locked", 1)
+        add("reads", done)
+
+    def writer():
+        done = 0
+        while time.monotonic() < deadline:
+            post_id = random.randint(1, POSTS)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("INSERT INTO likes (user_id, post_id) VALUES (:u, :p)"), {"u": random.randint(1, 10 ** 6), "p": post_id})
+                    conn.execute(text("UPDATE posts SET likes_count = likes_count + 1 WHERE id = :p"), {"p": post_id})
+                done += 1
+            except OperationalError:
+                add("locked", 1)
+        add("writes", done)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {key: value / seconds if key != "locked" else value for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--profiles", nargs="+", default=list(ENGINE_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds}s mỗi profile")
+    print(f"{'profile':<12}{'reads/s':>12}{'writes/s':>12}{'locked':>10}")
+    for profile in args.profiles:
+        result = run_profile(profile, args.readers, args.writers, args.seconds)
+        print(f"{profile:<12}{result['reads']:>12.0f}{result['writes']:>12.0f}{result['locked']:>10}")
+
+
+if __name__ == "__main__":
+    main()
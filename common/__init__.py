@@ -0,0 +1,3 @@
+"""
+Code dùng chung cho 2 app Profile và Trang chu
+"""
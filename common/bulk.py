@@ -0,0 +1,338 @@
+"""
+Bulk import dùng chung cho 2 app: đọc JSON/NDJSON/module Python theo luồng và ghi theo chunk.
+
+- JSON: {"users": [...], "posts": [...]} hoặc một mảng (cần --table), đọc từng phần tử
+  nên file nhiều GB không phải nạp hết vào RAM
+- NDJSON (.ndjson/.jsonl): mỗi dòng một record, tên bảng lấy từ --table hoặc tên file
+- .py: các list viết hoa như USERS, FOLLOWERS, STATUS_UPDATES (vd Profile/data.py)
+
+Mỗi chunk là một transaction: executemany, hoặc COPY trên Postgres (psycopg2). Số record đã
+ghi của từng bảng được lưu vào bảng import_progress trong cùng transaction, nên chạy lại
+cùng --job sau khi lỗi sẽ bỏ qua phần đã import mà không ghi trùng.
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Enum, Integer, MetaData, String, Table, delete, select, text, update
+
+progress_metadata = MetaData()
+import_progress = Table(
+    "import_progress",
+    progress_metadata,
+    Column("job", String(255), primary_key=True),
+    Column("table_name", String(64), primary_key=True),
+    Column("rows", Integer, nullable=False, default=0),
+)
+
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+
+# ============ SOURCES ============
+
+class JsonStream:
+    """Đọc JSON theo từng giá trị bằng raw_decode trên một buffer trượt"""
+
+    def __init__(self, fp, read_size=1 << 20):
+        self.fp = fp
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.fp.read(self.read_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Ký tự khác khoảng trắng kế tiếp, "" nếu hết file"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Invalid JSON: expected {chars!r}, got {char or 'EOF'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # Số ở cuối buffer có thể còn chữ số chưa đọc tới
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def read_json(fp, table=None):
+    stream = JsonStream(fp)
+    if stream.peek() == "[":
+        if not table:
+            raise ValueError("Top-level JSON array needs --table")
+        for record in stream.array():
+            yield table, record
+        return
+
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        name = stream.value()
+        stream.expect(":")
+        for record in stream.array():
+            yield name, record
+        if stream.expect(",}") == "}":
+            return
+
+
+def read_ndjson(fp, table):
+    for line in fp:
+        if line.strip():
+            yield table, json.loads(line)
+
+
+def read_python(path):
+    """Các list viết hoa trong module, vd STATUS_UPDATES -> bảng status_updates"""
+    spec = importlib.util.spec_from_file_location("import_source", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for name, value in vars(module).items():
+        if name.isupper() and isinstance(value, list):
+            for record in value:
+                yield name.lower(), record
+
+
+def read_source(path, table=None):
+    if path.endswith(".py"):
+        yield from read_python(path)
+        return
+    stem, ext = os.path.splitext(os.path.basename(path))
+    fp = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        if ext in NDJSON_EXTENSIONS:
+            yield from read_ndjson(fp, table or stem)
+        else:
+            yield from read_json(fp, table)
+    finally:
+        if fp is not sys.stdin:
+            fp.close()
+
+
+# ============ LOADER ============
+
+def _converter(column):
+    """JSON chỉ có str/number: đổi về kiểu Python mà cột cần"""
+    if isinstance(column.type, DateTime):
+        return lambda value: datetime.fromisoformat(value) if isinstance(value, str) else value
+    enum_class = getattr(column.type, "enum_class", None) if isinstance(column.type, Enum) else None
+    if enum_class:
+        def to_enum(value):
+            if isinstance(value, enum_class) or value is None:
+                return value
+            try:
+                return enum_class(value)
+            except ValueError:
+                return enum_class[value]
+        return to_enum
+    return None
+
+
+class BulkLoader:
+    def __init__(self, engine, metadata, job, chunk_size=10000, use_copy=True, log=print):
+        self.engine = engine
+        self.tables = metadata.tables
+        self.job = job
+        self.chunk_size = chunk_size
+        self.use_copy = use_copy and engine.dialect.name == "postgresql"
+        self.log = log
+        self.converters = {
+            name: {column.name: conv for column in table.columns if (conv := _converter(column))}
+            for name, table in self.tables.items()
+        }
+        self.counts = {}
+        self.started = None
+        self.last_report = 0
+
+        progress_metadata.create_all(engine)
+        with engine.connect() as conn:
+            self.done = dict(conn.execute(
+                select(import_progress.c.table_name, import_progress.c.rows).where(import_progress.c.job == job)
+            ).all())
+
+    def load(self, records):
+        """records: iterable (tên bảng, dict); trả về số dòng đã ghi theo bảng"""
+        self.started = time.monotonic()
+        seen = {}
+        buffer, buffer_table, buffer_keys = [], None, None
+        for name, record in records:
+            if name not in self.tables:
+                raise ValueError(f"Unknown table: {name}")
+            seen[name] = seen.get(name, 0) + 1
+            if seen[name] <= self.done.get(name, 0):
+                continue  # đã import ở lần chạy trước
+
+            keys = tuple(record)
+            if buffer and (name != buffer_table or keys != buffer_keys or len(buffer) >= self.chunk_size):
+                self.flush(buffer_table, buffer)
+                buffer = []
+            buffer_table, buffer_keys = name, keys
+            converters = self.converters[name]
+            buffer.append({key: converters[key](value) if key in converters else value for key, value in record.items()})
+        if buffer:
+            self.flush(buffer_table, buffer)
+
+        self.reset_sequences()
+        elapsed = time.monotonic() - self.started
+        total = sum(self.counts.values())
+        for name, rows in self.counts.items():
+            self.log(f"   - {name}: {rows} rows")
+        self.log(f"✅ {total} rows trong {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+        return self.counts
+
+    def flush(self, name, rows):
+        table = self.tables[name]
+        with self.engine.begin() as conn:
+            if self.use_copy:
+                self.copy(conn, table, rows)
+            else:
+                conn.execute(table.insert(), rows)
+            self.save_progress(conn, name, self.done.get(name, 0) + len(rows))
+
+        self.done[name] = self.done.get(name, 0) + len(rows)
+        self.counts[name] = self.counts.get(name, 0) + len(rows)
+        now = time.monotonic()
+        if now - self.last_report >= 2:
+            self.last_report = now
+            total = sum(self.counts.values())
+            self.log(f"   {name}: {self.done[name]} rows, {total / max(now - self.started, 1e-9):,.0f} rows/s")
+
+    def save_progress(self, conn, name, rows):
+        result = conn.execute(update(import_progress).where(
+            import_progress.c.job == self.job, import_progress.c.table_name == name
+        ).values(rows=rows))
+        if result.rowcount == 0:
+            conn.execute(import_progress.insert().values(job=self.job, table_name=name, rows=rows))
+
+    def copy(self, conn, table, rows):
+        """COPY ... FROM STDIN dạng text; giá trị mặc định phía Python phải tự điền"""
+        cursor = conn.connection.cursor()
+        if not hasattr(cursor, "copy_expert"):
+            conn.execute(table.insert(), rows)  # driver không phải psycopg2
+            return
+
+        names = list(rows[0])
+        defaults = [
+            column for column in table.columns
+            if column.name not in names and column.default is not None and not column.primary_key
+        ]
+        columns = [table.c[name] for name in names] + defaults
+        processors = [column.type.bind_processor(conn.dialect) for column in columns]
+
+        buf = io.StringIO()
+        for row in rows:
+            values = [row[name] for name in names]
+            values += [column.default.arg(None) if column.default.is_callable else column.default.arg for column in defaults]
+            buf.write("\t".join(_copy_value(process(value) if process else value) for process, value in zip(processors, values)))
+            buf.write("\n")
+        buf.seek(0)
+        column_list = ", ".join(f'"{column.name}"' for column in columns)
+        cursor.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN', buf)
+
+    def reset_sequences(self):
+        """Postgres: id chèn tay không đẩy sequence, đặt lại = max(id) + 1"""
+        if self.engine.dialect.name != "postgresql":
+            return
+        with self.engine.begin() as conn:
+            for name in self.counts:
+                table = self.tables[name]
+                if "id" not in table.c or not table.c.id.primary_key:
+                    continue
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 0) + 1 FROM \"{name}\"), false)"
+                ))
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def clear_tables(engine, metadata):
+    """Xoá toàn bộ dữ liệu theo thứ tự ngược khoá ngoại, kèm tiến độ import"""
+    progress_metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in reversed(metadata.sorted_tables):
+            conn.execute(delete(table))
+        conn.execute(delete(import_progress))
+
+
+# ============ CLI ============
+
+def run_cli(engine, metadata, default_source, after_import=None):
+    """CLI import_data.py của mỗi app; after_import chạy sau khi ghi xong (vd tính lại counters)"""
+    parser = argparse.ArgumentParser(description="Bulk import JSON/NDJSON/.py vào DATABASE_URL")
+    parser.add_argument("sources", nargs="*", default=[default_source], help="file .json, .ndjson/.jsonl, .py hoặc - (stdin)")
+    parser.add_argument("--table", help="tên bảng cho NDJSON hoặc JSON dạng mảng")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--job", help="tên job để resume, mặc định là tên các file nguồn")
+    parser.add_argument("--no-copy", action="store_true", help="Postgres: dùng executemany thay vì COPY")
+    parser.add_argument("--clear", action="store_true", help="xoá toàn bộ dữ liệu trước khi import")
+    args = parser.parse_args()
+
+    if args.clear:
+        confirm = input("⚠️ Bạn có chắc muốn xóa TOÀN BỘ dữ liệu? (yes/no): ")
+        if confirm.lower() != "yes":
+            print("Đã hủy.")
+            return
+        clear_tables(engine, metadata)
+        print("✅ Đã xóa toàn bộ dữ liệu cũ")
+
+    job = args.job or ",".join(os.path.basename(source) for source in args.sources)
+    loader = BulkLoader(engine, metadata, job, args.chunk_size, use_copy=not args.no_copy)
+    if loader.done:
+        print(f"↻ Tiếp tục job {job}: {loader.done}")
+
+    def records():
+        for source in args.sources:
+            yield from read_source(source, args.table)
+
+    print(f"🚀 Bắt đầu import {', '.join(args.sources)} ...")
+    loader.load(records())
+    if after_import:
+        after_import()
+    print("🎉 Import hoàn tất!")
@@ -0,0 +1,106 @@
+"""
+Cache read-through cho các response đọc nhiều (vd profile user).
+
+Mặc định là LRU + TTL trong bộ nhớ của từng worker. Đặt CACHE_URL=redis://... để dùng
+Redis (hoặc server tương thích như KeyDB/Valkey) chung cho mọi worker; cần cài `redis`.
+Giá trị lưu phải serialize được bằng JSON.
+
+Entry bị xoá ngay khi dữ liệu gốc đổi (app gọi delete sau commit), TTL chỉ là lưới an toàn.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """LRU trong bộ nhớ, mỗi entry hết hạn sau ttl giây"""
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    async def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    async def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self.entries),
+        }
+
+
+class RedisCache:
+    """Cache trên Redis, hits/misses đếm riêng theo worker"""
+
+    def __init__(self, url, ttl=60, prefix="forum:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError("CACHE_URL requires the 'redis' package: pip install redis") from exc
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key, value):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+def build_cache(url=None, max_entries=10000, ttl=60, prefix="forum:"):
+    """CACHE_URL rỗng -> LRU trong bộ nhớ, redis://... -> Redis"""
+    if url:
+        return RedisCache(url, ttl, prefix)
+    return LRUCache(max_entries, ttl)
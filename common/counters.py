@@ -0,0 +1,42 @@
+"""
+Counters lưu sẵn trên posts (likes_count, comments_count, upvotes...): cộng/trừ bằng UPDATE trong
+transaction của thao tác ghi, không COUNT lại lúc đọc.
+
+Like/comment/vote không tính là sửa bài nên giữ nguyên updated_at, nhưng đổi version để ETag của
+các trang có post đó hết hiệu lực (xem common/etag.py).
+"""
+
+from sqlalchemy import bindparam, update
+
+
+def add_delta(deltas, post_id, column, delta):
+    """Cộng dồn vào deltas {post_id: {column: delta}}"""
+    counters = deltas.setdefault(post_id, {})
+    counters[column] = counters.get(column, 0) + delta
+
+
+class PostCounters:
+    def __init__(self, post_model):
+        self.post_model = post_model
+
+    async def bump(self, db, post_id, **deltas):
+        """Cộng/trừ counters của post trong transaction hiện tại"""
+        Post = self.post_model
+        values = {getattr(Post, name): getattr(Post, name) + delta for name, delta in deltas.items()}
+        values[Post.updated_at] = Post.updated_at
+        values[Post.version] = Post.version + 1
+        await db.execute(update(Post).where(Post.id == post_id).values(values).execution_options(synchronize_session=False))
+
+    async def bump_many(self, db, deltas):
+        """Như bump cho nhiều post {post_id: {column: delta}}, một câu executemany"""
+        if not deltas:
+            return  # executemany với danh sách rỗng đã deprecated trong SQLAlchemy
+        posts = self.post_model.__table__
+        columns = sorted({name for counters in deltas.values() for name in counters})
+        values = {name: posts.c[name] + bindparam(f"delta_{name}") for name in columns}
+        values["updated_at"] = posts.c.updated_at
+        values["version"] = posts.c.version + 1
+        await db.execute(
+            update(posts).where(posts.c.id == bindparam("post_key")).values(values),
+            [{"post_key": post_id, **{f"delta_{name}": counters.get(name, 0) for name in columns}} for post_id, counters in deltas.items()],
+        )
@@ -0,0 +1,180 @@
+"""
+Cấu hình database dùng chung cho 2 app: chọn driver async và profile tuning cho engine
+
+Engine dựng ở đây được ghi nhớ: process con sau os.fork() (vd worker của gunicorn --preload)
+bỏ pool kế thừa từ process cha và mở connection mới khi cần, không dùng chung socket/file SQLite.
+"""
+
+import os
+import weakref
+
+from sqlalchemy import create_engine, event, insert, make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
+
+# Driver async tương ứng với từng loại DATABASE_URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+SQLITE_PRAGMAS = ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size")
+POOL_SETTINGS = ("pool_size", "max_overflow")
+
+# Chọn bằng DB_PROFILE; từng giá trị ghi đè được bằng DB_<TÊN>, vd DB_BUSY_TIMEOUT=10000
+ENGINE_PROFILES = {
+    # Mặc định của SQLite/SQLAlchemy, như trước đây
+    "default": {},
+    # WAL: reader không chặn writer; NORMAL: bớt fsync; busy_timeout: chờ lock thay vì "database is locked"
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,  # số âm tính bằng KiB, ~64MB mỗi connection
+        "pool_size": 10,
+        "max_overflow": 20,
+    },
+}
+
+
+# Engine sync (với engine async là sync_engine bên trong) đã dựng trong process này
+_engines = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    # close=False: không đóng connection của process cha, chỉ bỏ pool cũ ở process con
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def dialect_name(url):
+    """Tên dialect của DATABASE_URL (sqlite, postgresql...) mà không cần dựng engine"""
+    return make_url(url).get_backend_name()
+
+
+def async_database_url(url):
+    """Đổi DATABASE_URL sang driver async: aiosqlite cho SQLite, asyncpg cho Postgres"""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        return url
+    return f"{ASYNC_DRIVERS[dialect]}{sep}{rest}"
+
+
+def insert_ignore(dialect, table):
+    """INSERT ... ON CONFLICT DO NOTHING: rowcount = 0 nghĩa là khoá đã tồn tại"""
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def engine_settings(profile=None, sync=False):
+    name = profile or os.getenv("DB_PROFILE", "default")
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE: {name}")
+    settings = dict(ENGINE_PROFILES[name])
+    for key in SQLITE_PRAGMAS + POOL_SETTINGS:
+        value = os.getenv(f"DB_{key.upper()}")
+        if value is not None:
+            settings[key] = value
+    # Engine sync có pool riêng, vd DB_SYNC_POOL_SIZE=1 khi chỉ dùng lúc khởi động
+    for key in POOL_SETTINGS if sync else ():
+        value = os.getenv(f"DB_SYNC_{key.upper()}")
+        if value is not None:
+            settings[key] = value
+    return settings
+
+
+def worker_pool_settings(budget, workers):
+    """Chia ngân sách connection toàn cục cho từng worker: 1 cho engine sync, phần còn lại cho engine async
+    (một nửa giữ sẵn trong pool, nửa kia là overflow mở khi tải cao rồi đóng)"""
+    per_worker = budget // workers
+    if per_worker < 2:
+        raise ValueError(f"DB connection budget {budget} is too small for {workers} workers (need 2 per worker)")
+    async_connections = per_worker - 1
+    pool_size = max(1, async_connections // 2)
+    return {"pool_size": pool_size, "max_overflow": async_connections - pool_size}
+
+
+def _is_sqlite_memory(url):
+    return url.startswith("sqlite") and (":memory:" in url or url.endswith("://"))
+
+
+def _engine_kwargs(url, settings):
+    # SQLite in-memory dùng pool riêng, không nhận pool_size/max_overflow
+    if _is_sqlite_memory(url):
+        return {}
+    return {key: int(settings[key]) for key in POOL_SETTINGS if key in settings}
+
+
+def _listen_pragmas(sync_engine, settings):
+    pragmas = [(name, settings[name]) for name in SQLITE_PRAGMAS if name in settings]
+    if sync_engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def build_engine(url, profile=None):
+    """Engine sync cho khởi tạo schema, CLI và script"""
+    settings = engine_settings(profile, sync=True)
+    kwargs = _engine_kwargs(url, settings)
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+    engine = create_engine(url, **kwargs)
+    _listen_pragmas(engine, settings)
+    _engines.add(engine)
+    return engine
+
+
+def build_async_engine(url, profile=None):
+    """Engine async phục vụ request"""
+    url = async_database_url(url)
+    settings = engine_settings(profile)
+    engine = create_async_engine(url, **_engine_kwargs(url, settings))
+    _listen_pragmas(engine.sync_engine, settings)
+    _engines.add(engine.sync_engine)
+    return engine
+
+
+class Engines:
+    """Engine sync (tạo bảng, CLI) và async (request) của một app, dựng lười ở lần open() đầu:
+    import main không mở connection nào"""
+
+    def __init__(self, url, sessions, async_sessions):
+        self.url = url
+        self.dialect = dialect_name(url)
+        self.sessions = sessions
+        self.async_sessions = async_sessions
+        self.engine = self.async_engine = None
+
+    def open(self, query_tracker=None, metrics=None):
+        """Lần đầu: dựng 2 engine, bind các sessionmaker, gắn đếm SQL/metrics pool; luôn trả lại engine sync"""
+        if self.engine is None:
+            self.engine = build_engine(self.url)
+            self.async_engine = build_async_engine(self.url)
+            self.sessions.configure(bind=self.engine)
+            self.async_sessions.configure(bind=self.async_engine)
+            if query_tracker:
+                query_tracker.instrument(self.engine, self.async_engine)
+            if metrics:
+                metrics.add_pool("sync", self.engine)
+                metrics.add_pool("async", self.async_engine)
+        return self.engine
+
+    async def dispose(self):
+        await self.async_engine.dispose()
+        self.engine.dispose()
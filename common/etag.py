@@ -0,0 +1,57 @@
+"""
+GET có điều kiện (If-None-Match -> 304): validator dựng từ version/watermark đọc bằng một câu SQL nhỏ,
+khớp thì trả 304 ngay, không dựng object ORM và không serialize JSON.
+
+ETag là weak (W/"..."): tính từ dữ liệu nguồn chứ không phải từ bytes của response, nên chỉ hứa
+"tương đương về nội dung". Cache-Control: no-cache để client giữ bản cũ nhưng luôn hỏi lại server.
+"""
+
+import hashlib
+
+from fastapi import Response
+
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts):
+    """parts phải repr ổn định (số, chuỗi, datetime, tuple/list của chúng)"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match, etag):
+    """So sánh weak như RFC 9110 yêu cầu với If-None-Match: bỏ tiền tố W/ ở cả hai phía"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def conditional(response, if_none_match, *parts):
+    """Gắn ETag vào response; client đã có đúng bản này thì trả Response 304 để route return luôn, ngược lại None"""
+    etag = make_etag(*parts)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return None
+
+
+class PostPageVersions:
+    """await versions(db, page): validator của một trang posts, gồm id và version của post, version của tác giả,
+    counters còn chờ ghi (pending_counters(post_id) của write-behind). Cùng điều kiện/thứ tự/limit với page
+    nhưng chỉ đọc vài cột, không dựng object ORM"""
+
+    def __init__(self, post_model, user_model, pending_counters):
+        self.post_model = post_model
+        self.user_model = user_model
+        self.pending_counters = pending_counters
+
+    async def __call__(self, db, page):
+        Post, User = self.post_model, self.user_model
+        rows = (await db.execute(
+            page.with_only_columns(Post.id, Post.version, User.version).join_from(Post, User, User.id == Post.author_id)
+        )).all()
+        return [(*row, sorted(self.pending_counters(row[0]).items())) for row in rows]
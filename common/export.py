@@ -0,0 +1,158 @@
+"""
+Xuất dữ liệu dạng stream: đọc theo lô bằng yield_per (server-side cursor), mỗi lô ghi ra một chunk,
+nên bộ nhớ giữ cố định theo kích thước lô dù bảng lớn cỡ nào.
+
+- ndjson(): query ORM, mỗi object qua schema Pydantic thành một dòng JSON (vd users)
+- records(): query chọn cột (select(Post.id, ..., User.username)), mỗi dòng thành NDJSON hoặc CSV
+  không qua ORM/Pydantic; dùng cho route và cho CLI export_data.py (engine sync)
+
+Generator tự mở session riêng: stream chạy sau khi route đã return, lúc đó session của
+Depends(get_db) có thể đã đóng.
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+from sqlalchemy import select
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return getattr(value, "value", value)  # Enum -> giá trị
+
+
+class NdjsonEncoder:
+    media_type = NDJSON_MEDIA_TYPE
+
+    def header(self, keys):
+        return ""
+
+    def rows(self, keys, rows):
+        return "".join(json.dumps(dict(zip(keys, row)), default=_plain, ensure_ascii=False) + "\n" for row in rows)
+
+
+class CsvEncoder:
+    media_type = CSV_MEDIA_TYPE
+
+    def __init__(self):
+        self.buf = io.StringIO()
+        self.writer = csv.writer(self.buf, lineterminator="\n")
+
+    def header(self, keys):
+        self.writer.writerow(keys)
+        return self._take()
+
+    def rows(self, keys, rows):
+        self.writer.writerows([_plain(value) for value in row] for row in rows)
+        return self._take()
+
+    def _take(self):
+        chunk = self.buf.getvalue()
+        self.buf.seek(0)
+        self.buf.truncate()
+        return chunk
+
+
+ENCODERS = {"ndjson": NdjsonEncoder, "csv": CsvEncoder}
+
+
+async def stream_rows(session_factory, query, chunk_size=1000):
+    """Các lô (list) object của query ORM, mỗi lô tối đa chunk_size dòng"""
+    async with session_factory() as db:
+        result = await db.stream_scalars(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+
+
+async def ndjson(session_factory, query, schema, chunk_size=1000):
+    """Mỗi dòng một JSON theo schema (Pydantic, from_attributes)"""
+    async for rows in stream_rows(session_factory, query, chunk_size):
+        yield "".join(schema.model_validate(row).model_dump_json() + "\n" for row in rows)
+
+
+async def records(session_factory, query, format="ndjson", chunk_size=1000):
+    """Query chọn cột -> NDJSON (key là tên cột) hoặc CSV (dòng đầu là tên cột)"""
+    encoder = ENCODERS[format]()
+    async with session_factory() as db:
+        result = await db.stream(query.execution_options(yield_per=chunk_size))
+        keys = list(result.keys())
+        header = encoder.header(keys)
+        if header:
+            yield header
+        async for rows in result.partitions():
+            yield encoder.rows(keys, rows)
+
+
+class PostsExportQuery:
+    """posts_query(forum_id, author_id, since, until) của /api/export/posts và export_data.py.
+    Counters lấy từ cột đã lưu sẵn trên posts (counter_columns của từng app), không đếm lại"""
+
+    def __init__(self, post_model, user_model, forum_model, counter_columns):
+        self.post_model = post_model
+        self.user_model = user_model
+        self.forum_model = forum_model
+        self.counter_columns = counter_columns
+
+    def __call__(self, forum_id=None, author_id=None, since=None, until=None):
+        Post, User, Forum = self.post_model, self.user_model, self.forum_model
+        query = select(
+            Post.id, Post.title, Post.content, Post.image_url,
+            Post.author_id, User.username.label("author_username"),
+            Post.forum_id, Forum.name.label("forum_name"),
+            *[getattr(Post, name) for name in self.counter_columns],
+            Post.created_at, Post.updated_at,
+        ).join(User, User.id == Post.author_id).join(Forum, Forum.id == Post.forum_id)
+        if forum_id is not None:
+            query = query.where(Post.forum_id == forum_id)
+        if author_id is not None:
+            query = query.where(Post.author_id == author_id)
+        if since is not None:
+            query = query.where(Post.created_at >= since)
+        if until is not None:
+            query = query.where(Post.created_at < until)
+        # Cũ nhất trước, đi theo các index (filter, created_at, id) của posts
+        return query.order_by(Post.created_at, Post.id)
+
+
+def write_records(engine, query, fp, format="ndjson", chunk_size=10000):
+    """Bản sync của records() cho CLI, trả về số dòng đã ghi"""
+    encoder = ENCODERS[format]()
+    count = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(query)
+        keys = list(result.keys())
+        fp.write(encoder.header(keys))
+        for rows in result.partitions():
+            fp.write(encoder.rows(keys, rows))
+            count += len(rows)
+    return count
+
+
+def run_cli(engine, posts_query):
+    """CLI export_data.py của mỗi app; posts_query(forum_id, author_id, since, until) dựng query như route /api/export/posts"""
+    parser = argparse.ArgumentParser(description="Xuất posts từ DATABASE_URL ra NDJSON/CSV theo luồng")
+    parser.add_argument("--format", choices=ENCODERS, default="ndjson")
+    parser.add_argument("--forum-id", type=int)
+    parser.add_argument("--author-id", type=int)
+    parser.add_argument("--since", type=datetime.fromisoformat, help="chỉ lấy post tạo từ thời điểm này (ISO)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="chỉ lấy post tạo trước thời điểm này (ISO)")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("-o", "--output", default="-", help="file đích, - là stdout")
+    args = parser.parse_args()
+
+    query = posts_query(args.forum_id, args.author_id, args.since, args.until)
+    if args.output == "-":
+        count = write_records(engine, query, sys.stdout, args.format, args.chunk_size)
+    else:
+        with open(args.output, "w", encoding="utf-8", newline="") as fp:
+            count = write_records(engine, query, fp, args.format, args.chunk_size)
+    # stdout có thể là dữ liệu xuất ra, thông báo ghi vào stderr
+    print(f"✅ Đã xuất {count} posts", file=sys.stderr)
@@ -0,0 +1,139 @@
+"""
+Đếm câu SQL và thời gian DB theo từng request, phát hiện N+1.
+
+Engine event (before/after_cursor_execute) ghi vào thống kê của request hiện tại qua contextvar,
+nên chạy được với cả engine async (event chạy trong greenlet nhưng vẫn thấy context của request).
+Câu SQL được chuẩn hoá (bỏ literal, gộp IN (...)) thành "shape"; một request chạy cùng một shape
+quá `threshold` lần là dấu hiệu N+1 (lazy load trong vòng lặp): ghi log và đưa vào report.
+"""
+
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from sqlalchemy import event
+
+logger = logging.getLogger("forum.sql")
+
+_current = contextvars.ContextVar("query_stats", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"\?|%\(\w+\)s|\$\d+|:\w+")
+_IN_LIST = re.compile(r"\bIN \((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(statement):
+    """SELECT ... WHERE id = 5 / id = ? / id IN (?, ?, ?) -> cùng một shape"""
+    shape = _STRING.sub("?", statement)
+    shape = _PARAM.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("IN (...)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds", "shapes", "started")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.shapes = Counter()
+        self.started = None
+
+
+class QueryTracker:
+    """Gắn vào engine + app: số SQL, thời gian DB theo route và danh sách route bị N+1"""
+
+    def __init__(self, threshold=5, recent=100):
+        self.threshold = threshold
+        self.routes = {}
+        self.offenders = deque(maxlen=recent)
+        self.lock = threading.Lock()
+        self.shape_cache = {}
+
+    def instrument(self, *engines):
+        for engine in engines:
+            sync_engine = getattr(engine, "sync_engine", engine)
+            event.listen(sync_engine, "before_cursor_execute", self._before)
+            event.listen(sync_engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is not None:
+            stats.started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is None:
+            return
+        if stats.started is not None:
+            stats.db_seconds += time.perf_counter() - stats.started
+            stats.started = None
+        stats.statements += 1
+        shape = self.shape_cache.get(statement)
+        if shape is None:
+            # Câu do SQLAlchemy sinh ra lặp lại nguyên văn, cache để không chạy regex mỗi lần
+            shape = self.shape_cache[statement] = normalize_sql(statement)
+            if len(self.shape_cache) > 10000:
+                self.shape_cache.clear()
+        stats.shapes[shape] += 1
+
+    def middleware(self, app):
+        """Đăng ký HTTP middleware vào FastAPI app"""
+
+        @app.middleware("http")
+        async def track_queries(request, call_next):
+            stats = RequestStats()
+            token = _current.set(stats)
+            try:
+                response = await call_next(request)
+            finally:
+                _current.reset(token)
+            route = request.scope.get("route")
+            self.record(f"{request.method} {route.path if route else request.url.path}", stats)
+            response.headers["X-Query-Count"] = str(stats.statements)
+            return response
+
+    def record(self, route, stats):
+        repeated = {shape: count for shape, count in stats.shapes.items() if count > self.threshold}
+        with self.lock:
+            summary = self.routes.get(route)
+            if summary is None:
+                summary = self.routes[route] = {
+                    "requests": 0, "statements": 0, "max_statements": 0, "db_ms": 0.0, "n_plus_one": {},
+                }
+            summary["requests"] += 1
+            summary["statements"] += stats.statements
+            summary["max_statements"] = max(summary["max_statements"], stats.statements)
+            summary["db_ms"] += stats.db_seconds * 1000
+            for shape, count in repeated.items():
+                summary["n_plus_one"][shape] = max(summary["n_plus_one"].get(shape, 0), count)
+            if repeated:
+                self.offenders.append({"route": route, "at": time.time(), "statements": stats.statements, "repeated": repeated})
+        for shape, count in repeated.items():
+            logger.warning("N+1 in %s: %d x %s", route, count, shape)
+
+    def report(self):
+        """Dữ liệu cho /debug/queries: route nhiều SQL nhất trước"""
+        with self.lock:
+            routes = {
+                route: {
+                    "requests": summary["requests"],
+                    "avg_statements": round(summary["statements"] / summary["requests"], 2),
+                    "max_statements": summary["max_statements"],
+                    "avg_db_ms": round(summary["db_ms"] / summary["requests"], 3),
+                    "n_plus_one": dict(summary["n_plus_one"]),
+                }
+                for route, summary in sorted(self.routes.items(), key=lambda item: -item[1]["max_statements"])
+            }
+            return {"threshold": self.threshold, "routes": routes, "recent_offenders": list(self.offenders)}
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+            self.offenders.clear()
@@ -0,0 +1,78 @@
+"""
+Đo thời gian khởi động của app theo từng bước, in một dòng khi xong và xuất ở /metrics (startup_seconds)
+
+- import: chạy thân main.py (khai báo model, route...), tính từ lúc tạo timer, không gồm import thư viện
+- engines, migrate, trending...: các bước trong lifespan của mỗi worker hoặc lệnh CLI
+
+Số liệu tính riêng cho từng worker process. worker_lifespan() là lifespan chung của 2 app.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+
+class StartupTimer:
+    def __init__(self, app_name):
+        self.app_name = app_name
+        self.created = time.perf_counter()
+        self.phases = {}  # bước -> giây, theo thứ tự chạy
+
+    def imported(self):
+        """Gọi ở cuối main.py"""
+        self.phases["import"] = time.perf_counter() - self.created
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def report(self):
+        steps = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        print(f"[{self.app_name}] pid {os.getpid()} khởi động {sum(self.phases.values()) * 1000:.0f}ms ({steps})")
+
+
+async def refresh_periodically(refresh, seconds):
+    """Gọi refresh (sync) trong thread mỗi `seconds` giây, lỗi chỉ in ra, không dừng vòng lặp"""
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await asyncio.to_thread(refresh)
+        except Exception as e:
+            print(f"Trending refresh error: {e}")
+
+
+def worker_lifespan(startup, open_engines, migrate, warm_trending, refresh_seconds, buffers, engines):
+    """Lifespan của từng worker: engine, migrate (migrate=None: đã chạy `python main.py --migrate` trước),
+    nạp trending rồi dựng lại mỗi refresh_seconds (0: chỉ lúc khởi động);
+    khi tắt: flush các write-behind buffer (None: đang tắt) rồi đóng pool"""
+
+    @asynccontextmanager
+    async def lifespan(app):
+        with startup.phase("engines"):
+            open_engines()
+        # Không làm sập server nếu DB chưa sẵn sàng lúc khởi động
+        try:
+            if migrate:
+                with startup.phase("migrate"):
+                    migrate()
+            with startup.phase("trending"):
+                warm_trending()
+        except Exception as e:
+            print(f"Database initialization error: {e}")
+        startup.report()
+        refresher = asyncio.create_task(refresh_periodically(warm_trending, refresh_seconds)) if refresh_seconds > 0 else None
+        yield
+        if refresher:
+            refresher.cancel()
+            await asyncio.gather(refresher, return_exceptions=True)
+        for buffer in buffers:
+            if buffer:
+                await buffer.close()
+        await engines.dispose()
+
+    return lifespan
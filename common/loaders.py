@@ -0,0 +1,82 @@
+"""
+Dựng response cho một trang posts/comments mà không N+1: tác giả của cả trang lấy bằng 1 query IN,
+trả lời xem trước của mọi thread lấy chung 1 query (row_number theo thread).
+
+Model và schema là của từng app, truyền vào lúc tạo loader; phần khác nhau giữa 2 app (vd votes_count
+của Profile, counters còn chờ ghi trong write-behind buffer) nằm trong hàm build của PostLoader.
+"""
+
+from sqlalchemy import func, select
+
+from common.pagination import encode_cursor
+
+
+async def load_authors(db, user_model, user_schema, author_ids):
+    """{user_id: user_schema} của các tác giả"""
+    if not author_ids:
+        return {}
+    return {u.id: user_schema.model_validate(u) for u in await db.scalars(select(user_model).where(user_model.id.in_(author_ids)))}
+
+
+class PostLoader:
+    """await loader(db, posts) -> [build(post, author), ...]"""
+
+    def __init__(self, user_model, user_schema, build):
+        self.user_model = user_model
+        self.user_schema = user_schema
+        self.build = build
+
+    async def __call__(self, db, posts):
+        authors = await load_authors(db, self.user_model, self.user_schema, {p.author_id for p in posts})
+        return [self.build(p, authors[p.author_id]) for p in posts]
+
+
+class CommentLoader:
+    def __init__(self, comment_model, user_model, user_schema, comment_schema, thread_schema):
+        self.comment_model = comment_model
+        self.user_model = user_model
+        self.user_schema = user_schema
+        self.comment_schema = comment_schema
+        self.thread_schema = thread_schema
+
+    async def responses(self, db, comments):
+        authors = await load_authors(db, self.user_model, self.user_schema, {c.author_id for c in comments})
+        return [self.comment_schema(
+            id=c.id,
+            content=c.content,
+            author=authors[c.author_id],
+            post_id=c.post_id,
+            parent_id=c.parent_id,
+            reply_count=c.reply_count,
+            created_at=c.created_at
+        ) for c in comments]
+
+    async def threads(self, db, comments, reply_limit: int):
+        """Comment gốc kèm reply_limit trả lời đầu tiên (cũ nhất trước) của mỗi thread, mọi thread chung 1 query"""
+        Comment = self.comment_model
+        replies = []
+        thread_ids = [c.id for c in comments if c.reply_count]
+        if thread_ids and reply_limit > 0:
+            ranked = select(
+                Comment.id,
+                func.row_number().over(partition_by=Comment.parent_id, order_by=(Comment.created_at, Comment.id)).label("rank")
+            ).where(Comment.parent_id.in_(thread_ids)).subquery()
+            replies = (await db.scalars(
+                select(Comment).join(ranked, ranked.c.id == Comment.id).where(ranked.c.rank <= reply_limit).order_by(Comment.created_at, Comment.id)
+            )).all()
+
+        # Authors của comment gốc và trả lời lấy chung 1 query
+        responses = await self.responses(db, [*comments, *replies])
+        by_thread = {}
+        for reply in responses[len(comments):]:
+            by_thread.setdefault(reply.parent_id, []).append(reply)
+        threads = []
+        for comment in responses[:len(comments)]:
+            thread_replies = by_thread.get(comment.id, [])
+            more = thread_replies and comment.reply_count > len(thread_replies)
+            threads.append(self.thread_schema(
+                **dict(comment),
+                replies=thread_replies,
+                replies_cursor=encode_cursor(thread_replies[-1].created_at, thread_replies[-1].id) if more else None
+            ))
+        return threads
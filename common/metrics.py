@@ -0,0 +1,178 @@
+"""
+Metrics dạng Prometheus text cho 2 app: /metrics
+
+- http_requests_total, http_request_errors_total, http_requests_in_progress
+- http_request_duration_seconds: histogram theo method + route (đường dẫn mẫu, vd /api/posts/{post_id})
+- db_pool_*: số connection đang mượn/overflow/size của từng engine, đọc lúc scrape
+- collector tuỳ ý (vd hit/miss của cache, thời gian khởi động) đăng ký bằng add_collector
+
+Ghi nhận không dùng lock: mọi request chạy trên một event loop, mỗi lần ghi chỉ là vài phép
+cộng trên dict/list không có await xen giữa. Số liệu tính riêng cho từng worker process.
+"""
+
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Giây; đủ mịn cho route đọc vài ms và route ghi vài trăm ms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self, app_name, buckets=DEFAULT_BUCKETS):
+        self.const_labels = (("app", app_name),)
+        self.buckets = tuple(buckets)
+        self.requests = {}  # (method, route, status) -> count
+        self.errors = {}  # (method, route) -> count
+        self.in_progress = 0
+        self.durations = {}  # (method, route) -> [bucket counts..., +Inf count, sum]
+        self.pools = []
+        self.collectors = []
+
+    # ---- ghi nhận ----
+
+    def observe(self, method, route, status, seconds):
+        key = (method, route)
+        self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+        if status >= 500:
+            self.errors[key] = self.errors.get(key, 0) + 1
+        histogram = self.durations.get(key)
+        if histogram is None:
+            histogram = self.durations[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def middleware(self, app):
+        """Đăng ký HTTP middleware vào FastAPI app"""
+
+        @app.middleware("http")
+        async def collect_metrics(request, call_next):
+            self.in_progress += 1
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await call_next(request)
+                status = response.status_code
+                return response
+            finally:
+                self.in_progress -= 1
+                # Chỉ dùng đường dẫn mẫu làm label, URL lạ không làm phình số series
+                route = request.scope.get("route")
+                self.observe(request.method, route.path if route else "unmatched", status, time.perf_counter() - started)
+
+    def add_pool(self, name, engine):
+        self.pools.append((name, getattr(engine, "sync_engine", engine).pool))
+
+    def add_collector(self, collect):
+        """collect() -> [(tên, loại, mô tả, [(labels dict, giá trị), ...]), ...]"""
+        self.collectors.append(collect)
+
+    # ---- xuất ----
+
+    def families(self):
+        labels = self.const_labels
+        yield "http_requests_total", "counter", "HTTP requests theo method, route và status", [
+            (labels + (("method", method), ("route", route), ("status", status)), count)
+            for (method, route, status), count in list(self.requests.items())
+        ]
+        yield "http_request_errors_total", "counter", "HTTP requests trả về 5xx hoặc lỗi", [
+            (labels + (("method", method), ("route", route)), count)
+            for (method, route), count in list(self.errors.items())
+        ]
+        yield "http_requests_in_progress", "gauge", "HTTP requests đang xử lý", [(labels, self.in_progress)]
+
+        samples = []
+        for (method, route), histogram in list(self.durations.items()):
+            route_labels = labels + (("method", method), ("route", route))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram):
+                cumulative += count
+                samples.append(("_bucket", route_labels + (("le", _value(bound)),), cumulative))
+            samples.append(("_sum", route_labels, histogram[-1]))
+            samples.append(("_count", route_labels, cumulative))
+        yield "http_request_duration_seconds", "histogram", "Thời gian xử lý request", samples
+
+        pool_gauges = {"checked_out": [], "checked_in": [], "overflow": [], "size": []}
+        for name, pool in self.pools:
+            if not hasattr(pool, "checkedout"):
+                continue  # NullPool/StaticPool không có số liệu
+            pool_labels = labels + (("engine", name),)
+            pool_gauges["checked_out"].append((pool_labels, pool.checkedout()))
+            pool_gauges["checked_in"].append((pool_labels, pool.checkedin()))
+            pool_gauges["overflow"].append((pool_labels, max(pool.overflow(), 0)))
+            pool_gauges["size"].append((pool_labels, pool.size()))
+        for name, samples in pool_gauges.items():
+            yield f"db_pool_{name}", "gauge", f"Connection pool: {name.replace('_', ' ')}", samples
+
+        for collect in self.collectors:
+            for name, kind, description, samples in collect():
+                yield name, kind, description, [(labels + tuple(sample_labels.items()), value) for sample_labels, value in samples]
+
+    def render(self):
+        lines = []
+        for name, kind, description, samples in self.families():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample in samples:
+                if len(sample) == 3:  # histogram: (hậu tố, labels, giá trị)
+                    suffix, labels, value = sample
+                else:
+                    suffix, (labels, value) = "", sample
+                lines.append(f"{name}{suffix}{_labels(labels)} {_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def cache_collector(name, cache):
+    """Hit/miss/hit ratio của một cache trong common/cache.py"""
+
+    def collect():
+        stats = cache.stats()
+        labels = {"cache": name, "backend": stats["backend"]}
+        return [
+            ("cache_hits_total", "counter", "Cache hits", [(labels, stats["hits"])]),
+            ("cache_misses_total", "counter", "Cache misses", [(labels, stats["misses"])]),
+            ("cache_hit_ratio", "gauge", "Tỉ lệ hit của cache", [(labels, stats["hit_ratio"])]),
+        ]
+
+    return collect
+
+
+def writebehind_collector(name, buffer):
+    """Số khoá đang chờ ghi, số lần flush và số toggle được gộp của một ToggleBuffer"""
+
+    def collect():
+        stats = buffer.stats()
+        labels = {"buffer": name}
+        return [
+            ("writebehind_pending", "gauge", "Số khoá đang chờ ghi", [(labels, stats["pending"] + stats["in_flight"])]),
+            ("writebehind_flushes_total", "counter", "Số lần flush thành công", [(labels, stats["flushes"])]),
+            ("writebehind_coalesced_total", "counter", "Số toggle gộp vào khoá đang chờ", [(labels, stats["coalesced"])]),
+        ]
+
+    return collect
+
+
+def startup_collector(timer):
+    """Thời gian từng bước khởi động của một StartupTimer trong common/lifecycle.py"""
+
+    def collect():
+        return [("startup_seconds", "gauge", "Thời gian khởi động theo bước", [({"phase": name}, seconds) for name, seconds in timer.phases.items()])]
+
+    return collect
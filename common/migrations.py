@@ -0,0 +1,89 @@
+"""
+Tạo bảng và nâng cấp DB cũ cho 2 app: `python main.py --migrate`, hoặc trong lifespan nếu AUTO_MIGRATE=1.
+
+create_all không sửa bảng đã tồn tại nên các cột/index thêm sau được bù ở đây. Phần khác nhau giữa
+2 app (cột counters, bảng toggle like/vote, hàm tính lại counters) truyền vào lúc tạo Migrations.
+"""
+
+from sqlalchemy import delete, func, inspect, select, text
+from sqlalchemy.orm import Session
+
+
+class Migrations:
+    def __init__(self, metadata, counter_columns, toggle_models, recount, search_index):
+        self.metadata = metadata
+        self.counter_columns = counter_columns  # {bảng: (cột counter, ...)}
+        self.toggle_models = toggle_models  # model có unique ux_<bảng>_user_post
+        self.recount = recount  # recount(db: Session): tính lại counters từ bảng con rồi commit
+        self.search_index = search_index
+
+    def run(self, engine):
+        self.metadata.create_all(bind=engine)
+        self.add_missing_thread_columns(engine)
+        self.add_missing_version_columns(engine)
+        self.add_missing_counter_columns(engine)
+        self.dedupe_toggle_rows(engine)
+        self.create_missing_indexes(engine)
+        self.create_search_index(engine)
+        return engine
+
+    def _recount(self, engine):
+        with Session(engine) as db:
+            self.recount(db)
+
+    def dedupe_toggle_rows(self, engine):
+        """DB cũ chưa có unique (user_id, post_id): xoá like/vote trùng (giữ dòng mới nhất) để tạo được index,
+        rồi tính lại counters vì các dòng trùng đã bị đếm"""
+        removed = 0
+        for model in self.toggle_models:
+            table = model.__tablename__
+            inspector = inspect(engine)
+            if not inspector.has_table(table) or f"ux_{table}_user_post" in {index["name"] for index in inspector.get_indexes(table)}:
+                continue
+            latest = select(func.max(model.id)).group_by(model.user_id, model.post_id)
+            with engine.begin() as conn:
+                removed += conn.execute(delete(model).where(model.id.not_in(latest))).rowcount
+        if removed:
+            print(f"Removed {removed} duplicate likes/votes")
+            self._recount(engine)
+
+    def create_missing_indexes(self, engine):
+        """create_all không thêm index mới vào bảng đã tồn tại, tạo bù ở đây"""
+        for table in self.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+
+    def add_missing_counter_columns(self, engine):
+        """DB cũ chưa có cột counters: thêm cột rồi tính lại từ bảng con"""
+        inspector = inspect(engine)
+        missing = []
+        for table, columns in self.counter_columns.items():
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            missing += [(table, name) for name in columns if name not in existing]
+        if not missing:
+            return
+        with engine.begin() as conn:
+            for table, name in missing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"))
+        self._recount(engine)
+
+    def add_missing_version_columns(self, engine):
+        """DB cũ chưa có cột version (validator cho ETag): thêm với giá trị 0"""
+        missing = [table for table in ("posts", "users") if "version" not in {column["name"] for column in inspect(engine).get_columns(table)}]
+        with engine.begin() as conn:
+            for table in missing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
+    def add_missing_thread_columns(self, engine):
+        """DB cũ chưa có parent_id/reply_count: comment cũ đều là comment gốc chưa có trả lời"""
+        existing = {column["name"] for column in inspect(engine).get_columns("comments")}
+        with engine.begin() as conn:
+            if "parent_id" not in existing:
+                conn.execute(text("ALTER TABLE comments ADD COLUMN parent_id INTEGER REFERENCES comments(id)"))
+            if "reply_count" not in existing:
+                conn.execute(text("ALTER TABLE comments ADD COLUMN reply_count INTEGER NOT NULL DEFAULT 0"))
+
+    def create_search_index(self, engine):
+        """search_index (FTS5/tsvector) nằm ngoài metadata: tạo riêng, lần đầu thì index dữ liệu cũ"""
+        if self.search_index.create(engine):
+            self.search_index.rebuild(engine)
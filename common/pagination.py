@@ -0,0 +1,58 @@
+"""
+Keyset pagination dùng chung cho 2 app: cursor mờ từ (created_at, id) của dòng cuối trang,
+trang kế tiếp seek theo index (created_at, id) thay vì OFFSET; header X-Next-Cursor khi trang đầy
+"""
+
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Cursor mờ (opaque) từ cặp (created_at, id) của dòng cuối trang"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(query, created_col, id_col, cursor: Optional[str], limit: int, skip: int = 0, ascending: bool = False):
+    """Sắp xếp mới nhất trước (ascending=True: cũ nhất trước); có cursor thì seek theo index, không thì offset như cũ"""
+    if ascending:
+        query = query.order_by(created_col, id_col)
+    else:
+        query = query.order_by(created_col.desc(), id_col.desc())
+    if cursor:
+        key, after = tuple_(created_col, id_col), tuple_(*decode_cursor(cursor))
+        query = query.filter(key > after if ascending else key < after)
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def set_next_cursor(response: Response, rows, limit: Optional[int], key=lambda row: (row.created_at, row.id)):
+    """Trang đầy thì trả cursor của trang kế tiếp qua header X-Next-Cursor"""
+    if limit and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(*key(rows[-1]))
+
+
+def parse_ids(raw: str, max_ids: int) -> List[int]:
+    """"1,2,3" -> [1, 2, 3], bỏ trùng, giữ thứ tự"""
+    try:
+        ids = list(dict.fromkeys(int(part) for part in raw.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+    if len(ids) > max_ids:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {max_ids})")
+    return ids
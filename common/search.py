@@ -0,0 +1,196 @@
+"""
+Tìm kiếm full-text trên posts và comments: FTS5 trên SQLite, tsvector + GIN trên Postgres.
+
+Văn bản được bỏ dấu tiếng Việt trước khi đưa vào index và trước khi tìm ("Bóng đá" -> "bong da"),
+kể cả đ/Đ mà bộ tách từ của SQLite/Postgres không tự bỏ dấu. Index chỉ giữ bản đã bỏ dấu,
+nội dung gốc đọc lại từ bảng posts/comments.
+
+Mỗi document có doc_id = id * 2 (post) hoặc id * 2 + 1 (comment) để thêm/xoá theo khoá.
+Xếp hạng: bm25 của FTS5 (title nặng hơn body), ts_rank_cd trên Postgres.
+"""
+
+import re
+import unicodedata
+
+from sqlalchemy import select, text
+
+POST = "post"
+COMMENT = "comment"
+
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+_TOKEN = re.compile(r"\w+")
+
+
+def fold(value):
+    """Bỏ dấu và viết thường: "Bóng Đá" -> "bong da" """
+    if not value:
+        return ""
+    value = value.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", value)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def doc_id(kind, ref_id):
+    return ref_id * 2 + (1 if kind == COMMENT else 0)
+
+
+class SearchIndex:
+    def __init__(self, dialect):
+        self.dialect = dialect
+
+    # ---- schema ----
+
+    def create(self, engine):
+        """Tạo bảng index nếu chưa có; True nếu vừa tạo (cần rebuild từ dữ liệu cũ)"""
+        with engine.begin() as conn:
+            if self.dialect == "postgresql":
+                exists = conn.execute(text("SELECT to_regclass('search_index')")).scalar() is not None
+                conn.execute(text(
+                    "CREATE TABLE IF NOT EXISTS search_index ("
+                    "doc_id BIGINT PRIMARY KEY, kind VARCHAR(10) NOT NULL, post_id INTEGER NOT NULL, document TSVECTOR NOT NULL)"
+                ))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)"))
+            else:
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'search_index'")).first() is not None
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                    "kind UNINDEXED, post_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2')"
+                ))
+        return not exists
+
+    def rebuild(self, engine, chunk_size=10000):
+        """Index lại toàn bộ posts và comments (sau bulk import hoặc khi mới tạo index)"""
+        sources = (
+            (POST, "SELECT id, id, title, content FROM posts"),
+            (COMMENT, "SELECT id, post_id, NULL, content FROM comments"),
+        )
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM search_index"))
+        # Đọc theo keyset trên id, mỗi chunk một transaction: không giữ cursor đọc khi đang ghi
+        for kind, query in sources:
+            last_id = 0
+            while True:
+                with engine.begin() as conn:
+                    rows = conn.execute(text(f"{query} WHERE id > :last_id ORDER BY id LIMIT :limit"), {"last_id": last_id, "limit": chunk_size}).all()
+                    if not rows:
+                        break
+                    conn.execute(self._insert_statement(), [self._params(kind, *row) for row in rows])
+                last_id = rows[-1][0]
+
+    # ---- đồng bộ khi ghi ----
+
+    def _insert_statement(self):
+        if self.dialect == "postgresql":
+            return text(
+                "INSERT INTO search_index (doc_id, kind, post_id, document) VALUES (:doc_id, :kind, :post_id, "
+                "setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :body), 'B'))"
+            )
+        return text("INSERT INTO search_index (rowid, kind, post_id, title, body) VALUES (:doc_id, :kind, :post_id, :title, :body)")
+
+    def _params(self, kind, ref_id, post_id, title, body):
+        return {"doc_id": doc_id(kind, ref_id), "kind": kind, "post_id": post_id, "title": fold(title), "body": fold(body)}
+
+    async def add(self, db, kind, ref_id, post_id, title, body):
+        """Gọi trong transaction tạo post/comment, sau flush để đã có id"""
+        await db.execute(self._insert_statement(), self._params(kind, ref_id, post_id, title, body))
+
+    async def add_many(self, db, docs):
+        """docs: [(kind, ref_id, post_id, title, body)], một câu executemany"""
+        if docs:
+            await db.execute(self._insert_statement(), [self._params(*doc) for doc in docs])
+
+    async def update(self, db, kind, ref_id, post_id, title, body):
+        """Sửa post/comment: thay document cũ trong cùng transaction (FTS5 không có UPSERT)"""
+        await self.remove(db, kind, [ref_id])
+        await self.add(db, kind, ref_id, post_id, title, body)
+
+    async def remove(self, db, kind, ref_ids):
+        if not ref_ids:
+            return
+        key = "doc_id" if self.dialect == "postgresql" else "rowid"
+        await db.execute(
+            text(f"DELETE FROM search_index WHERE {key} = :doc_id"),
+            [{"doc_id": doc_id(kind, ref_id)} for ref_id in ref_ids],
+        )
+
+    # ---- tìm kiếm ----
+
+    def match_query(self, query):
+        """Mọi từ đều phải có, từ cuối khớp tiền tố (gõ tới đâu tìm tới đó)"""
+        tokens = _TOKEN.findall(fold(query))
+        if not tokens:
+            return None
+        if self.dialect == "postgresql":
+            return " & ".join(tokens[:-1] + [tokens[-1] + ":*"])
+        return " ".join([f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*'])
+
+    async def search(self, db, query, kind=None, forum_id=None, category=None, limit=20, offset=0):
+        """[(kind, ref_id, post_id, score)], score cao hơn là khớp hơn.
+        category là giá trị đã lưu trong forums.category (tên enum)."""
+        match = self.match_query(query)
+        if match is None:
+            return []
+
+        params = {"match": match, "limit": limit, "offset": offset}
+        filters = []
+        join = ""
+        if kind:
+            filters.append("search_index.kind = :kind")
+            params["kind"] = kind
+        if forum_id is not None or category is not None:
+            join = "JOIN posts p ON p.id = search_index.post_id JOIN forums f ON f.id = p.forum_id"
+            if forum_id is not None:
+                filters.append("p.forum_id = :forum_id")
+                params["forum_id"] = forum_id
+            if category is not None:
+                filters.append("f.category = :category")
+                params["category"] = category
+        where = "".join(f" AND {condition}" for condition in filters)
+
+        if self.dialect == "postgresql":
+            sql = (
+                "SELECT search_index.kind, search_index.doc_id, search_index.post_id, "
+                "ts_rank_cd(search_index.document, to_tsquery('simple', :match)) AS score "
+                f"FROM search_index {join} WHERE search_index.document @@ to_tsquery('simple', :match){where} "
+                "ORDER BY score DESC, search_index.doc_id DESC LIMIT :limit OFFSET :offset"
+            )
+        else:
+            sql = (
+                "SELECT search_index.kind, search_index.rowid, search_index.post_id, "
+                f"-bm25(search_index, 0, 0, {TITLE_WEIGHT}, {BODY_WEIGHT}) AS score "
+                f"FROM search_index {join} WHERE search_index MATCH :match{where} "
+                "ORDER BY score DESC, search_index.rowid DESC LIMIT :limit OFFSET :offset"
+            )
+        rows = (await db.execute(text(sql), params)).all()
+        return [(kind, doc // 2, post_id, score) for kind, doc, post_id, score in rows]
+
+    async def results(self, db, post_model, comment_model, result_schema, query, kind=None, forum_id=None, category=None, limit=20, offset=0):
+        """Route /api/search: hits kèm tiêu đề post và nội dung gốc (có dấu), 2 query IN cho cả trang.
+        Hit mà post/comment đã bị xoá (index chưa kịp cập nhật) thì bỏ qua"""
+        hits = await self.search(db, query, kind, forum_id, category, limit, offset)
+        if not hits:
+            return []
+
+        Post, Comment = post_model, comment_model
+        post_ids = {post_id for _, _, post_id, _ in hits}
+        comment_ids = [ref_id for hit_kind, ref_id, _, _ in hits if hit_kind == COMMENT]
+        posts = {p.id: p for p in await db.scalars(select(Post).where(Post.id.in_(post_ids)))}
+        comments = {c.id: c for c in await db.scalars(select(Comment).where(Comment.id.in_(comment_ids)))} if comment_ids else {}
+
+        results = []
+        for hit_kind, ref_id, post_id, score in hits:
+            post = posts.get(post_id)
+            comment = comments.get(ref_id) if hit_kind == COMMENT else None
+            if post is None or (hit_kind == COMMENT and comment is None):
+                continue
+            results.append(result_schema(
+                type=hit_kind,
+                id=ref_id,
+                post_id=post_id,
+                title=post.title,
+                content=comment.content if comment else post.content,
+                score=score
+            ))
+        return results
@@ -0,0 +1,115 @@
+"""
+Entrypoint production dùng chung cho 2 app: N worker uvicorn (mặc định số CPU) trên cùng một socket lắng nghe
+
+- Process cha bind socket một lần (host:port, --uds, hoặc --fd có sẵn từ systemd/supervisor) rồi chia cho
+  mọi worker, kernel phân phối connection giữa các worker
+- Process cha không import app: migrate bằng `python main.py --migrate` ở process riêng, rồi chạy worker với
+  AUTO_MIGRATE=0; mỗi worker tự dựng engine và nạp trending trong lifespan (xem main.py, common/lifecycle.py)
+- --db-connections (DB_CONNECTION_BUDGET): tổng số connection DB của mọi worker, chia đều bằng
+  worker_pool_settings trong common/db.py; 0 thì giữ pool của DB_PROFILE cho mỗi worker
+- kill -HUP <pid cha>: migrate lại rồi thay lần lượt từng worker, worker mới sẵn sàng mới dừng worker cũ
+  (request đang chạy có --graceful-timeout giây để xong); migrate lỗi thì giữ nguyên worker cũ
+- State trong bộ nhớ từng worker: trending dựng lại từ DB mỗi TRENDING_REFRESH_SECONDS; WRITE_BEHIND=1 chỉ chạy
+  được với 1 worker; app có cache riêng từng worker (Profile, cache_env="CACHE_URL") cần cache dùng chung
+  khi chạy nhiều worker, không thì chỉ worker nhận request ghi mới xoá được cache cũ
+
+SQLite: nhiều worker cùng ghi một file, nên chạy với DB_PROFILE=production (WAL, busy_timeout).
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from common.db import worker_pool_settings
+
+
+def migrate(app_dir):
+    subprocess.run([sys.executable, os.path.join(app_dir, "main.py"), "--migrate"], check=True)
+
+
+class Supervisor(Multiprocess):
+    """Multiprocess của uvicorn, thêm bước migrate trước khi thay worker lúc nhận SIGHUP (deploy code mới)"""
+
+    def __init__(self, config, sockets, app_dir):
+        super().__init__(config, sockets)
+        self.app_dir = app_dir
+
+    def handle_hup(self):
+        try:
+            migrate(self.app_dir)
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️ Migrate lỗi (exit {e.returncode}), giữ nguyên worker cũ")
+            return
+        super().handle_hup()
+
+
+def check_workers(parser, args, cache_env):
+    """Từ chối cấu hình mà state trong bộ nhớ từng worker làm các worker trả kết quả khác nhau.
+    --workers/WEB_CONCURRENCY đặt rõ thì báo lỗi, còn mặc định (số CPU) thì cảnh báo và chạy 1 worker"""
+    problems = []
+    if os.getenv("WRITE_BEHIND", "0") == "1":
+        problems.append("WRITE_BEHIND=1: toggle chờ flush chỉ nằm trong bộ nhớ worker nhận request")
+    if cache_env and not os.getenv(cache_env):
+        problems.append(f"{cache_env} chưa đặt: mỗi worker có cache LRU riêng, sửa dữ liệu chỉ xoá cache của một worker")
+    if args.workers is None:
+        args.workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+        if args.workers > 1 and problems and "WEB_CONCURRENCY" not in os.environ:
+            print(f"⚠️ Chỉ chạy 1 worker thay vì {args.workers} (số CPU):\n  " + "\n  ".join(problems))
+            args.workers = 1
+    if args.workers > 1 and problems:
+        parser.error(f"không chạy được {args.workers} worker:\n  " + "\n  ".join(problems))
+
+
+def run_cli(app_dir, cache_env=None):
+    """CLI serve.py của mỗi app; cache_env: biến môi trường chứa URL cache dùng chung, nếu app có cache"""
+    parser = argparse.ArgumentParser(description="Chạy app với nhiều worker uvicorn dùng chung một socket")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--uds", help="lắng nghe trên unix socket thay vì host:port")
+    parser.add_argument("--fd", type=int, help="dùng socket đã mở sẵn (file descriptor), vd systemd socket activation")
+    parser.add_argument("--workers", type=int, help="mặc định WEB_CONCURRENCY hoặc số CPU")
+    parser.add_argument("--db-connections", type=int, default=int(os.getenv("DB_CONNECTION_BUDGET", "0")),
+                        help="tổng số connection DB của mọi worker, 0: theo DB_PROFILE")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="số giây chờ request đang chạy khi dừng/thay worker")
+    parser.add_argument("--no-migrate", action="store_true", help="bỏ qua migrate khi khởi động")
+    args = parser.parse_args()
+    check_workers(parser, args, cache_env)
+
+    # Worker là process spawn mới, đọc cấu hình pool từ biến môi trường lúc dựng engine
+    if args.db_connections:
+        try:
+            pool = worker_pool_settings(args.db_connections, args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+        os.environ.update({
+            "DB_POOL_SIZE": str(pool["pool_size"]),
+            "DB_MAX_OVERFLOW": str(pool["max_overflow"]),
+            "DB_SYNC_POOL_SIZE": "1",
+            "DB_SYNC_MAX_OVERFLOW": "0",
+        })
+        print(f"🔌 {args.db_connections} connection cho {args.workers} worker: "
+              f"mỗi worker pool {pool['pool_size']} + overflow {pool['max_overflow']}, 1 cho engine sync")
+    if not args.no_migrate:
+        migrate(app_dir)
+    os.environ["AUTO_MIGRATE"] = "0"
+
+    sys.path.insert(0, app_dir)
+    config = uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        uds=args.uds,
+        fd=args.fd,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    sock = config.bind_socket()
+    try:
+        Supervisor(config, [sock], app_dir).run()
+    finally:
+        if config.uds and os.path.exists(config.uds):
+            os.remove(config.uds)
@@ -0,0 +1,97 @@
+"""
+Toggle like/vote: unique (user_id, post_id) nên không cần SELECT trước khi ghi.
+
+- insert(): INSERT ... SELECT chỉ khi user và post tồn tại, ON CONFLICT DO NOTHING nếu cặp đã có;
+  rowcount = 0 thì conflict() báo 404 hay 409
+- write_likes(): ghi một lô thay đổi {(user_id, post_id): (trước, sau)} của write-behind buffer
+- buffer_like(): toggle like khi bật write-behind, khoá đang chờ ghi không tốn câu SQL nào
+
+Chênh lệch counters luôn tính theo các dòng thực sự bị xoá/chèn (RETURNING), không theo trạng thái
+"trước" đã đọc: khoá mà request/worker khác đã ghi trước không bị đếm hai lần.
+"""
+
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, literal, or_, select
+
+from common.counters import add_delta
+from common.db import insert_ignore
+from common.writebehind import MISSING
+
+
+def user_post_in(model, keys):
+    """(user_id, post_id) IN (...) viết dạng OR của từng cặp: SQLite không dùng index cho row-value IN"""
+    return or_(*[and_(model.user_id == user_id, model.post_id == post_id) for user_id, post_id in keys])
+
+
+def exists_row(model, *criteria):
+    return select(model.id).where(*criteria).exists()
+
+
+def like_deltas(before, after):
+    """Hàm deltas của ToggleBuffer cho like: True/False là đang like hay không"""
+    return {"likes_count": int(after) - int(before)} if before != after else {}
+
+
+class Toggles:
+    def __init__(self, user_model, post_model, like_model, dialect):
+        self.user_model = user_model
+        self.post_model = post_model
+        self.like_model = like_model
+        self.dialect = dialect
+
+    def _found(self, user_id, post_id):
+        User, Post = self.user_model, self.post_model
+        return exists_row(User, User.id == user_id), exists_row(Post, Post.id == post_id)
+
+    def insert(self, model, user_id, post_id, **values):
+        """rowcount = 0: user/post không tồn tại hoặc request đồng thời đã ghi trước"""
+        row = select(
+            literal(user_id), literal(post_id), literal(datetime.utcnow()), *[literal(value) for value in values.values()]
+        ).where(*self._found(user_id, post_id))
+        return insert_ignore(self.dialect, model.__table__).from_select(["user_id", "post_id", "created_at", *values], row)
+
+    async def conflict(self, db, user_id, post_id):
+        """INSERT không ghi được dòng nào: báo 404 nếu thiếu user/post, còn lại là bị request khác ghi trước"""
+        await db.rollback()
+        user_found, post_found = (await db.execute(select(*self._found(user_id, post_id)))).one()
+        if not user_found:
+            raise HTTPException(status_code=404, detail="User not found")
+        if not post_found:
+            raise HTTPException(status_code=404, detail="Post not found")
+        raise HTTPException(status_code=409, detail="Concurrent update, please retry")
+
+    async def write_likes(self, db, changes, deltas=None):
+        """Cộng chênh lệch likes_count vào deltas {post_id: {column: delta}} (hoặc dict mới) rồi trả lại"""
+        Like = self.like_model
+        removed = [key for key, (_, after) in changes.items() if not after]
+        added = [key for key, (_, after) in changes.items() if after]
+        deltas = {} if deltas is None else deltas
+        if removed:
+            for post_id in await db.scalars(delete(Like).where(user_post_in(Like, removed)).returning(Like.post_id).execution_options(synchronize_session=False)):
+                add_delta(deltas, post_id, "likes_count", -1)
+        if added:
+            rows = [{"user_id": user_id, "post_id": post_id, "created_at": datetime.utcnow()} for user_id, post_id in added]
+            for post_id in await db.scalars(insert_ignore(self.dialect, Like.__table__).returning(Like.__table__.c.post_id), rows):
+                add_delta(deltas, post_id, "likes_count", 1)
+        return deltas
+
+    async def buffer_like(self, buffer, db, user_id, post_id):
+        """Lần đầu gặp khoá kiểm tra user, post và trạng thái hiện tại bằng 1 câu"""
+        Like = self.like_model
+        key = (user_id, post_id)
+        liked = buffer.state(key)
+        if liked is MISSING:
+            user_found, post_found, liked = (await db.execute(select(
+                *self._found(user_id, post_id),
+                exists_row(Like, Like.user_id == user_id, Like.post_id == post_id),
+            ))).one()
+            if not user_found:
+                raise HTTPException(status_code=404, detail="User not found")
+            if not post_found:
+                raise HTTPException(status_code=404, detail="Post not found")
+        buffer.record(key, liked, not liked)
+        if liked:
+            return {"message": "Unlike successful", "liked": False}
+        return {"message": "Like successful", "liked": True}
@@ -0,0 +1,91 @@
+"""
+Trending engine: chấm điểm posts theo likes/comments/votes có suy giảm theo thời gian
+và giữ sẵn top-K theo từng forum, từng category và toàn site.
+
+Điểm = log2(points) + tuổi_post / half_life, nên cứ mỗi half_life trôi qua thì một post
+cần gấp đôi tương tác mới giữ được hạng. Vì phần thời gian chỉ phụ thuộc created_at,
+điểm không cần tính lại theo giờ: chỉ cập nhật khi có like/comment/vote.
+
+Mỗi worker giữ engine riêng trong bộ nhớ, nạp lại từ DB lúc khởi động và dựng lại định kỳ (rebuild)
+để tương tác do worker khác xử lý cũng được tính.
+"""
+
+import heapq
+import math
+import threading
+from datetime import datetime
+
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+VOTE_WEIGHT = 1.0
+
+EPOCH = datetime(2020, 1, 1)
+
+
+class TopK:
+    """Giữ tối đa k post điểm cao nhất của một bucket"""
+
+    def __init__(self, k):
+        self.k = k
+        self.scores = {}
+
+    def update(self, post_id, score):
+        self.scores[post_id] = score
+        if len(self.scores) > self.k:
+            del self.scores[min(self.scores, key=self.scores.get)]
+
+    def remove(self, post_id):
+        self.scores.pop(post_id, None)
+
+    def top(self, limit):
+        return heapq.nlargest(limit, self.scores, key=self.scores.get)
+
+
+class TrendingEngine:
+    def __init__(self, top_k=100, half_life_hours=12.0):
+        self.top_k = top_k
+        self.half_life_seconds = half_life_hours * 3600
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def score(self, created_at, likes=0, comments=0, votes=0):
+        points = LIKE_WEIGHT * likes + COMMENT_WEIGHT * comments + VOTE_WEIGHT * votes
+        magnitude = math.log2(max(abs(points), 1))
+        age_bonus = (created_at - EPOCH).total_seconds() / self.half_life_seconds
+        return math.copysign(magnitude, points) + age_bonus
+
+    def update(self, post_id, forum_id, category, created_at, likes=0, comments=0, votes=0):
+        """Tính lại điểm của 1 post và đưa vào các bucket forum/category/toàn site"""
+        score = self.score(created_at, likes, comments, votes)
+        with self.lock:
+            for key in (("all", None), ("forum", forum_id), ("category", category)):
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TopK(self.top_k)
+                bucket.update(post_id, score)
+
+    def rebuild(self, rows):
+        """Dựng lại toàn bộ bucket từ rows (post_id, forum_id, category, created_at, likes, comments, votes)
+        rồi thay một lần, request đọc trong lúc dựng vẫn thấy bảng xếp hạng cũ"""
+        fresh = TrendingEngine(self.top_k, self.half_life_seconds / 3600)
+        for row in rows:
+            fresh.update(*row)
+        with self.lock:
+            self.buckets = fresh.buckets
+
+    def remove(self, post_id):
+        with self.lock:
+            for bucket in self.buckets.values():
+                bucket.remove(post_id)
+
+    def top(self, limit, forum_id=None, category=None):
+        """Danh sách post_id theo thứ tự trending, tối đa top_k"""
+        if forum_id is not None:
+            key = ("forum", forum_id)
+        elif category is not None:
+            key = ("category", category)
+        else:
+            key = ("all", None)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            return bucket.top(limit) if bucket else []
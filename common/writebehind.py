@@ -0,0 +1,136 @@
+"""
+Write-behind cho các thao tác toggle (like, vote): gộp trong bộ nhớ, ghi xuống DB theo lô.
+
+Mỗi khoá (user_id, post_id) chỉ giữ trạng thái lúc đầu (đã có trong DB) và trạng thái mới nhất,
+nên like rồi unlike trước khi flush là triệt tiêu, không tốn câu SQL nào. Flush khi đủ
+`max_pending` khoá hoặc sau mỗi `interval` giây, gọi hàm `write(changes)` của app với
+{khoá: (trước, sau)} chỉ gồm các khoá thật sự đổi.
+
+Đọc: `state(key)` cho biết trạng thái mới nhất nếu khoá đang chờ ghi, `counters(post_id)` cho
+phần chênh lệch counters chưa ghi để cộng vào số đọc từ DB (read-your-writes trong cùng worker).
+Buffer nằm trong bộ nhớ từng worker: worker chết trước khi flush thì mất các thao tác đang chờ.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger("forum.writebehind")
+
+MISSING = object()
+
+
+class ToggleBuffer:
+    def __init__(self, write, deltas, interval=1.0, max_pending=1000):
+        """write: async (changes) -> None, ghi và commit trong transaction riêng.
+        deltas: (trước, sau) -> {cột counter: chênh lệch}"""
+        self.write = write
+        self.deltas = deltas
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}  # key -> [trước, sau]
+        self.in_flight = {}  # đang được ghi bởi flush hiện tại
+        self.pending_counters = {}
+        self.in_flight_counters = {}
+        self.lock = asyncio.Lock()
+        self.task = None
+        self.size_flush = None
+        self.flushes = 0
+        self.coalesced = 0
+
+    # ---- ghi nhận ----
+
+    def state(self, key):
+        """Trạng thái mới nhất của khoá nếu chưa ghi xuống DB, ngược lại MISSING"""
+        entry = self.pending.get(key) or self.in_flight.get(key)
+        return entry[1] if entry else MISSING
+
+    def record(self, key, before, after):
+        """before: trạng thái người gọi đọc được (từ state() hoặc DB), after: trạng thái mới"""
+        entry = self.pending.get(key)
+        if entry is None:
+            flying = self.in_flight.get(key)
+            # Khoá đang được flush: trạng thái gốc của lần ghi sau là kết quả của lần ghi này
+            origin = flying[1] if flying else before
+            entry = self.pending[key] = [origin, origin]
+        else:
+            self.coalesced += 1
+        self._count(self.pending_counters, key, entry[0], entry[1], -1)
+        entry[1] = after
+        self._count(self.pending_counters, key, entry[0], entry[1], 1)
+        if entry[0] == entry[1]:
+            del self.pending[key]  # thao tác triệt tiêu nhau
+        self._schedule(len(self.pending) >= self.max_pending)
+
+    def discard_post(self, post_id):
+        """Post bị xoá: bỏ các thao tác đang chờ trên post đó"""
+        for key in [key for key in self.pending if key[1] == post_id]:
+            del self.pending[key]
+        self.pending_counters.pop(post_id, None)
+
+    def counters(self, post_id):
+        merged = dict(self.in_flight_counters.get(post_id, ()))
+        for column, delta in self.pending_counters.get(post_id, {}).items():
+            merged[column] = merged.get(column, 0) + delta
+        return merged
+
+    def _count(self, counters, key, before, after, sign):
+        for column, delta in self.deltas(before, after).items():
+            post_counters = counters.setdefault(key[1], {})
+            post_counters[column] = post_counters.get(column, 0) + sign * delta
+
+    # ---- flush ----
+
+    def _schedule(self, now=False):
+        if now and (self.size_flush is None or self.size_flush.done()):
+            self.size_flush = asyncio.get_running_loop().create_task(self.flush())
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending:
+                return
+            self.in_flight, self.pending = self.pending, {}
+            self.in_flight_counters, self.pending_counters = self.pending_counters, {}
+            changes = {key: tuple(entry) for key, entry in self.in_flight.items()}
+            try:
+                await self.write(changes)
+                self.flushes += 1
+            except Exception:
+                logger.exception("write-behind flush failed, %d changes re-queued", len(changes))
+                self._requeue()
+            finally:
+                self.in_flight, self.in_flight_counters = {}, {}
+
+    def _requeue(self):
+        """Ghi lỗi: gộp lại với các thao tác mới đến trong lúc flush, thử lại lần sau"""
+        for key, (before, after) in self.in_flight.items():
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [before, after]
+            else:
+                entry[0] = before
+                if entry[0] == entry[1]:
+                    del self.pending[key]
+        self.pending_counters = {}
+        for key, (before, after) in self.pending.items():
+            self._count(self.pending_counters, key, before, after, 1)
+
+    async def close(self):
+        """Flush lần cuối khi tắt app"""
+        if self.task is not None:
+            self.task.cancel()
+        await self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "in_flight": len(self.in_flight),
+            "flushes": self.flushes,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,88 @@
+"""
+Fixture dùng chung cho test của 2 app: nạp main.py của từng app trên một database SQLite tạm
+và chạy lifespan như một worker thật (xem main.py, common/lifecycle.py)
+"""
+
+import importlib.util
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = {"Profile": os.path.join(ROOT, "Profile"), "Trang chu": os.path.join(ROOT, "Trang chu")}
+
+
+def load_main(name, db_path, monkeypatch, **env):
+    """Nạp main.py của app dưới một tên module riêng: 2 app cùng tên `main` chạy chung một process pytest"""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{db_path}")
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    spec = importlib.util.spec_from_file_location(f"main_{name.replace(' ', '_').lower()}", os.path.join(APPS[name], "main.py"))
+    main = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(main)
+    return main
+
+
+def seed(client, users=5, posts=30, profile=True):
+    """Dữ liệu nhỏ qua API: users, 1 forum, mỗi post có 1 like, 1 comment (và 1 upvote ở Profile)"""
+    for i in range(users):
+        client.post("/api/users", json={"username": f"user{i}", "email": f"user{i}@example.com"})
+    client.post("/api/forums", json={"name": "forum", "description": None, "category": "game"})
+    for i in range(posts):
+        client.post("/api/posts", json={"title": f"post {i}", "content": "content", "forum_id": 1, "image_url": None, "user_id": i % users + 1})
+        client.post("/api/likes", json={"post_id": i + 1, "user_id": 1})
+        client.post("/api/comments", json={"post_id": i + 1, "user_id": 2, "content": "comment"})
+        if profile:
+            client.post("/api/votes", json={"post_id": i + 1, "user_id": 3, "vote_type": "upvote"})
+
+
+def pages(client, url, **params):
+    """Đi hết các trang theo X-Next-Cursor, trả về id theo thứ tự"""
+    ids, cursor = [], None
+    while True:
+        response = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        ids += [row["id"] for row in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+@asynccontextmanager
+async def serving(main):
+    """AsyncClient gọi thẳng app trong lifespan: các request chạy đồng thời trên cùng event loop với engine async"""
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            yield client
+
+
+@pytest.fixture(params=list(APPS))
+def app(request, tmp_path, monkeypatch):
+    """(main, client) của từng app, client đã chạy lifespan"""
+    main = load_main(request.param, tmp_path / "forum.db", monkeypatch)
+    with TestClient(main.app) as client:
+        yield main, client
+
+
+@pytest.fixture
+def profile(tmp_path, monkeypatch):
+    """(main, client) của riêng Profile: route chỉ Profile có (follow, feed, activity, votes)"""
+    main = load_main("Profile", tmp_path / "forum.db", monkeypatch)
+    with TestClient(main.app) as client:
+        yield main, client
+
+
+@pytest.fixture
+def trang_chu(tmp_path, monkeypatch):
+    """(main, client) của riêng Trang chu: route chỉ Trang chu có (sửa/xoá post, xoá comment)"""
+    main = load_main("Trang chu", tmp_path / "forum.db", monkeypatch)
+    with TestClient(main.app) as client:
+        yield main, client
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
@@ -0,0 +1,86 @@
+"""
+Comment theo thread: trả lời phẳng dưới comment gốc (parent_id), reply_count, trả kèm vài trả lời đầu
+trong GET /api/posts/{id}/comments (replies_cursor), phần còn lại qua GET /api/comments/{id}/replies
+"""
+
+from conftest import pages, seed
+
+
+def comment(client, user_id, content, parent_id=None, post_id=1):
+    response = client.post("/api/comments", json={"post_id": post_id, "user_id": user_id, "content": content, "parent_id": parent_id})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def thread(client, post_id=1, **params):
+    response = client.get(f"/api/posts/{post_id}/comments", params=params)
+    assert response.status_code == 200, response.text
+    return {row["id"]: row for row in response.json()}
+
+
+def post_comments_count(main, post_id=1):
+    with main.SessionLocal() as db:
+        return db.get(main.Post, post_id).comments_count
+
+
+def make_thread(client):
+    """Post 1 (đã có 1 comment từ seed): comment gốc root với 5 trả lời (1 trả lời lồng), comment gốc other chưa có trả lời"""
+    root = comment(client, 3, "root")
+    replies = [comment(client, 4, "reply 0", root)]
+    replies.append(comment(client, 5, "reply to reply", replies[0]))
+    replies += [comment(client, 4, f"reply {i}", root) for i in range(2, 5)]
+    other = comment(client, 3, "other")
+    return root, replies, other
+
+
+def test_replies_are_ordered_and_paginated(app):
+    main, client = app
+    seed(client, posts=2, profile="votes" in main.Base.metadata.tables)
+    root, replies, other = make_thread(client)
+
+    threads = thread(client, replies=2)
+    # Chỉ comment gốc ở cấp ngoài, mới nhất trước; trả lời cũ nhất trước
+    assert list(threads) == [other, root, 1]
+    assert [reply["id"] for reply in threads[root]["replies"]] == replies[:2]
+    assert all(reply["parent_id"] == root for reply in threads[root]["replies"])
+    assert (threads[other]["replies"], threads[other]["replies_cursor"]) == ([], None)
+
+    rest = client.get(f"/api/comments/{root}/replies", params={"cursor": threads[root]["replies_cursor"], "limit": 10})
+    assert [reply["id"] for reply in rest.json()] == replies[2:]
+    assert pages(client, f"/api/comments/{root}/replies", limit=2) == replies
+    assert thread(client, replies=5)[root]["replies_cursor"] is None
+
+    # Comment cha phải thuộc cùng post
+    response = client.post("/api/comments", json={"post_id": 2, "user_id": 1, "content": "x", "parent_id": root})
+    assert response.status_code == 404
+
+
+def test_reply_count_follows_new_replies(app):
+    main, client = app
+    seed(client, posts=1, profile="votes" in main.Base.metadata.tables)
+    root, replies, other = make_thread(client)
+    threads = thread(client)
+    assert (threads[root]["reply_count"], threads[other]["reply_count"]) == (5, 0)
+    assert post_comments_count(main) == 1 + 2 + 5
+
+    comment(client, 2, "one more", replies[-1])
+    assert thread(client)[root]["reply_count"] == 6
+
+
+def test_deleting_comments_updates_reply_count(trang_chu):
+    main, client = trang_chu
+    seed(client, posts=1, profile=False)
+    root, replies, other = make_thread(client)
+
+    assert client.delete(f"/api/comments/{replies[1]}", params={"user_id": 5}).status_code == 200
+    assert thread(client)[root]["reply_count"] == 4
+    assert pages(client, f"/api/comments/{root}/replies", limit=2) == [replies[0], *replies[2:]]
+    assert post_comments_count(main) == 1 + 2 + 4
+
+    # Xoá comment gốc xoá cả thread
+    assert client.delete(f"/api/comments/{root}", params={"user_id": 3}).status_code == 200
+    assert list(thread(client)) == [other, 1]
+    assert pages(client, f"/api/comments/{root}/replies") == []
+    assert post_comments_count(main) == 1 + 1
+    with main.SessionLocal() as db:
+        assert db.query(main.Comment).count() == 2
@@ -0,0 +1,173 @@
+"""
+Counter likes_count/upvotes/downvotes/followers_count luôn khớp COUNT(*) của bảng likes/votes/followers khi nhiều request
+toggle cùng một key đồng thời, hay khi write-behind flush sau khi worker khác đã ghi cùng key
+(delta lấy từ dòng thực sự bị ghi, xem common/toggles.py)
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, func, insert, select, update
+
+from conftest import load_main, pages, seed, serving
+
+pytestmark = pytest.mark.anyio
+
+
+async def setup_post(client, users=4):
+    for i in range(users):
+        await client.post("/api/users", json={"username": f"user{i}", "email": f"user{i}@example.com"})
+    await client.post("/api/forums", json={"name": "forum", "description": None, "category": "game"})
+    response = await client.post("/api/posts", json={"title": "post", "content": "content", "forum_id": 1, "image_url": None, "user_id": 1})
+    return response.json()["id"]
+
+
+async def stored_counters(main, post_id):
+    """(counter lưu trên posts, COUNT(*) thực tế) cho từng cột counter"""
+    async with main.AsyncSessionLocal() as db:
+        post = await db.get(main.Post, post_id)
+        counters = {"likes_count": (post.likes_count, await db.scalar(select(func.count()).where(main.Like.post_id == post_id)))}
+        if "votes" in main.Base.metadata.tables:
+            for vote_type in ("upvote", "downvote"):
+                actual = await db.scalar(select(func.count()).where(main.Vote.post_id == post_id, main.Vote.vote_type == vote_type))
+                counters[vote_type + "s"] = (getattr(post, vote_type + "s"), actual)
+    return counters
+
+
+def assert_consistent(counters):
+    for column, (stored, actual) in counters.items():
+        assert stored == actual, (column, stored, actual)
+
+
+@pytest.mark.parametrize("name", ["Profile", "Trang chu"])
+async def test_concurrent_single_toggles_keep_counters(name, tmp_path, monkeypatch):
+    main = load_main(name, tmp_path / "forum.db", monkeypatch)
+    async with serving(main) as client:
+        post_id = await setup_post(client)
+        requests = [client.post("/api/likes", json={"post_id": post_id, "user_id": 1}) for _ in range(6)]
+        if name == "Profile":
+            requests += [client.post("/api/votes", json={"post_id": post_id, "user_id": 2, "vote_type": vote_type})
+                         for vote_type in ("upvote", "downvote") * 3]
+        for response in await asyncio.gather(*requests):
+            assert response.status_code == 200, response.text
+        assert_consistent(await stored_counters(main, post_id))
+
+
+async def test_concurrent_batches_keep_counters(tmp_path, monkeypatch):
+    main = load_main("Profile", tmp_path / "forum.db", monkeypatch)
+    async with serving(main) as client:
+        post_id = await setup_post(client)
+        batches = [
+            [{"type": "like", "user_id": user_id, "post_id": post_id},
+             {"type": "vote", "user_id": user_id, "post_id": post_id, "vote_type": vote_type}]
+            for user_id in (1, 2) for vote_type in ("upvote", "downvote", "upvote", "downvote")
+        ]
+        for _ in range(3):
+            responses = await asyncio.gather(*(client.post("/api/batch", json={"operations": ops}) for ops in batches))
+            for response in responses:
+                assert response.status_code == 200, response.text
+            assert_consistent(await stored_counters(main, post_id))
+
+
+async def other_worker_toggle(main, user_id, post_id, liked):
+    """Worker khác ghi cùng like trực tiếp vào DB (kèm counter) trong lúc buffer của worker này chưa flush"""
+    async with main.AsyncSessionLocal() as db:
+        if liked:
+            await db.execute(insert(main.Like).values(user_id=user_id, post_id=post_id, created_at=datetime.utcnow()))
+        else:
+            await db.execute(delete(main.Like).where(main.Like.user_id == user_id, main.Like.post_id == post_id))
+        await db.execute(update(main.Post).where(main.Post.id == post_id).values(likes_count=main.Post.likes_count + (1 if liked else -1)))
+        await db.commit()
+
+
+@pytest.mark.filterwarnings("error:Empty parameter sequence")
+@pytest.mark.parametrize("name", ["Profile", "Trang chu"])
+async def test_write_behind_flush_counts_rows_written(name, tmp_path, monkeypatch):
+    main = load_main(name, tmp_path / "forum.db", monkeypatch, WRITE_BEHIND="1", WRITE_BEHIND_INTERVAL="3600")
+    async with serving(main) as client:
+        liked = await setup_post(client)
+        response = await client.post("/api/posts", json={"title": "post", "content": "content", "forum_id": 1, "image_url": None, "user_id": 1})
+        unliked = response.json()["id"]
+        await other_worker_toggle(main, 1, unliked, True)
+        # Buffer thấy chưa like / đang like; trước khi flush, worker khác đã like / bỏ like đúng các cặp đó
+        for post_id in (liked, unliked):
+            response = await client.post("/api/likes", json={"post_id": post_id, "user_id": 1})
+            assert response.status_code == 200, response.text
+        await other_worker_toggle(main, 1, liked, True)
+        await other_worker_toggle(main, 1, unliked, False)
+        await main.like_buffer.flush()
+        # Cả 2 khoá đã bị worker khác ghi trước: flush không đổi dòng nào nhưng vẫn phải thành công
+        assert not main.like_buffer.pending
+        for post_id in (liked, unliked):
+            assert_consistent(await stored_counters(main, post_id))
+
+
+def test_batch_comment_ids_match_operations(profile):
+    main, client = profile
+    seed(client, posts=3)
+    ops = [{"type": "comment", "user_id": i % 4 + 1, "post_id": i % 3 + 1, "content": f"comment {i}"} for i in range(12)]
+    ops.insert(5, {"type": "like", "user_id": 2, "post_id": 2})
+    ops.append(dict(ops[0]))
+    response = client.post("/api/batch", json={"operations": ops})
+    assert response.status_code == 200, response.text
+    with main.SessionLocal() as db:
+        for op, result in zip(ops, response.json()):
+            if op["type"] == "comment":
+                comment = db.get(main.Comment, result["comment_id"])
+                assert (comment.content, comment.post_id, comment.author_id) == (op["content"], op["post_id"], op["user_id"])
+
+
+def followers_counts(main):
+    """{user_id: (followers_count đã lưu, COUNT(*) thực tế trong followers)}"""
+    with main.SessionLocal() as db:
+        actual = dict(db.execute(
+            select(main.followers_table.c.following_id, func.count()).group_by(main.followers_table.c.following_id)
+        ).all())
+        return {user.id: (user.followers_count, actual.get(user.id, 0)) for user in db.scalars(select(main.User))}
+
+
+def test_follow_unfollow_idempotent_and_counted(profile):
+    main, client = profile
+    seed(client, posts=1)
+    follow = {"follower_id": 1, "following_id": 2}
+    assert client.post("/api/follow", json=follow).status_code == 200
+    assert client.post("/api/follow", json=follow).status_code == 400
+    assert followers_counts(main)[2] == (1, 1)
+
+    assert client.post("/api/follow", json={"follower_id": 3, "following_id": 3}).status_code == 400
+    assert client.post("/api/follow", json={"follower_id": 1, "following_id": 999}).status_code == 404
+
+    assert client.post("/api/unfollow", json=follow).status_code == 200
+    assert client.post("/api/unfollow", json=follow).status_code == 400
+    assert all(stored == actual for stored, actual in followers_counts(main).values())
+    assert followers_counts(main)[2] == (0, 0)
+
+
+async def test_concurrent_follows_keep_followers_count(tmp_path, monkeypatch):
+    main = load_main("Profile", tmp_path / "forum.db", monkeypatch)
+    async with serving(main) as client:
+        for i in range(5):
+            await client.post("/api/users", json={"username": f"user{i}", "email": f"user{i}@example.com"})
+        requests = [
+            client.post(f"/api/{action}", json={"follower_id": follower_id, "following_id": 1})
+            for follower_id in (2, 3, 4, 5) for action in ("follow", "follow", "unfollow", "follow")
+        ]
+        for response in await asyncio.gather(*requests):
+            assert response.status_code in (200, 400), response.text
+    for stored, actual in followers_counts(main).values():
+        assert stored == actual
+
+
+def test_followers_and_following_pages(profile):
+    main, client = profile
+    seed(client, users=8, posts=1)
+    for follower_id in range(2, 9):
+        assert client.post("/api/follow", json={"follower_id": follower_id, "following_id": 1}).status_code == 200
+    for following_id in (3, 5, 7, 8):
+        assert client.post("/api/follow", json={"follower_id": 2, "following_id": following_id}).status_code == 200
+
+    # Mới follow trước
+    assert pages(client, "/api/users/1/followers", limit=3) == list(range(8, 1, -1))
+    assert pages(client, "/api/users/2/following", limit=3) == [8, 7, 5, 3, 1]
+    assert client.get("/api/users/1/followers", params={"cursor": "garbage"}).status_code == 400
@@ -0,0 +1,48 @@
+"""
+GET có điều kiện (common/etag.py): If-None-Match khớp thì 304, like/vote/comment đổi version nên ETag đổi
+"""
+
+from conftest import seed
+
+
+def get_etag(client, url, etag=None):
+    response = client.get(url, headers={"If-None-Match": etag} if etag else {})
+    return response.status_code, response.headers.get("ETag"), response.content
+
+
+def post_version(main, post_id):
+    with main.SessionLocal() as db:
+        return db.get(main.Post, post_id).version
+
+
+def test_repeated_get_with_etag_returns_304(app):
+    main, client = app
+    seed(client, posts=3, profile="votes" in main.Base.metadata.tables)
+    for url in ("/api/posts", "/api/forums", "/api/users/1"):
+        status, etag, _ = get_etag(client, url)
+        assert status == 200 and etag, url
+        status, same, body = get_etag(client, url, etag)
+        assert (status, same, body) == (304, etag, b""), url
+        # So sánh weak: client gửi lại không có W/ vẫn khớp
+        assert get_etag(client, url, etag.removeprefix("W/"))[0] == 304
+
+
+def test_like_vote_comment_change_etag(app):
+    main, client = app
+    is_profile = "votes" in main.Base.metadata.tables
+    seed(client, posts=3, profile=is_profile)
+    writes = [
+        ("/api/likes", {"post_id": 2, "user_id": 4}),
+        ("/api/comments", {"post_id": 2, "user_id": 4, "content": "new"}),
+    ]
+    if is_profile:
+        writes.append(("/api/votes", {"post_id": 2, "user_id": 4, "vote_type": "downvote"}))
+
+    for url, payload in writes:
+        version = post_version(main, 2)
+        _, etag, _ = get_etag(client, "/api/posts")
+        assert client.post(url, json=payload).status_code == 200, url
+        assert post_version(main, 2) == version + 1, url
+        status, new_etag, _ = get_etag(client, "/api/posts", etag)
+        assert status == 200 and new_etag != etag, url
+        assert get_etag(client, "/api/posts", new_etag)[0] == 304
@@ -0,0 +1,72 @@
+"""
+Home feed (Profile): fan-out lúc ghi cho tác giả thường, gộp lúc đọc cho tác giả vượt FEED_FANOUT_THRESHOLD
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from conftest import load_main, pages
+
+THRESHOLD = 2
+READER, AUTHOR, CELEBRITY = 5, 1, 2
+
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    """user 5 follow tác giả thường 1 (1 follower) và celebrity 2 (follower 3, 4, 5: vượt ngưỡng 2);
+    10 post xen kẽ của 2 tác giả, đăng sau khi follow"""
+    main = load_main("Profile", tmp_path / "forum.db", monkeypatch, FEED_FANOUT_THRESHOLD=str(THRESHOLD))
+    with TestClient(main.app) as client:
+        for i in range(6):
+            client.post("/api/users", json={"username": f"user{i}", "email": f"user{i}@example.com"})
+        client.post("/api/forums", json={"name": "forum", "description": None, "category": "game"})
+        for follower_id, following_id in ((READER, AUTHOR), (3, CELEBRITY), (4, CELEBRITY), (READER, CELEBRITY)):
+            assert client.post("/api/follow", json={"follower_id": follower_id, "following_id": following_id}).status_code == 200
+        post_ids = {AUTHOR: [], CELEBRITY: []}
+        for i in range(10):
+            author = (AUTHOR, CELEBRITY)[i % 2]
+            response = client.post("/api/posts", json={"title": f"post {i}", "content": "content", "forum_id": 1, "image_url": None, "user_id": author})
+            post_ids[author].append(response.json()["id"])
+        yield main, client, post_ids
+
+
+def timeline(main, owner_id):
+    with main.SessionLocal() as db:
+        return set(db.scalars(select(main.TimelineEntry.post_id).where(main.TimelineEntry.owner_id == owner_id)))
+
+
+def newest_first(*id_lists):
+    return sorted((post_id for ids in id_lists for post_id in ids), reverse=True)
+
+
+def test_normal_author_is_fanned_out(feed):
+    main, client, post_ids = feed
+    assert timeline(main, READER) == set(post_ids[AUTHOR])
+
+
+def test_celebrity_posts_are_merged_at_read(feed):
+    main, client, post_ids = feed
+    assert not timeline(main, READER) & set(post_ids[CELEBRITY])
+    response = client.get(f"/api/users/{READER}/feed")
+    assert [post["id"] for post in response.json()] == newest_first(post_ids[AUTHOR], post_ids[CELEBRITY])
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4])
+def test_cursor_continues_across_merge(feed, limit):
+    main, client, post_ids = feed
+    assert pages(client, f"/api/users/{READER}/feed", limit=limit) == newest_first(post_ids[AUTHOR], post_ids[CELEBRITY])
+
+
+def test_former_celebrity_posts_reach_timelines(feed):
+    main, client, post_ids = feed
+    # Celebrity còn 2 follower (= ngưỡng): feed thôi gộp lúc đọc, post cũ phải được chép vào timeline
+    assert client.post("/api/unfollow", json={"follower_id": 3, "following_id": CELEBRITY}).status_code == 200
+    assert timeline(main, READER) == set(post_ids[AUTHOR]) | set(post_ids[CELEBRITY])
+    assert timeline(main, 4) == set(post_ids[CELEBRITY])
+    assert timeline(main, 3) == set()
+    assert pages(client, f"/api/users/{READER}/feed", limit=3) == newest_first(post_ids[AUTHOR], post_ids[CELEBRITY])
+
+    # Từ giờ post mới được fan-out như tác giả thường
+    response = client.post("/api/posts", json={"title": "after", "content": "content", "forum_id": 1, "image_url": None, "user_id": CELEBRITY})
+    assert response.json()["id"] in timeline(main, READER)
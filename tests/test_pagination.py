@@ -0,0 +1,32 @@
+"""
+Keyset pagination (common/pagination.py) trên các route danh sách
+"""
+
+from conftest import pages, seed
+
+
+def test_activity_lists_each_commented_post_once(profile):
+    main, client = profile
+    seed(client, posts=4)
+    # user 4 comment nhiều lần trên post 1, rồi post 3, rồi lại post 1
+    for post_id in (1, 1, 1, 3, 2, 1):
+        client.post("/api/comments", json={"post_id": post_id, "user_id": 4, "content": "again"})
+
+    response = client.get("/api/users/4/activity")
+    assert [post["id"] for post in response.json()] == [1, 2, 3]
+    assert pages(client, "/api/users/4/activity", limit=1) == [1, 2, 3]
+
+
+def test_page_size_is_bounded(app):
+    main, client = app
+    is_profile = "votes" in main.Base.metadata.tables
+    seed(client, posts=3, profile=is_profile)
+    urls = ["/api/posts", "/api/posts/1/comments", "/api/comments/1/replies", "/api/users", "/api/search", "/api/trending/posts"]
+    if is_profile:
+        urls += ["/api/users/1/posts", "/api/users/2/activity", "/api/users/1/followers", "/api/users/1/following", "/api/users/1/feed"]
+    for url in urls:
+        params = {"q": "post"} if url == "/api/search" else {}
+        for limit in (0, -1, main.MAX_PAGE_SIZE + 1):
+            response = client.get(url, params={**params, "limit": limit})
+            assert response.status_code == 422, (url, limit, response.text)
+        assert client.get(url, params={**params, "limit": main.MAX_PAGE_SIZE}).status_code == 200
@@ -0,0 +1,74 @@
+"""
+Cache profile (Profile, common/cache.py): GET /api/users/{id} đọc từ cache không tốn SQL,
+mọi thao tác đổi profile xoá cache nên không trả profile hay ETag cũ
+"""
+
+from sqlalchemy import event
+
+from conftest import seed
+
+
+def get_profile(main, client, user_id, etag=None):
+    """(status, body, ETag, số câu SQL)"""
+    statements = []
+
+    def record(*args):
+        statements.append(args[2])
+
+    event.listen(main.engines.async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = client.get(f"/api/users/{user_id}", headers={"If-None-Match": etag} if etag else {})
+    finally:
+        event.remove(main.engines.async_engine.sync_engine, "before_cursor_execute", record)
+    return response.status_code, response.json() if response.status_code == 200 else None, response.headers.get("ETag"), len(statements)
+
+
+def cached(main, client, *user_ids):
+    """Nạp cache rồi kiểm tra lần đọc sau không chạm DB; trả {user_id: (profile, ETag)}"""
+    profiles = {}
+    for user_id in user_ids:
+        get_profile(main, client, user_id)
+        status, profile, etag, queries = get_profile(main, client, user_id)
+        assert (status, queries) == (200, 0)
+        profiles[user_id] = profile, etag
+    return profiles
+
+
+def assert_fresh(main, client, user_id, before, **changed):
+    old_profile, old_etag = before
+    status, profile, etag, _ = get_profile(main, client, user_id, old_etag)
+    assert status == 200 and etag != old_etag
+    assert profile == {**old_profile, **changed}
+
+
+def test_update_user_invalidates_profile(profile):
+    main, client = profile
+    seed(client, posts=2)
+    before = cached(main, client, 1)[1]
+    assert client.put("/api/users/1", json={"bio": "new bio"}).status_code == 200
+    assert_fresh(main, client, 1, before, bio="new bio")
+
+
+def test_follow_and_unfollow_invalidate_both_profiles(profile):
+    main, client = profile
+    seed(client, posts=2)
+    before = cached(main, client, 1, 2)
+    assert client.post("/api/follow", json={"follower_id": 1, "following_id": 2}).status_code == 200
+    assert_fresh(main, client, 1, before[1], following_count=before[1][0]["following_count"] + 1)
+    assert_fresh(main, client, 2, before[2], followers_count=before[2][0]["followers_count"] + 1)
+
+    before = cached(main, client, 1, 2)
+    assert client.post("/api/unfollow", json={"follower_id": 1, "following_id": 2}).status_code == 200
+    assert_fresh(main, client, 1, before[1], following_count=before[1][0]["following_count"] - 1)
+    assert_fresh(main, client, 2, before[2], followers_count=before[2][0]["followers_count"] - 1)
+
+
+def test_new_post_invalidates_author_profile(profile):
+    main, client = profile
+    seed(client, posts=2)
+    before = cached(main, client, 1, 2)
+    client.post("/api/posts", json={"title": "new", "content": "content", "forum_id": 1, "image_url": None, "user_id": 1})
+    assert_fresh(main, client, 1, before[1], posts_count=before[1][0]["posts_count"] + 1)
+    # Profile của người khác vẫn nằm trong cache
+    status, _, _, queries = get_profile(main, client, 2, before[2][1])
+    assert (status, queries) == (304, 0)
@@ -0,0 +1,34 @@
+"""
+Số câu SQL của GET /api/posts không tăng theo kích thước trang (không N+1)
+"""
+
+from sqlalchemy import event
+
+from conftest import seed
+
+
+def count_queries(main, client, url, **params):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(main.engines.async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url, params=params)
+    finally:
+        event.remove(main.engines.async_engine.sync_engine, "before_cursor_execute", record)
+    assert response.status_code == 200, response.text
+    return len(statements), response.json()
+
+
+def test_post_page_query_count_independent_of_limit(app):
+    main, client = app
+    seed(client, posts=60, profile="votes" in main.Base.metadata.tables)
+    client.get("/api/posts", params={"limit": 1})
+
+    small, posts = count_queries(main, client, "/api/posts", limit=1)
+    assert len(posts) == 1
+    large, posts = count_queries(main, client, "/api/posts", limit=50)
+    assert len(posts) == 50
+    assert small == large
@@ -0,0 +1,79 @@
+"""
+Tìm kiếm full-text (common/search.py): không phân biệt dấu, khớp tiền tố, lọc forum/category,
+index đổi theo khi sửa/xoá post và comment
+"""
+
+
+def search(client, q, **params):
+    response = client.get("/api/search", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return [(hit["type"], hit["id"]) for hit in response.json()]
+
+
+def make_forums(client):
+    """user 1, 2; forum 1 (the_thao): 2 post bóng đá, forum 2 (game): 1 post; comment của user 2 trên post 1"""
+    for i in range(2):
+        client.post("/api/users", json={"username": f"user{i}", "email": f"user{i}@example.com"})
+    client.post("/api/forums", json={"name": "Thể thao", "description": None, "category": "the_thao"})
+    client.post("/api/forums", json={"name": "Game", "description": None, "category": "game"})
+    for title, content, forum_id in (
+        ("Bóng đá cuối tuần", "Trận đấu hay nhất mùa", 1),
+        ("Lịch tập", "Đội tuyển bóng chuyền", 1),
+        ("Bóng đá trong game", "Chơi FIFA với bạn bè", 2),
+    ):
+        client.post("/api/posts", json={"title": title, "content": content, "forum_id": forum_id, "image_url": None, "user_id": 1})
+    response = client.post("/api/comments", json={"post_id": 1, "user_id": 2, "content": "Đồng ý, trận đấu tuyệt vời"})
+    return response.json()["id"]
+
+
+def test_unaccented_query_matches_accented_text(app):
+    main, client = app
+    comment_id = make_forums(client)
+    assert set(search(client, "bong da")) == {("post", 1), ("post", 3)}
+    assert set(search(client, "BÓNG ĐÁ")) == {("post", 1), ("post", 3)}
+    assert search(client, "tuyet voi") == [("comment", comment_id)]
+    assert search(client, "tran dau", kind="comment") == [("comment", comment_id)]
+
+
+def test_last_word_matches_as_prefix(app):
+    main, client = app
+    make_forums(client)
+    assert set(search(client, "bong")) == {("post", 1), ("post", 2), ("post", 3)}
+    assert set(search(client, "bong chu")) == {("post", 2)}
+    # Chỉ từ cuối là tiền tố
+    assert search(client, "bon chuyen") == []
+
+
+def test_forum_and_category_filters(app):
+    main, client = app
+    make_forums(client)
+    assert set(search(client, "bong da", forum_id=1)) == {("post", 1)}
+    assert set(search(client, "bong da", forum_id=2)) == {("post", 3)}
+    assert set(search(client, "bong da", category="game")) == {("post", 3)}
+    assert set(search(client, "bong", category="the_thao", kind="post")) == {("post", 1), ("post", 2)}
+
+
+def test_deleted_post_and_comment_leave_index(trang_chu):
+    main, client = trang_chu
+    comment_id = make_forums(client)
+    other = client.post("/api/comments", json={"post_id": 3, "user_id": 2, "content": "Trận đấu FIFA"}).json()["id"]
+
+    assert client.delete(f"/api/comments/{other}", params={"user_id": 2}).status_code == 200
+    assert search(client, "tran dau", kind="comment") == [("comment", comment_id)]
+
+    assert client.delete("/api/posts/1", params={"user_id": 1}).status_code == 200
+    assert search(client, "bong da") == [("post", 3)]
+    assert search(client, "tuyet voi") == []
+
+
+def test_edited_post_is_reindexed(trang_chu):
+    main, client = trang_chu
+    make_forums(client)
+    assert client.put("/api/posts/2", params={"user_id": 2}, json={"title": "x"}).status_code == 403
+
+    response = client.put("/api/posts/2", params={"user_id": 1}, json={"title": "Cầu lông", "content": "Giải vô địch"})
+    assert response.status_code == 200, response.text
+    assert (response.json()["title"], response.json()["content"]) == ("Cầu lông", "Giải vô địch")
+    assert search(client, "cau long") == [("post", 2)]
+    assert search(client, "vo dich") == [("post", 2)]
+    assert set(search(client, "bong")) == {("post", 1), ("post", 3)}
@@ -0,0 +1,42 @@
+"""
+Trending của mỗi worker dựng lại từ DB mỗi TRENDING_REFRESH_SECONDS, nên thấy cả tương tác do worker khác ghi
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+from conftest import APPS, load_main, serving
+
+pytestmark = pytest.mark.anyio
+
+
+async def trending_ids(client):
+    response = await client.get("/api/trending/posts")
+    assert response.status_code == 200, response.text
+    return [post["id"] for post in response.json()]
+
+
+@pytest.mark.parametrize("name", list(APPS))
+async def test_trending_picks_up_other_workers_writes(name, tmp_path, monkeypatch):
+    main = load_main(name, tmp_path / "forum.db", monkeypatch, TRENDING_REFRESH_SECONDS="0.1")
+    async with serving(main) as client:
+        await client.post("/api/users", json={"username": "user", "email": "user@example.com"})
+        await client.post("/api/forums", json={"name": "forum", "description": None, "category": "game"})
+        post_ids = []
+        for i in range(2):
+            response = await client.post("/api/posts", json={"title": f"post {i}", "content": "content", "forum_id": 1, "image_url": None, "user_id": 1})
+            post_ids.append(response.json()["id"])
+        await asyncio.sleep(0.3)
+        assert await trending_ids(client) == post_ids[::-1]
+
+        # Worker khác ghi comments cho post cũ hơn, worker này không nhận request nào của post đó
+        async with main.AsyncSessionLocal() as db:
+            await db.execute(update(main.Post).where(main.Post.id == post_ids[0]).values(comments_count=50))
+            await db.commit()
+        for _ in range(20):
+            await asyncio.sleep(0.1)
+            if await trending_ids(client) == post_ids:
+                break
+        assert await trending_ids(client) == post_ids